@@ -0,0 +1,366 @@
+"""Performance benchmarks for env throughput and policy latency across every config in config/.
+
+    python benchmarks/run_benchmarks.py run --output benchmarks/results/latest.json
+    python benchmarks/run_benchmarks.py compare --baseline baseline.json --current benchmarks/results/latest.json
+
+``run --baseline`` does both in one go. Comparisons exit with code 1 when a metric regresses
+by more than ``--tolerance``.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import warnings
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from src.utils.file_handler import load_config, model_dir
+
+# Metric name suffix -> whether a larger value is better.
+HIGHER_IS_BETTER = {
+    "steps_per_sec": True,
+    "_ms": False,
+    "idle_share": False,
+}
+
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": 1000 * statistics.fmean(ordered),
+        "p50_ms": 1000 * ordered[len(ordered) // 2],
+        "p95_ms": 1000 * ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+    }
+
+
+def _time_calls(fn: Callable[[], Any], repeats: int) -> List[float]:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_env(config: Dict[str, Any]):
+    import gymnasium as gym
+    import highway_env  # noqa: F401
+    from src.wrappers.highway_wrapper import HighwayConfigWrapper
+
+    return HighwayConfigWrapper(gym.make(config['env_id']), config['env_params'])
+
+
+def bench_single_env(config: Dict[str, Any], n_steps: int, n_resets: int) -> Dict[str, Any]:
+    env = make_env(config)
+    env.reset(seed=0)
+    reset_samples = _time_calls(env.reset, n_resets)
+
+    env.reset(seed=1)
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        _, _, terminated, truncated, _ = env.step(env.action_space.sample())
+        if terminated or truncated:
+            env.reset()
+    elapsed = time.perf_counter() - start
+    env.close()
+
+    return {
+        "observation_type": config['env_params']['observation']['type'],
+        # Includes the resets of episodes that end inside the window, like training does.
+        "steps_per_sec": n_steps / elapsed,
+        "reset": _percentiles(reset_samples),
+    }
+
+
+def bench_vec_scaling(config: Dict[str, Any], n_envs_list: List[int], backends: List[str], n_steps: int) -> Dict[str, Any]:
+    from src.utils.vec_env_factory import VecEnvSettings, build_vec_env, measure_env_throughput
+
+    results: Dict[str, Any] = {}
+    for backend in backends:
+        for n_envs in n_envs_list:
+            vec_env = build_vec_env(config, VecEnvSettings(n_envs=n_envs, backend=backend, worker_threads=1))
+            try:
+                results[f"{backend}_x{n_envs}"] = {"steps_per_sec": measure_env_throughput(vec_env, n_steps)}
+            finally:
+                vec_env.close()
+    return results
+
+
+def bench_async_stepping(config: Dict[str, Any], n_envs: int, n_steps: int) -> Dict[str, Any]:
+    """Random-action throughput and worker idle share of lockstep vs. partial-batch stepping."""
+    from src.utils.vec_env_factory import VecEnvSettings, build_vec_env
+
+    vec_env = build_vec_env(config, VecEnvSettings(n_envs=n_envs, backend="async", worker_threads=1))
+    sample = lambda n: [vec_env.action_space.sample() for _ in range(n)]
+    results: Dict[str, Any] = {}
+    try:
+        vec_env.reset()
+        vec_env.reset_worker_stats()
+        start = time.perf_counter()
+        for _ in range(n_steps):
+            vec_env.step(sample(n_envs))
+        results["sync"] = {
+            "steps_per_sec": n_envs * n_steps / (time.perf_counter() - start),
+            "worker_idle_share": vec_env.worker_idle_share(),
+        }
+
+        vec_env.reset()
+        vec_env.reset_worker_stats()
+        start = time.perf_counter()
+        vec_env.send(sample(n_envs), list(range(n_envs)))
+        collected = 0
+        while collected < n_envs * n_steps:
+            indices, *_ = vec_env.poll()
+            collected += len(indices)
+            vec_env.send(sample(len(indices)), indices)
+        results["async"] = {
+            "steps_per_sec": collected / (time.perf_counter() - start),
+            "worker_idle_share": vec_env.worker_idle_share(),
+        }
+    finally:
+        vec_env.close()
+    return results
+
+
+def bench_her_sampling(config: Dict[str, Any], n_envs: int, n_steps: int, repeats: int) -> Dict[str, Any]:
+    """``sample()`` latency of the stock and the vectorized HER buffer on the same transitions."""
+    from stable_baselines3 import HerReplayBuffer
+    from src.utils.replay_buffers import VectorizedHerReplayBuffer
+    from src.utils.vec_env_factory import VecEnvSettings, build_vec_env
+
+    model_params = config['agent_params'].get('model_params', {})
+    buffer_kwargs = model_params.get('replay_buffer_kwargs', {})
+    batch_size = model_params.get('batch_size', 256)
+    vec_env = build_vec_env(config, VecEnvSettings(n_envs=n_envs, backend="subproc", worker_threads=1), seed=0)
+    results: Dict[str, Any] = {}
+    try:
+        buffers = {
+            name: cls(model_params.get('buffer_size', 1_000_000), vec_env.observation_space, vec_env.action_space,
+                      env=vec_env, device="cpu", n_envs=n_envs, **buffer_kwargs)
+            for name, cls in (("stock", HerReplayBuffer), ("vectorized", VectorizedHerReplayBuffer))
+        }
+        obs = vec_env.reset()
+        for _ in range(n_steps):
+            actions = np.stack([vec_env.action_space.sample() for _ in range(n_envs)])
+            new_obs, rewards, dones, infos = vec_env.step(actions)
+            for buffer in buffers.values():
+                buffer.add(obs, new_obs, actions, rewards, dones, infos)
+            obs = new_obs
+        for name, buffer in buffers.items():
+            # Close the running episodes so every transition can be sampled.
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                buffer.truncate_last_trajectory()
+            buffer.sample(batch_size)  # warm-up
+            results[name] = _percentiles(_time_calls(lambda: buffer.sample(batch_size), repeats))
+    finally:
+        vec_env.close()
+    return results
+
+
+def _observation_batch(obs, batch_size: int):
+    if isinstance(obs, dict):
+        return {key: np.repeat(value[None], batch_size, axis=0) for key, value in obs.items()}
+    return np.repeat(np.asarray(obs)[None], batch_size, axis=0)
+
+
+def bench_predict(config: Dict[str, Any], model_paths: List[str], batch_sizes: List[int], repeats: int) -> Dict[str, Any]:
+    from src.agents.sb3_manager import SB3AgentManager
+
+    env = make_env(config)
+    obs, _ = env.reset(seed=0)
+    agent_manager = SB3AgentManager(config=config, env=env, mode='benchmark')
+
+    results: Dict[str, Any] = {}
+    for model_path in model_paths:
+        agent_manager.load(model_path)
+        model = agent_manager.model
+        name = os.path.basename(model_path)[:-len(".zip")]
+        per_batch: Dict[str, Any] = {}
+        for batch_size in batch_sizes:
+            batch = _observation_batch(obs, batch_size)
+            model.predict(batch, deterministic=True)  # warm-up
+            per_batch[f"bs{batch_size}"] = _percentiles(
+                _time_calls(lambda: model.predict(batch, deterministic=True), repeats)
+            )
+        results[name] = per_batch
+    env.close()
+    return results
+
+
+def environment_metadata() -> Dict[str, Any]:
+    import gymnasium
+    import highway_env
+    import stable_baselines3
+    import torch
+
+    return {
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "gymnasium": gymnasium.__version__,
+        "highway_env": getattr(highway_env, "__version__", "unknown"),
+        "stable_baselines3": stable_baselines3.__version__,
+        "torch": torch.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    config_names = args.configs or sorted(os.path.splitext(os.path.basename(p))[0] for p in glob.glob("config/*.yaml"))
+    report: Dict[str, Any] = {"meta": environment_metadata(), "configs": {}}
+
+    for name in config_names:
+        config = load_config(f"config/{name}.yaml")
+        env_id = config['env_id']
+        print(f"==> {name} ({env_id})")
+        entry: Dict[str, Any] = {"env_id": env_id}
+
+        entry["single_env"] = bench_single_env(config, n_steps=args.steps, n_resets=args.resets)
+        print(f"   single env: {entry['single_env']['steps_per_sec']:.1f} steps/s, "
+              f"reset p50 {entry['single_env']['reset']['p50_ms']:.1f} ms")
+
+        if not args.skip_vec:
+            entry["vec_env"] = bench_vec_scaling(config, args.n_envs, args.backends, n_steps=args.vec_steps)
+            for key, value in entry["vec_env"].items():
+                print(f"   {key:<14} {value['steps_per_sec']:9.1f} env-steps/s")
+            entry["async_stepping"] = bench_async_stepping(config, max(args.n_envs), n_steps=args.vec_steps)
+            for mode, value in entry["async_stepping"].items():
+                print(f"   {mode:<5} x{max(args.n_envs):<7} {value['steps_per_sec']:9.1f} env-steps/s, "
+                      f"workers idle {value['worker_idle_share']:.0%}")
+
+        buffer_class = config['agent_params'].get('model_params', {}).get('replay_buffer_class', "")
+        if "Her" in buffer_class and not args.skip_her:
+            entry["her_sampling"] = bench_her_sampling(config, max(args.n_envs), n_steps=args.vec_steps, repeats=args.repeats)
+            print("   HER sample p50 ms -> " + ", ".join(f"{name}: {r['p50_ms']:.2f}" for name, r in entry["her_sampling"].items()))
+
+        model_paths = sorted(glob.glob(os.path.join(model_dir(config), "*_model.zip")))
+        if model_paths and not args.skip_predict:
+            entry["predict"] = bench_predict(config, model_paths, args.batch_sizes, repeats=args.repeats)
+            for model_name, per_batch in entry["predict"].items():
+                summary = ", ".join(f"{bs}: {r['p50_ms']:.2f}" for bs, r in per_batch.items())
+                print(f"   predict {model_name} p50 ms -> {summary}")
+
+        report["configs"][name] = entry
+
+    by_obs_type: Dict[str, Dict[str, Any]] = {}
+    for name, entry in report["configs"].items():
+        single = entry["single_env"]
+        by_obs_type.setdefault(single["observation_type"], {})[name] = {
+            "steps_per_sec": single["steps_per_sec"],
+            "reset_p50_ms": single["reset"]["p50_ms"],
+        }
+    report["by_observation_type"] = by_obs_type
+    return report
+
+
+def flatten_metrics(tree: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+def _higher_is_better(metric: str) -> Optional[bool]:
+    for suffix, higher in HIGHER_IS_BETTER.items():
+        if metric.endswith(suffix):
+            return higher
+    return None
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[Tuple[str, float, float, float]]:
+    """Returns (metric, baseline, current, relative change) for every regression beyond tolerance."""
+    base = flatten_metrics(baseline["configs"])
+    cur = flatten_metrics(current["configs"])
+    regressions = []
+    for metric in sorted(base.keys() & cur.keys()):
+        higher = _higher_is_better(metric)
+        if higher is None or base[metric] == 0:
+            continue
+        change = (cur[metric] - base[metric]) / abs(base[metric])
+        if (higher and change < -tolerance) or (not higher and change > tolerance):
+            regressions.append((metric, base[metric], cur[metric], change))
+    return regressions
+
+
+def print_comparison(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> int:
+    regressions = compare_reports(baseline, current, tolerance)
+    for key in ("highway_env", "stable_baselines3", "torch"):
+        before, after = baseline["meta"].get(key), current["meta"].get(key)
+        if before != after:
+            print(f"   {key}: {before} -> {after}")
+    if not regressions:
+        print(f"No regressions beyond {tolerance:.0%}.")
+        return 0
+    print(f"{len(regressions)} regression(s) beyond {tolerance:.0%}:")
+    for metric, before, after, change in regressions:
+        print(f"   {metric:<70} {before:12.3f} -> {after:12.3f} ({change:+.1%})")
+    return 1
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the benchmarks and write a JSON report")
+    run.add_argument("--configs", nargs="*", help="Config names (default: every config/*.yaml)")
+    run.add_argument("--output", default="benchmarks/results/latest.json")
+    run.add_argument("--steps", type=int, default=500, help="Single-env steps")
+    run.add_argument("--resets", type=int, default=20, help="Timed resets per config")
+    run.add_argument("--vec-steps", type=int, default=100, help="Vec env steps per (backend, n_envs)")
+    run.add_argument("--n-envs", type=int, nargs="+", default=[1, 2, 4, 8])
+    run.add_argument("--backends", nargs="+", default=["dummy", "subproc", "shm"])
+    run.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    run.add_argument("--repeats", type=int, default=50, help="Timed predict calls per batch size")
+    run.add_argument("--skip-vec", action="store_true")
+    run.add_argument("--skip-predict", action="store_true")
+    run.add_argument("--skip-her", action="store_true", help="Skip the HER replay buffer sampling benchmark")
+    run.add_argument("--baseline", help="Compare against this report after running")
+    run.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown")
+
+    compare = sub.add_parser("compare", help="Flag regressions of one report against a baseline")
+    compare.add_argument("--baseline", required=True)
+    compare.add_argument("--current", required=True)
+    compare.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run_benchmarks(args)
+        _write_json(args.output, report)
+        print(f"Saved benchmark report to {args.output}")
+        if args.baseline:
+            with open(args.baseline) as f:
+                return print_comparison(json.load(f), report, args.tolerance)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return print_comparison(baseline, current, args.tolerance)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
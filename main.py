@@ -1,50 +1,206 @@
+import time
+
+START_TIME = time.perf_counter()
+
 import argparse
-import gymnasium as gym
-import highway_env
 import os
 import sys
+from typing import Tuple
 
 sys.path.append(os.getcwd())
 
-from src.utils.file_handler import load_config
-from src.wrappers.highway_wrapper import HighwayConfigWrapper
-from src.agents.sb3_manager import SB3AgentManager
-from src.utils.video_utils import record_agent_run
+from src.utils.file_handler import load_config, model_dir
+
+# torch, SB3 and highway-env are imported inside main() once the config is known to be valid.
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def parse_video_size(value: str) -> Tuple[int, int]:
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WxH (e.g. 1280x720), got {value!r}")
+    if width < 1 or height < 1:
+        raise argparse.ArgumentTypeError(f"width and height must be at least 1, got {value!r}")
+    return width, height
+
 
 def get_args():
     parser = argparse.ArgumentParser(description="Train an agent on Highway-Env.")
-    parser.add_argument('--env', type=str, default='highway', help='Config file name (e.g. highway, merge)')
-    parser.add_argument('--mode', type=str, default='train', choices=['train', 'test', 'visualize'])
+    parser.add_argument('--env', type=str, default='highway', help='Config file name (e.g. highway, merge); visualize accepts a comma-separated list')
+    parser.add_argument('--config', type=str, default=None, help='Config file path, instead of config/{env}.yaml (e.g. a sweep run config)')
+    parser.add_argument('--mode', type=str, default='train', choices=['train', 'test', 'visualize', 'evaluate', 'serve', 'export', 'replay'])
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue --mode train from models/{env_id}/checkpoints/resume.json (model, optimizer, replay buffer, timesteps)')
+    parser.add_argument('--episodes', type=positive_int, default=100, help='Number of episodes for --mode evaluate')
+    parser.add_argument('--n-envs', type=int, default=None, help='Parallel envs for --mode evaluate (default: agent_params.n_envs)')
+    parser.add_argument('--model', type=str, default=None, help='Model zip for --mode evaluate/serve/export (default: fully trained model)')
+    parser.add_argument('--output', type=str, default=None, help='Also write the evaluate/export JSON report to this file')
+    parser.add_argument('--workers', type=positive_int, default=None, help='Recording processes for --mode visualize (default: one per video, capped at CPU count)')
+    parser.add_argument('--frame-skip', type=positive_int, default=1, help='Render only every N-th step in --mode visualize')
+    parser.add_argument('--video-size', type=parse_video_size, default=None, help='Output resolution WxH for --mode visualize (default: screen_width x screen_height)')
+    parser.add_argument('--address', type=str, default=None,
+                        help='Socket for --mode serve: unix:/path.sock or tcp:host:port (default: tcp:127.0.0.1:8765)')
+    parser.add_argument('--batch-window-ms', type=float, default=2.0, help='Micro-batching latency window for --mode serve')
+    parser.add_argument('--max-batch', type=int, default=64, help='Largest micro-batch for --mode serve')
+    parser.add_argument('--formats', type=str, default='torchscript,numpy,onnx',
+                        help='Comma-separated artifacts for --mode export: torchscript, numpy, onnx (onnx is optional)')
+    parser.add_argument('--quantize', action='store_true', help='Also export dynamic int8 variants in --mode export')
+    parser.add_argument('--samples', type=int, default=1000, help='Observations used for the --mode export accuracy check')
+    parser.add_argument('--record-dir', type=str, default=None,
+                        help='--mode evaluate: record every episode into this directory; --mode replay: recording to render')
+    parser.add_argument('--select', type=str, default='failure', choices=['all', 'collision', 'failure'],
+                        help='Recorded episodes rendered by --mode replay')
+    parser.add_argument('--limit', type=int, default=None, help='Render at most N episodes in --mode replay')
+    parser.add_argument('--evolution', choices=['sequence', 'side-by-side'], default=None,
+                        help='Stream all stages of --mode visualize into one labelled assets/videos/{env_id}_evolution.mp4')
     return parser.parse_args()
 
 def main():
     args = get_args()
-    config_path = f"config/{args.env}.yaml"
+    env_keys = args.env.split(',')
     
     print(f"--- Running Mode: {args.mode.upper()} ---")
 
+    if len(env_keys) > 1 and args.mode != 'visualize':
+        print("CRITICAL ERROR: Only --mode visualize accepts several envs.")
+        return
+
     try:
-        config = load_config(config_path)
+        config_paths = [args.config] if args.config else [f"config/{key}.yaml" for key in env_keys]
+        configs = [load_config(path) for path in config_paths]
     except Exception as e:
         print(f"CRITICAL ERROR: Config file not found! {e}")
         return
     
+    config = configs[0]
     env_name = config['env_id'] 
 
+    if args.mode == 'visualize':
+        from src.utils.video_utils import build_evolution_job, build_stage_jobs, record_jobs_parallel
+
+        video_size = args.video_size
+        jobs = []
+        for env_config in configs:
+            print(f"Generating progression videos for {env_config['env_id']}...")
+            if args.evolution:
+                jobs.append(build_evolution_job(env_config, layout=args.evolution, frame_skip=args.frame_skip, video_size=video_size))
+            else:
+                jobs.extend(build_stage_jobs(env_config, frame_skip=args.frame_skip, video_size=video_size))
+
+        print(f"Recording {len(jobs)} video(s) in parallel...")
+        record_jobs_parallel(jobs, max_workers=args.workers)
+        print(f"⏱️ Total time: {time.perf_counter() - START_TIME:.2f}s")
+        return
+
+    if args.mode == 'replay':
+        from src.utils.trajectory_log import (ReplayJob, list_episodes, load_recording_meta,
+                                              replay_episodes_parallel, select_episodes)
+
+        if not args.record_dir:
+            print("CRITICAL ERROR: --mode replay needs --record-dir.")
+            return
+        meta = load_recording_meta(args.record_dir)
+        episodes = list_episodes(args.record_dir)
+        selected = select_episodes(episodes, args.select)[:args.limit]
+        print(f"🎞️ Rendering {len(selected)} of {len(episodes)} recorded episodes ({args.select})...")
+        video_size = args.video_size
+        jobs = [ReplayJob(meta, episode, os.path.join(args.record_dir, "videos", f"{episode.key}.mp4"),
+                          args.frame_skip, video_size) for episode in selected]
+        if jobs:
+            replay_episodes_parallel(jobs, max_workers=args.workers)
+        print(f"⏱️ Total time: {time.perf_counter() - START_TIME:.2f}s")
+        return
+
+    import gymnasium as gym
+    import highway_env
+    from src.wrappers.highway_wrapper import HighwayConfigWrapper
+    from src.agents.sb3_manager import SB3AgentManager
+
     if args.mode == 'train':
-        agent_manager = SB3AgentManager(config=config, env=None, mode='train')
+        agent_manager = SB3AgentManager(config=config, env=None, mode='train', resume=args.resume)
         agent_manager.train()
         agent_manager.save_fully_trained() 
 
+    elif args.mode == 'evaluate':
+        import dataclasses
+        import json
+        from src.utils.evaluation import evaluate_policy_batched
+        from src.utils.vec_env_factory import build_vec_env, resolve_vec_env_settings
+
+        settings = resolve_vec_env_settings(config)
+        n_envs = args.n_envs or min(settings.n_envs, args.episodes)
+        vec_env = build_vec_env(config, dataclasses.replace(settings, n_envs=n_envs), record_dir=args.record_dir)
+
+        model_path = args.model or os.path.join(model_dir(config), f"fully_trained_{env_name}_model.zip")
+        if args.record_dir:
+            from src.utils.trajectory_log import write_recording_meta
+            write_recording_meta(args.record_dir, config, model_path)
+        agent_manager = SB3AgentManager(config=config, env=vec_env, mode='evaluate')
+        agent_manager.load(model_path)
+        print(f"⏱️ Startup time: {time.perf_counter() - START_TIME:.2f}s")
+
+        report = evaluate_policy_batched(agent_manager.model, vec_env, n_episodes=args.episodes)
+        report.update({"env_id": env_name, "model": model_path})
+        vec_env.close()
+
+        print(json.dumps(report, indent=2))
+        if args.output:
+            os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    elif args.mode == 'serve':
+        from src.utils.inference_server import DEFAULT_ADDRESS, serve_policy
+
+        model_path = args.model or os.path.join(model_dir(config), f"fully_trained_{env_name}_model.zip")
+        # HER models can only be loaded with an env; it is never stepped.
+        env = HighwayConfigWrapper(gym.make(config['env_id']), config['env_params'])
+        agent_manager = SB3AgentManager(config=config, env=env, mode='serve')
+        agent_manager.load(model_path)
+        print(f"⏱️ Startup time: {time.perf_counter() - START_TIME:.2f}s")
+        serve_policy(agent_manager.model, address=args.address or DEFAULT_ADDRESS,
+                     batch_window_ms=args.batch_window_ms, max_batch_size=args.max_batch)
+
+    elif args.mode == 'export':
+        import json
+        from src.utils.policy_export import collect_observations, export_policy, verify_export
+
+        model_path = args.model or os.path.join(model_dir(config), f"fully_trained_{env_name}_model.zip")
+        env = HighwayConfigWrapper(gym.make(config['env_id']), config['env_params'])
+        agent_manager = SB3AgentManager(config=config, env=env, mode='export')
+        agent_manager.load(model_path)
+
+        export_dir = os.path.join(model_dir(config), "export")
+        paths = export_policy(agent_manager.model, export_dir, formats=args.formats.split(','), quantize=args.quantize)
+        print(f"📦 Exported {', '.join(sorted(paths))} to {export_dir}")
+        observations = collect_observations(agent_manager.model, env, args.samples)
+        report = verify_export(agent_manager.model, paths, observations)
+        report.update({"env_id": env_name, "model": model_path})
+        with open(os.path.join(export_dir, "report.json"), 'w') as f:
+            json.dump(report, f, indent=2)
+
+        print(json.dumps(report, indent=2))
+        if args.output:
+            os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+
     else:
         base_env = gym.make(config['env_id'], render_mode='rgb_array')
         env = HighwayConfigWrapper(base_env, config['env_params'])
         agent_manager = SB3AgentManager(config=config, env=env, mode='test')
 
         if args.mode == 'test':
-            final_path = f"models/{env_name}/fully_trained_{env_name}_model.zip"
+            final_path = os.path.join(model_dir(config), f"fully_trained_{env_name}_model.zip")
             try:
                 agent_manager.load(final_path)
+                print(f"⏱️ Startup time: {time.perf_counter() - START_TIME:.2f}s")
                 obs, info = env.reset()
                 done = False
                 truncated = False
@@ -56,40 +212,5 @@ def main():
             except Exception as e:
                 print(f"Error loading model: {e}")
 
-        elif args.mode == 'visualize':
-            print(f"Generating progression videos for {env_name}...")
-            video_folder = f"logs/videos/{env_name}"
-            os.makedirs(video_folder, exist_ok=True)
-
-            untrained_path = f"models/{env_name}/untrained_{env_name}_model.zip"
-            print(f"1. Recording Untrained ({untrained_path})...")
-            
-            if os.path.exists(untrained_path):
-                agent_manager.load(untrained_path)
-                record_agent_run(env, model=agent_manager.model, video_folder=video_folder, name_prefix="1_untrained")
-            else:
-                print("   File not found! Using random.")
-                record_agent_run(env, model=None, video_folder=video_folder, name_prefix="1_untrained_random")
-
-            half_path = f"models/{env_name}/half_trained_{env_name}_model.zip"
-            print(f"2. Recording Half-Trained ({half_path})...")
-            
-            if os.path.exists(half_path):
-                agent_manager.load(half_path)
-                record_agent_run(env, model=agent_manager.model, video_folder=video_folder, name_prefix="2_half_trained")
-            else:
-                print("   Half-trained file not found.")
-            
-            full_path = f"models/{env_name}/fully_trained_{env_name}_model.zip"
-            print(f"3. Recording Fully Trained ({full_path})...")
-            
-            if os.path.exists(full_path):
-                agent_manager.load(full_path)
-                record_agent_run(env, model=agent_manager.model, video_folder=video_folder, name_prefix="3_fully_trained")
-            else:
-                print("   Fully-trained file not found.")
-
-            env.close()
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
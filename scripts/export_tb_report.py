@@ -1,12 +1,16 @@
 from __future__ import annotations
 
 import argparse
+import json
 import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 import matplotlib.pyplot as plt
-from tensorboard.backend.event_processing.event_accumulator import EventAccumulator
+import numpy as np
+from tensorboard.compat.proto import event_pb2
 
 
 COMMON_TAGS = [
@@ -19,11 +23,70 @@ COMMON_TAGS = [
     "time/fps",
 ]
 
+# Header of a tfevents record: uint64 payload length + uint32 masked CRC of that length.
+_RECORD_HEADER = struct.Struct("<QI")
+_RECORD_FOOTER_SIZE = 4
+
+# Bumped whenever the cache layout changes; older caches are rebuilt from scratch.
+CACHE_VERSION = 2
+
 
 @dataclass(frozen=True)
 class ScalarSeries:
-    steps: List[int]
-    values: List[float]
+    steps: np.ndarray
+    values: np.ndarray
+    wall_times: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def append(self, other: "ScalarSeries") -> "ScalarSeries":
+        steps = np.concatenate([self.steps, other.steps])
+        values = np.concatenate([self.values, other.values])
+        wall_times = np.concatenate([self.wall_times, other.wall_times])
+        if len(self) and len(other) and other.steps[0] < self.steps[-1]:
+            # A resumed run writes a new event file that can overlap the previous one.
+            order = np.argsort(steps, kind="stable")
+            steps, values, wall_times = steps[order], values[order], wall_times[order]
+        return ScalarSeries(steps=steps, values=values, wall_times=wall_times)
+
+
+class _GrowableSeries:
+    """Amortised O(1) appends into NumPy arrays (no per-event Python objects kept)."""
+
+    def __init__(self, capacity: int = 1024):
+        self.n = 0
+        self.steps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.float32)
+        self.wall_times = np.empty(capacity, dtype=np.float64)
+
+    def add(self, step: int, value: float, wall_time: float) -> None:
+        if self.n == len(self.steps):
+            new_capacity = 2 * len(self.steps)
+            self.steps = np.resize(self.steps, new_capacity)
+            self.values = np.resize(self.values, new_capacity)
+            self.wall_times = np.resize(self.wall_times, new_capacity)
+        self.steps[self.n] = step
+        self.values[self.n] = value
+        self.wall_times[self.n] = wall_time
+        self.n += 1
+
+    def freeze(self) -> ScalarSeries:
+        return ScalarSeries(
+            steps=self.steps[:self.n].copy(),
+            values=self.values[:self.n].copy(),
+            wall_times=self.wall_times[:self.n].copy(),
+        )
+
+
+@dataclass(frozen=True)
+class RunJob:
+    env_id: str
+    event_dir: str
+    outdir: str
+    cache_dir: str
+    force: bool = False
+    max_points: Optional[int] = 2000
 
 
 def find_event_dirs(logdir: str) -> List[str]:
@@ -40,27 +103,197 @@ def guess_env_id_from_path(path: str, logdir: str) -> str:
     return first if first and first != "." else "unknown-env"
 
 
+def iter_event_records(path: str, offset: int = 0) -> Iterator[Tuple[bytes, int]]:
+    """Yields (payload, end_offset) for every complete record of a tfevents file from ``offset``.
+
+    A record still being written (truncated at EOF) is left for the next read. CRCs are not
+    verified: the files come from our own SummaryWriter and this keeps the reader pure Python-fast.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            (length, _) = _RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            footer = f.read(_RECORD_FOOTER_SIZE)
+            if len(payload) < length or len(footer) < _RECORD_FOOTER_SIZE:
+                return
+            offset += _RECORD_HEADER.size + length + _RECORD_FOOTER_SIZE
+            yield payload, offset
+
+
+def _scalar_value(value) -> Optional[float]:
+    kind = value.WhichOneof("value")
+    if kind == "simple_value":
+        return float(value.simple_value)
+    if kind == "tensor" and value.tensor.float_val:
+        return float(value.tensor.float_val[0])
+    if kind == "tensor" and value.tensor.double_val:
+        return float(value.tensor.double_val[0])
+    return None
+
+
+def read_scalars(path: str, tags: List[str], offset: int = 0) -> Tuple[Dict[str, ScalarSeries], int]:
+    """Streams one event file from ``offset`` and returns the requested scalars plus the new offset.
+
+    Records that do not mention any requested tag are skipped before protobuf decoding.
+    """
+    wanted = set(tags)
+    needles = [tag.encode() for tag in tags]
+    buffers: Dict[str, _GrowableSeries] = {}
+    end = offset
+    for payload, end in iter_event_records(path, offset):
+        if not any(needle in payload for needle in needles):
+            continue
+        event = event_pb2.Event.FromString(payload)
+        for value in event.summary.value:
+            if value.tag not in wanted:
+                continue
+            scalar = _scalar_value(value)
+            if scalar is not None:
+                buffers.setdefault(value.tag, _GrowableSeries()).add(event.step, scalar, event.wall_time)
+    return {tag: buf.freeze() for tag, buf in buffers.items()}, end
+
+
 def load_scalars(event_dir: str, tags: List[str]) -> Dict[str, ScalarSeries]:
-    # size_guidance keeps memory reasonable even for long runs
-    ea = EventAccumulator(event_dir, size_guidance={"scalars": 50_000})
-    ea.Reload()
-    available = set(ea.Tags().get("scalars", []))
     out: Dict[str, ScalarSeries] = {}
+    for name in sorted(os.listdir(event_dir)):
+        if name.startswith("events.out.tfevents"):
+            scalars, _ = read_scalars(os.path.join(event_dir, name), tags)
+            for tag, series in scalars.items():
+                out[tag] = out[tag].append(series) if tag in out else series
+    return out
+
+
+def lttb_downsample(x: np.ndarray, y: np.ndarray, n_out: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Buckets: keeps the visual shape (including spikes) with n_out points."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    xf = x.astype(np.float64)
+    yf = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = xf[next_start:next_stop].mean()
+        avg_y = yf[next_start:next_stop].mean()
+        area = np.abs(
+            (xf[a] - avg_x) * (yf[start:stop] - yf[a])
+            - (xf[a] - xf[start:stop]) * (avg_y - yf[a])
+        )
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def safe_tag_name(tag: str) -> str:
+    return tag.replace("/", "__")
+
+
+def event_file_stats(event_dir: str) -> Dict[str, Dict[str, float]]:
+    stats: Dict[str, Dict[str, float]] = {}
+    for name in sorted(os.listdir(event_dir)):
+        if name.startswith("events.out.tfevents"):
+            st = os.stat(os.path.join(event_dir, name))
+            stats[name] = {"size": st.st_size, "mtime": st.st_mtime}
+    return stats
+
+
+def _read_manifest(run_cache: str) -> Dict:
+    path = os.path.join(run_cache, "manifest.json")
+    if not os.path.exists(path):
+        return {"version": CACHE_VERSION, "files": {}, "tags": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_manifest(run_cache: str, manifest: Dict) -> None:
+    tmp = os.path.join(run_cache, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(run_cache, "manifest.json"))
+
+
+def load_cached_series(run_cache: str, tag: str) -> Optional[ScalarSeries]:
+    path = os.path.join(run_cache, f"{safe_tag_name(tag)}.npz")
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return ScalarSeries(steps=data["steps"], values=data["values"], wall_times=data["wall_times"])
+
+
+def save_cached_series(run_cache: str, tag: str, series: ScalarSeries) -> None:
+    path = os.path.join(run_cache, f"{safe_tag_name(tag)}.npz")
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, steps=series.steps, values=series.values, wall_times=series.wall_times)
+    os.replace(tmp, path)
+
+
+def ingest_run(event_dir: str, run_cache: str, tags: List[str]) -> Tuple[Dict[str, ScalarSeries], Set[str]]:
+    """Returns every cached series of a run plus the tags that received new records.
+
+    Event files whose size and mtime match the manifest are not opened; changed files are
+    streamed from the byte offset reached last time, so only new records get decoded and
+    appended to the per-tag npz files.
+    """
+    os.makedirs(run_cache, exist_ok=True)
+    manifest = _read_manifest(run_cache)
+    stats = event_file_stats(event_dir)
+
+    known = manifest["files"]
+    stale = manifest.get("version") != CACHE_VERSION or any(
+        name in known and st["size"] < known[name]["offset"] for name, st in stats.items()
+    )
+    if stale:
+        # Old cache layout or a rewritten event file: the cached records can no longer be trusted.
+        manifest = {"version": CACHE_VERSION, "files": {}, "tags": {}}
+        for tag in tags:
+            path = os.path.join(run_cache, f"{safe_tag_name(tag)}.npz")
+            if os.path.exists(path):
+                os.remove(path)
+        known = manifest["files"]
+
+    series: Dict[str, ScalarSeries] = {}
     for tag in tags:
-        if tag not in available:
+        cached = load_cached_series(run_cache, tag)
+        if cached is not None:
+            series[tag] = cached
+
+    changed: Set[str] = set()
+    for name, st in stats.items():
+        entry = known.get(name)
+        if entry is not None and entry["size"] == st["size"] and entry["mtime"] == st["mtime"]:
             continue
-        events = ea.Scalars(tag)
-        steps = [int(e.step) for e in events]
-        values = [float(e.value) for e in events]
-        if steps:
-            out[tag] = ScalarSeries(steps=steps, values=values)
-    return out
+        offset = entry["offset"] if entry is not None else 0
+        fresh_scalars, offset = read_scalars(os.path.join(event_dir, name), tags, offset)
+        for tag, fresh in fresh_scalars.items():
+            series[tag] = series[tag].append(fresh) if tag in series else fresh
+            changed.add(tag)
+        known[name] = dict(st, offset=offset)
+
+    for tag in changed:
+        save_cached_series(run_cache, tag, series[tag])
+        manifest["tags"][tag] = len(series[tag])
+    manifest["files"] = known
+    _write_manifest(run_cache, manifest)
+    return series, changed
 
 
-def plot_series(series: ScalarSeries, title: str, xlabel: str = "timesteps") -> plt.Figure:
+def plot_series(series: ScalarSeries, title: str, xlabel: str = "timesteps", max_points: Optional[int] = None) -> plt.Figure:
+    steps, values = series.steps, series.values
+    if max_points:
+        steps, values = lttb_downsample(steps, values, max_points)
     fig = plt.figure(figsize=(9, 4.5), dpi=160)
     ax = fig.add_subplot(1, 1, 1)
-    ax.plot(series.steps, series.values, linewidth=1.6)
+    ax.plot(steps, values, linewidth=1.6)
     ax.set_title(title)
     ax.set_xlabel(xlabel)
     ax.grid(True, alpha=0.25)
@@ -74,20 +307,35 @@ def save_fig(fig: plt.Figure, path: str) -> None:
     plt.close(fig)
 
 
-def export_env_plots(env_id: str, runs: List[str], outdir: str) -> List[str]:
-    # For each env, pick the "best" run directory as the deepest/most recent one
-    # (common structure: <env_id>/<algo>_<seed>/)
-    # If multiple exist, export from all and suffix by run name.
-    exported: List[str] = []
-    for event_dir in runs:
-        run_name = os.path.basename(event_dir)
-        scalars = load_scalars(event_dir, COMMON_TAGS)
-        for tag, series in scalars.items():
-            safe_tag = tag.replace("/", "__")
-            out_path = os.path.join(outdir, "tb", env_id, f"{safe_tag}__{run_name}.png")
-            fig = plot_series(series, title=f"{env_id} • {tag} • {run_name}")
+def export_run(job: RunJob) -> List[Tuple[str, bool]]:
+    """Ingests one run and re-renders only the plots whose data changed (or are missing)."""
+    run_name = os.path.basename(job.event_dir)
+    run_cache = os.path.join(job.cache_dir, job.env_id, run_name)
+    scalars, changed = ingest_run(job.event_dir, run_cache, COMMON_TAGS)
+
+    exported: List[Tuple[str, bool]] = []
+    for tag, series in scalars.items():
+        out_path = os.path.join(job.outdir, "tb", job.env_id, f"{safe_tag_name(tag)}__{run_name}.png")
+        rendered = job.force or tag in changed or not os.path.exists(out_path)
+        if rendered:
+            fig = plot_series(series, title=f"{job.env_id} • {tag} • {run_name}", max_points=job.max_points)
             save_fig(fig, out_path)
-            exported.append(out_path)
+        exported.append((out_path, rendered))
+    return exported
+
+
+def export_runs(run_jobs: List[RunJob], jobs: Optional[int] = None) -> List[Tuple[str, bool]]:
+    exported: List[Tuple[str, bool]] = []
+    if not run_jobs:
+        return exported
+    max_workers = jobs or min(len(run_jobs), os.cpu_count() or 1)
+    if max_workers == 1:
+        for job in run_jobs:
+            exported.extend(export_run(job))
+        return exported
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for result in pool.map(export_run, run_jobs):
+            exported.extend(result)
     return exported
 
 
@@ -95,10 +343,16 @@ def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--logdir", default="logs/tensorboard", help="TensorBoard log root directory")
     parser.add_argument("--outdir", default="assets", help="Output directory for PNG plots")
+    parser.add_argument("--cache-dir", default="logs/tb_cache", help="Parsed-scalar cache (npz per run/tag)")
+    parser.add_argument("--jobs", type=int, default=None, help="Parallel event-dir workers (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Re-render every plot even if its data is unchanged")
+    parser.add_argument("--max-points", type=int, default=2000,
+                        help="LTTB-downsample each curve to this many points before plotting (0 = plot every point)")
     args = parser.parse_args()
 
     logdir = os.path.abspath(args.logdir)
     outdir = os.path.abspath(args.outdir)
+    cache_dir = os.path.abspath(args.cache_dir)
 
     if not os.path.isdir(logdir):
         raise SystemExit(f"Log directory not found: {logdir}")
@@ -112,11 +366,17 @@ def main() -> int:
         env_id = guess_env_id_from_path(d, logdir)
         by_env.setdefault(env_id, []).append(d)
 
-    exported_all: List[str] = []
-    for env_id, runs in sorted(by_env.items()):
-        exported_all.extend(export_env_plots(env_id=env_id, runs=runs, outdir=outdir))
+    # Every run directory of every env is exported, suffixed by run name
+    # (common structure: <env_id>/<algo>_<seed>/).
+    run_jobs = [
+        RunJob(env_id, event_dir, outdir, cache_dir, args.force, args.max_points or None)
+        for env_id, runs in sorted(by_env.items())
+        for event_dir in runs
+    ]
+    exported_all = export_runs(run_jobs, args.jobs)
+    rendered = sum(1 for _, was_rendered in exported_all if was_rendered)
 
-    print(f"Exported {len(exported_all)} plot(s) into: {outdir}")
+    print(f"Exported {len(exported_all)} plot(s) into: {outdir} ({rendered} re-rendered, {len(exported_all) - rendered} unchanged)")
     return 0
 
 
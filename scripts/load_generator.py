@@ -0,0 +1,90 @@
+"""Stand-in simulator clients for ``main.py --mode serve``.
+
+    python main.py --env parking --mode serve --address tcp:127.0.0.1:8765
+    python scripts/load_generator.py --address tcp:127.0.0.1:8765 --clients 16 --requests 500
+
+Each client thread keeps one connection and sends random observations shaped like the served
+policy's observation space back to back. Reports client-side latency percentiles and throughput,
+followed by the server's own stats (batch sizes, queueing + forward latency).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from src.utils.inference_server import DEFAULT_ADDRESS, PolicyClient
+
+
+def random_observation(space: Dict[str, Any], rng: np.random.Generator) -> Any:
+    if space["type"] == "Dict":
+        return {key: random_observation(sub, rng) for key, sub in space["spaces"].items()}
+    low, high = max(space["low"], -1.0), min(space["high"], 1.0)
+    return rng.uniform(low, high, size=space["shape"]).astype(space["dtype"])
+
+
+def run_client(address: str, space: Dict[str, Any], n_requests: int, seed: int, latencies: List[float]) -> None:
+    rng = np.random.default_rng(seed)
+    observations = [random_observation(space, rng) for _ in range(min(n_requests, 64))]
+    with PolicyClient(address) as client:
+        for i in range(n_requests):
+            start = time.perf_counter()
+            client.predict(observations[i % len(observations)])
+            latencies.append(time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="unix:/path.sock or tcp:host:port")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client connections")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client")
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    with PolicyClient(args.address) as client:
+        info = client.call({"cmd": "info"})
+        client.call({"cmd": "reset_stats"})
+
+    per_client: List[List[float]] = [[] for _ in range(args.clients)]
+    threads = [threading.Thread(target=run_client, args=(args.address, info["observation_space"], args.requests, i, per_client[i]))
+               for i in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.concatenate([np.array(lat) for lat in per_client]) * 1000.0
+    with PolicyClient(args.address) as client:
+        server_stats = client.stats()
+    server_stats.pop("id", None)
+
+    report = {
+        "clients": args.clients,
+        "requests": int(len(latencies)),
+        "client_p50_ms": float(np.percentile(latencies, 50)),
+        "client_p99_ms": float(np.percentile(latencies, 99)),
+        "client_throughput_rps": len(latencies) / elapsed,
+        "batch_window_ms": info["batch_window_ms"],
+        "max_batch_size": info["max_batch_size"],
+        "server": server_stats,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
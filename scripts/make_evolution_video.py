@@ -2,11 +2,19 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
 import os
 import subprocess
-from dataclasses import dataclass
-from typing import List, Optional, Sequence, Tuple
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
+sys.path.append(os.getcwd())
+
+from src.utils.frame_sink import ffmpeg_executable
 
 STAGES: List[Tuple[str, str]] = [
     ("1_untrained", "UNTRAINED"),
@@ -14,6 +22,17 @@ STAGES: List[Tuple[str, str]] = [
     ("3_fully_trained", "FULLY TRAINED"),
 ]
 
+MANIFEST_FILE = ".evolution_manifest.json"
+
+
+@dataclass(frozen=True)
+class EncodeSettings:
+    layout: str = "sequence"
+    crf: int = 23
+    preset: str = "veryfast"
+    # Size of one panel.
+    resolution: Tuple[int, int] = (640, 360)
+
 
 @dataclass(frozen=True)
 class Paths:
@@ -32,7 +51,7 @@ def run(cmd: Sequence[str]) -> None:
 
 def ffmpeg_exists() -> bool:
     try:
-        subprocess.run(["ffmpeg", "-version"], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        subprocess.run([ffmpeg_executable(), "-version"], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return True
     except Exception:
         return False
@@ -45,6 +64,56 @@ def ensure_files_exist(paths: Paths) -> None:
         raise SystemExit(f"Missing input video(s) for {paths.env_id}:\n{missing_str}")
 
 
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Input/output content hashes and encode settings of every built video, keyed by output path.
+
+    An output is up to date when its inputs and settings are unchanged and the file on disk is
+    still the one that was written, so retraining one env only rebuilds that env's video.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def fingerprint(paths: Paths, settings: EncodeSettings) -> Dict[str, Any]:
+        return {
+            "inputs": {os.path.basename(p): file_sha256(p) for p in paths.inputs},
+            "settings": dict(asdict(settings), resolution=list(settings.resolution)),
+        }
+
+    def is_current(self, paths: Paths, fingerprint: Dict[str, Any]) -> bool:
+        entry = self.entries.get(paths.out_mp4)
+        if entry is None or not os.path.isfile(paths.out_mp4):
+            return False
+        return entry["inputs"] == fingerprint["inputs"] and entry["settings"] == fingerprint["settings"] \
+            and entry["output"] == file_sha256(paths.out_mp4)
+
+    def record(self, paths: Paths, fingerprint: Dict[str, Any]) -> None:
+        with self._lock:
+            self.entries[paths.out_mp4] = dict(fingerprint, output=file_sha256(paths.out_mp4))
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
 def _scale_label(w: int, h: int, i: int, label: str, font_size: int = 28) -> str:
     return (
         f"[{i}:v]scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
@@ -52,41 +121,59 @@ def _scale_label(w: int, h: int, i: int, label: str, font_size: int = 28) -> str
     )
 
 
-def build_filter_sequence(font_size: int = 28) -> str:
+def build_filter_sequence(font_size: int = 28, size: Tuple[int, int] = (640, 360)) -> str:
     """Untrained → Half-Trained → Fully Trained, end-to-end (concat)."""
-    w, h = 640, 360
+    w, h = size
     filters = [_scale_label(w, h, i, label, font_size) for i, (_, label) in enumerate(STAGES)]
     filters.append("[v0][v1][v2]concat=n=3:v=1:a=0[outv]")
     return ";".join(filters)
 
 
-def build_filter_side_by_side(font_size: int = 28) -> str:
+def build_filter_side_by_side(font_size: int = 28, size: Tuple[int, int] = (640, 360)) -> str:
     """Three panels side-by-side (hstack). Same height, labels on each."""
-    w, h = 640, 360
+    w, h = size
     filters = [_scale_label(w, h, i, label, font_size) for i, (_, label) in enumerate(STAGES)]
     filters.append("[v0][v1][v2]hstack=inputs=3[outv]")
     return ";".join(filters)
 
 
-def make_evolution(paths: Paths, layout: str, crf: int = 23) -> None:
+def make_evolution(paths: Paths, settings: EncodeSettings, threads: Optional[int] = None) -> None:
     ensure_files_exist(paths)
     os.makedirs(os.path.dirname(paths.out_mp4), exist_ok=True)
 
+    # Labels keep their size relative to the 360p default.
+    font_size = max(round(28 * settings.resolution[1] / 360), 8)
     filter_complex = (
-        build_filter_sequence() if layout == "sequence" else build_filter_side_by_side()
+        build_filter_sequence(font_size, settings.resolution) if settings.layout == "sequence"
+        else build_filter_side_by_side(font_size, settings.resolution)
     )
     cmd = [
-        "ffmpeg", "-y",
+        ffmpeg_executable(), "-y", "-loglevel", "error",
         "-i", paths.inputs[0],
         "-i", paths.inputs[1],
         "-i", paths.inputs[2],
         "-filter_complex", filter_complex,
         "-map", "[outv]", "-an",
         "-c:v", "libx264", "-pix_fmt", "yuv420p",
-        "-crf", str(crf), "-preset", "veryfast",
-        paths.out_mp4,
+        "-crf", str(settings.crf), "-preset", settings.preset,
     ]
-    run(cmd)
+    if threads:
+        cmd += ["-threads", str(threads)]
+    # Written next to the target and renamed, so an interrupted build never leaves a truncated video behind.
+    tmp_path = paths.out_mp4 + ".tmp.mp4"
+    run(cmd + [tmp_path])
+    os.replace(tmp_path, paths.out_mp4)
+
+
+def build_one(paths: Paths, settings: EncodeSettings, manifest: Manifest, force: bool, threads: Optional[int]) -> bool:
+    """Encodes one env's evolution video unless the manifest says it is current; True if it was built."""
+    ensure_files_exist(paths)
+    fingerprint = Manifest.fingerprint(paths, settings)
+    if not force and manifest.is_current(paths, fingerprint):
+        return False
+    make_evolution(paths, settings, threads=threads)
+    manifest.record(paths, fingerprint)
+    return True
 
 
 def detect_env_ids(video_root: str) -> List[str]:
@@ -111,6 +198,10 @@ def main() -> int:
     parser.add_argument("--video-root", default="logs/videos", help="Root folder containing per-env video folders")
     parser.add_argument("--outdir", default="assets/videos", help="Output directory")
     parser.add_argument("--crf", type=int, default=23, help="x264 quality (lower is better, larger file)")
+    parser.add_argument("--preset", default="veryfast", help="x264 preset (ultrafast for drafts, slow for final builds)")
+    parser.add_argument("--resolution", default="640x360", help="Panel size WxH (e.g. 320x180 for drafts)")
+    parser.add_argument("--jobs", type=int, default=None, help="Envs encoded concurrently (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if inputs and settings are unchanged")
     args = parser.parse_args()
 
     if not ffmpeg_exists():
@@ -126,15 +217,36 @@ def main() -> int:
     if not env_ids:
         raise SystemExit(f"No env folders found under: {video_root}")
 
-    for env_id in env_ids:
-        input_dir = os.path.join(video_root, env_id)
-        out_mp4 = os.path.join(outdir, f"{env_id}_evolution.mp4")
-        paths = Paths(env_id=env_id, input_dir=input_dir, out_mp4=out_mp4)
-        print(f"==> Building evolution video for {env_id} (layout={args.layout})")
-        make_evolution(paths, layout=args.layout, crf=args.crf)
-        print(f"Saved: {out_mp4}")
-
-    return 0
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    settings = EncodeSettings(layout=args.layout, crf=args.crf, preset=args.preset, resolution=(width, height))
+    manifest = Manifest(os.path.join(outdir, MANIFEST_FILE))
+    jobs = max(1, min(args.jobs or os.cpu_count() or 1, len(env_ids)))
+    # Concurrent encodes split the cores instead of each x264 spawning one thread per core.
+    threads = max(1, (os.cpu_count() or 1) // jobs) if jobs > 1 else None
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for env_id in env_ids:
+            paths = Paths(env_id=env_id, input_dir=os.path.join(video_root, env_id),
+                          out_mp4=os.path.join(outdir, f"{env_id}_evolution.mp4"))
+            futures[pool.submit(build_one, paths, settings, manifest, args.force, threads)] = paths
+        print(f"==> Building {len(futures)} evolution video(s) (layout={args.layout}, jobs={jobs})")
+        for future in as_completed(futures):
+            paths = futures[future]
+            try:
+                built = future.result()
+            except subprocess.CalledProcessError as e:
+                print(f"Failed: {paths.env_id}: ffmpeg exited with code {e.returncode}")
+                failed.append(paths.env_id)
+                continue
+            except SystemExit as e:
+                print(f"Failed: {e}")
+                failed.append(paths.env_id)
+                continue
+            print(f"Saved: {paths.out_mp4}" if built else f"Up to date: {paths.out_mp4}")
+
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+"""Rollout worker for a learner training with ``vec_env: remote``.
+
+    export ROLLOUT_AUTHKEY=<shared secret>          # same value on the learner
+    python scripts/rollout_worker.py --address tcp:learner-host:9100 --n-envs 16 --vec-env subproc
+
+Connects to the learner, receives its config and hosts up to ``--n-envs`` of its envs with a
+local vec env backend until the learner closes the connection. Run one per node.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from src.utils.remote_vec_env import AUTHKEY_ENV_VAR, CONNECT_TIMEOUT, DEFAULT_WORKER_VEC_ENV, run_rollout_worker
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", required=True, help="Learner address, tcp:host:port")
+    parser.add_argument("--n-envs", type=int, default=os.cpu_count() or 1, help="Envs hosted by this worker (default: CPU count)")
+    parser.add_argument("--vec-env", default=DEFAULT_WORKER_VEC_ENV, help="Local backend for the hosted envs: dummy, subproc, shm")
+    parser.add_argument("--connect-timeout", type=float, default=CONNECT_TIMEOUT, help="Seconds to keep retrying while the learner is not up")
+    args = parser.parse_args()
+
+    authkey = os.environ.get(AUTHKEY_ENV_VAR)
+    if not authkey:
+        print(f"CRITICAL ERROR: set {AUTHKEY_ENV_VAR} to the learner's key.")
+        return 1
+    print(f"🔌 Connecting to {args.address} with {args.n_envs} x {args.vec_env} envs...")
+    run_rollout_worker(args.address, authkey.encode(), args.n_envs, backend=args.vec_env, connect_timeout=args.connect_timeout)
+    print("Learner closed the connection.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""Hyperparameter sweeps and multi-seed runs of main.py, scheduled under a CPU budget.
+
+    python scripts/run_sweep.py config/sweeps/parking.yaml
+    python scripts/run_sweep.py config/sweeps/parking.yaml --summary
+
+Every run gets its own config and output directory under ``{output_dir}/{name}/{run_id}`` and is
+trained and then evaluated in a subprocess. A run occupies one core for the learner plus one per
+env worker process; runs are started whenever enough of ``cpu_budget`` is free. Run metadata and
+final evaluation metrics go into a SQLite index, and runs already marked ``done`` there are skipped
+when the sweep is started again.
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import itertools
+import json
+import math
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import IO, Any, Dict, List, Optional
+
+sys.path.append(os.getcwd())
+
+import yaml
+from stable_baselines3.common.vec_env import SubprocVecEnv
+
+from src.utils.file_handler import load_config
+from src.utils.vec_env_factory import (DEFAULT_N_ENVS, DEFAULT_VEC_ENV, REMOTE_VEC_ENV, THREAD_ENV_VARS, VEC_ENV_CLASSES,
+                                      local_rollout_workers)
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+INDEX_FILE = "index.sqlite"
+# Path prefixes accepted in a sweep's ``params``, relative to the config root.
+PARAM_ROOTS = {"model_params": "agent_params.model_params", "env_params": "env_params", "agent_params": "agent_params"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    sweep TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    trial INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    env_id TEXT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    run_dir TEXT,
+    cpu_cost INTEGER,
+    started_at REAL,
+    finished_at REAL,
+    train_sec REAL,
+    eval_sec REAL,
+    returncode INTEGER,
+    mean_return REAL,
+    std_return REAL,
+    success_rate REAL,
+    collision_rate REAL,
+    metrics TEXT,
+    PRIMARY KEY (sweep, run_id)
+)
+"""
+
+
+@dataclass
+class SweepRun:
+    run_id: str
+    trial: int
+    seed: int
+    params: Dict[str, Any]
+    config: Dict[str, Any]
+    run_dir: str
+    cost: int
+    stage: str = "pending"
+    process: Optional[subprocess.Popen] = None
+    log: Optional[IO[str]] = None
+    started_at: float = 0.0
+    stage_started: float = 0.0
+    train_sec: Optional[float] = None
+
+    @property
+    def config_path(self) -> str:
+        return os.path.join(self.run_dir, "config.yaml")
+
+    @property
+    def eval_path(self) -> str:
+        return os.path.join(self.run_dir, "eval.json")
+
+
+def _resolve_path(path: str) -> str:
+    root, _, rest = path.partition(".")
+    if root not in PARAM_ROOTS:
+        raise ValueError(f"Sweep parameter {path!r} must start with one of {sorted(PARAM_ROOTS)}")
+    return f"{PARAM_ROOTS[root]}.{rest}" if rest else PARAM_ROOTS[root]
+
+
+def _set_path(config: Dict[str, Any], path: str, value: Any) -> None:
+    *parents, leaf = _resolve_path(path).split(".")
+    node = config
+    for key in parents:
+        node = node.setdefault(key, {})
+    node[leaf] = value
+
+
+def _sample(spec: Any, rng: random.Random) -> Any:
+    """One draw of a random-search parameter: a list (choice) or {uniform|loguniform|int: [low, high]}."""
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    if isinstance(spec, dict) and len(spec) == 1:
+        (kind, (low, high)), = spec.items()
+        if kind == "uniform":
+            return rng.uniform(low, high)
+        if kind == "loguniform":
+            return 10 ** rng.uniform(math.log10(low), math.log10(high))
+        if kind == "int":
+            return rng.randint(low, high)
+    raise ValueError(f"Unsupported random-search spec {spec!r}: use a list, uniform, loguniform or int")
+
+
+def expand_trials(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    params: Dict[str, Any] = spec.get("params") or {}
+    search = spec.get("search", "grid")
+    if search == "grid":
+        for path, values in params.items():
+            if not isinstance(values, list):
+                raise ValueError(f"Grid parameter {path!r} needs a list of values")
+        return [dict(zip(params, values)) for values in itertools.product(*params.values())]
+    if search == "random":
+        rng = random.Random(spec.get("sampler_seed", 0))
+        return [{path: _sample(values, rng) for path, values in params.items()} for _ in range(spec.get("n_trials", 10))]
+    raise ValueError(f"Unknown search {search!r}, expected grid or random")
+
+
+def run_cost(config: Dict[str, Any], cpu_budget: int) -> int:
+    """Cores a run keeps busy: the learner plus one per env worker process, capped at the budget."""
+    agent_params = config["agent_params"]
+    n_envs = agent_params.get("n_envs", DEFAULT_N_ENVS)
+    backend = agent_params.get("vec_env", DEFAULT_VEC_ENV)
+    if n_envs == "auto" or backend == "auto":
+        return cpu_budget
+    if backend == REMOTE_VEC_ENV:
+        # Envs on other nodes do not count against this machine's budget.
+        workers = sum(local_rollout_workers(config, int(n_envs)))
+    else:
+        workers = int(n_envs) if issubclass(VEC_ENV_CLASSES[backend], SubprocVecEnv) else 0
+    return min(1 + workers, cpu_budget)
+
+
+def build_runs(spec: Dict[str, Any], cpu_budget: int) -> List[SweepRun]:
+    base = load_config(f"config/{spec['base']}.yaml")
+    sweep_dir = os.path.abspath(os.path.join(spec.get("output_dir", "runs"), spec["name"]))
+    runs = []
+    for trial, params in enumerate(expand_trials(spec)):
+        for seed in spec.get("seeds", [0]):
+            config = copy.deepcopy(base)
+            for path, value in params.items():
+                _set_path(config, path, value)
+            run_id = f"t{trial:03d}_s{seed}"
+            run_dir = os.path.join(sweep_dir, run_id)
+            config["agent_params"].update(seed=seed, output_dir=run_dir)
+            runs.append(SweepRun(run_id, trial, seed, params, config, run_dir, run_cost(config, cpu_budget)))
+    return runs
+
+
+class RunIndex:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+
+    def is_done(self, sweep: str, run: SweepRun) -> bool:
+        row = self.conn.execute("SELECT status, params FROM runs WHERE sweep = ? AND run_id = ?", (sweep, run.run_id)).fetchone()
+        return row is not None and row["status"] == "done" and row["params"] == json.dumps(run.params, sort_keys=True)
+
+    def record(self, sweep: str, run: SweepRun, status: str, **fields: Any) -> None:
+        values = {
+            "sweep": sweep, "run_id": run.run_id, "trial": run.trial, "seed": run.seed,
+            "env_id": run.config["env_id"], "params": json.dumps(run.params, sort_keys=True), "status": status,
+            "run_dir": run.run_dir, "cpu_cost": run.cost, "started_at": run.started_at or None, **fields,
+        }
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        self.conn.execute(f"INSERT OR REPLACE INTO runs ({columns}) VALUES ({placeholders})", list(values.values()))
+        self.conn.commit()
+
+    def rows(self, sweep: str) -> List[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM runs WHERE sweep = ? ORDER BY trial, seed", (sweep,)).fetchall()
+
+
+class SweepScheduler:
+    """Starts queued runs whenever their CPU cost fits into the free budget (first fit, in order)."""
+
+    def __init__(self, sweep: str, index: RunIndex, cpu_budget: int, eval_episodes: int, poll_interval: float = 1.0):
+        self.sweep = sweep
+        self.index = index
+        self.cpu_budget = cpu_budget
+        self.eval_episodes = eval_episodes
+        self.poll_interval = poll_interval
+        self.free = cpu_budget
+
+    def _child_env(self) -> Dict[str, str]:
+        # One BLAS/torch thread per learner, so a run uses what its cost says.
+        env = dict(os.environ)
+        env.update({var: "1" for var in THREAD_ENV_VARS})
+        return env
+
+    def _start_stage(self, run: SweepRun, stage: str) -> None:
+        cmd = [sys.executable, MAIN_SCRIPT, "--config", run.config_path, "--mode", stage]
+        if stage == "evaluate":
+            cmd += ["--episodes", str(self.eval_episodes), "--output", run.eval_path]
+        if run.log is not None:
+            run.log.close()
+        run.log = open(os.path.join(run.run_dir, f"{stage}.log"), "w")
+        run.process = subprocess.Popen(cmd, stdout=run.log, stderr=subprocess.STDOUT, env=self._child_env(),
+                                       cwd=os.path.dirname(MAIN_SCRIPT))
+        run.stage, run.stage_started = stage, time.time()
+
+    def _launch(self, run: SweepRun) -> None:
+        os.makedirs(run.run_dir, exist_ok=True)
+        with open(run.config_path, "w") as f:
+            yaml.safe_dump(run.config, f, sort_keys=False)
+        run.started_at = time.time()
+        self.free -= run.cost
+        self.index.record(self.sweep, run, "running")
+        self._start_stage(run, "train")
+        print(f"▶️  {run.run_id} (cost {run.cost}, {self.free}/{self.cpu_budget} CPUs free) {run.params}")
+
+    def _finish(self, run: SweepRun, returncode: int) -> None:
+        now = time.time()
+        fields: Dict[str, Any] = {"finished_at": now, "returncode": returncode, "train_sec": run.train_sec}
+        status = "failed"
+        if returncode == 0 and run.stage == "evaluate":
+            fields["eval_sec"] = now - run.stage_started
+            with open(run.eval_path) as f:
+                report = json.load(f)
+            fields.update({key: report.get(key) for key in ("mean_return", "std_return", "success_rate", "collision_rate")})
+            fields["metrics"] = json.dumps(report)
+            status = "done"
+        run.log.close()
+        result = f"mean return {fields['mean_return']:.3f}" if status == "done" else f"{run.stage} failed, see {run.run_dir}"
+        run.stage = status
+        self.free += run.cost
+        self.index.record(self.sweep, run, status, **fields)
+        print(f"{'✅' if status == 'done' else '❌'} {run.run_id}: {result} ({now - run.started_at:.0f}s)")
+
+    def _advance(self, run: SweepRun, returncode: int) -> bool:
+        """Moves a run whose process exited to its next stage; True once it is finished."""
+        if returncode == 0 and run.stage == "train":
+            run.train_sec = time.time() - run.stage_started
+            self._start_stage(run, "evaluate")
+            return False
+        self._finish(run, returncode)
+        return True
+
+    def run(self, runs: List[SweepRun]) -> None:
+        queue, running = list(runs), []
+        try:
+            while queue or running:
+                for run in list(queue):
+                    if run.cost <= self.free:
+                        queue.remove(run)
+                        self._launch(run)
+                        running.append(run)
+                time.sleep(self.poll_interval)
+                for run in list(running):
+                    returncode = run.process.poll()
+                    if returncode is not None and self._advance(run, returncode):
+                        running.remove(run)
+        except KeyboardInterrupt:
+            print("Interrupted, stopping running jobs...")
+            for run in running:
+                run.process.terminate()
+                run.process.wait()
+                run.log.close()
+                self.index.record(self.sweep, run, "interrupted", finished_at=time.time())
+            raise
+
+
+def print_summary(rows: List[sqlite3.Row]) -> None:
+    trials: Dict[int, List[sqlite3.Row]] = {}
+    for row in rows:
+        trials.setdefault(row["trial"], []).append(row)
+
+    summary = []
+    for trial, trial_rows in trials.items():
+        done = [row for row in trial_rows if row["status"] == "done"]
+        returns = [row["mean_return"] for row in done]
+        successes = [row["success_rate"] for row in done if row["success_rate"] is not None]
+        summary.append((
+            statistics.mean(returns) if returns else float("-inf"),
+            trial,
+            statistics.stdev(returns) if len(returns) > 1 else 0.0,
+            statistics.mean(successes) if successes else float("nan"),
+            f"{len(done)}/{len(trial_rows)}",
+            trial_rows[0]["params"],
+        ))
+
+    print(f"{'trial':>5}  {'return (mean ± std over seeds)':>30}  {'success':>7}  {'runs':>5}  params")
+    for mean_return, trial, std_return, success, runs, params in sorted(summary, reverse=True):
+        print(f"{trial:>5}  {mean_return:>20.3f} ± {std_return:<7.3f}  {success:>7.2f}  {runs:>5}  {params}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("spec", help="Sweep spec YAML (base config, search, params, seeds, cpu_budget)")
+    parser.add_argument("--index", default=None, help=f"SQLite run index (default: {{output_dir}}/{INDEX_FILE})")
+    parser.add_argument("--cpu-budget", type=int, default=None, help="Cores the sweep may use (default: spec cpu_budget or CPU count)")
+    parser.add_argument("--force", action="store_true", help="Re-run runs that are already done in the index")
+    parser.add_argument("--summary", action="store_true", help="Only print the per-trial summary from the index")
+    parser.add_argument("--dry-run", action="store_true", help="List the runs and their CPU cost without starting them")
+    args = parser.parse_args()
+
+    spec = load_config(args.spec)
+    cpu_budget = args.cpu_budget or spec.get("cpu_budget") or os.cpu_count() or 1
+    index = RunIndex(args.index or os.path.join(spec.get("output_dir", "runs"), INDEX_FILE))
+
+    if not args.summary:
+        runs = build_runs(spec, cpu_budget)
+        todo = [run for run in runs if args.force or not index.is_done(spec["name"], run)]
+        print(f"🧪 Sweep {spec['name']}: {len(runs)} run(s), {len(runs) - len(todo)} already done, CPU budget {cpu_budget}")
+        if args.dry_run:
+            for run in todo:
+                print(f"   {run.run_id} (cost {run.cost}) {run.params}")
+            return 0
+        SweepScheduler(spec["name"], index, cpu_budget, spec.get("eval_episodes", 50)).run(todo)
+
+    print_summary(index.rows(spec["name"]))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
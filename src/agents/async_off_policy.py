@@ -0,0 +1,159 @@
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from stable_baselines3 import DQN, SAC
+from stable_baselines3.common.buffers import ReplayBuffer
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.noise import ActionNoise
+from stable_baselines3.common.type_aliases import RolloutReturn, TrainFreq
+from stable_baselines3.common.utils import should_collect_more_steps
+from stable_baselines3.common.vec_env import VecEnv
+
+from src.utils.async_vec_env import AsyncSharedMemoryVecEnv
+
+DEFAULT_MAX_LAG = 4
+
+
+def _take(obs: Any, indices) -> Any:
+    if isinstance(obs, dict):
+        return {key: value[indices] for key, value in obs.items()}
+    return obs[indices]
+
+
+def _row(obs: Any, i: int) -> Any:
+    if isinstance(obs, dict):
+        return {key: value[i].copy() for key, value in obs.items()}
+    return obs[i].copy()
+
+
+def _stack(rows: List[Any]) -> Any:
+    if isinstance(rows[0], dict):
+        return {key: np.stack([row[key] for row in rows]) for key in rows[0]}
+    return np.stack(rows)
+
+
+class _AsyncRolloutState:
+    """Per-worker bookkeeping that survives between ``collect_rollouts`` calls."""
+
+    def __init__(self, last_obs: Any, n_envs: int, reset_count: int):
+        self.reset_count = reset_count
+        self.obs = {key: value.copy() for key, value in last_obs.items()} if isinstance(last_obs, dict) else last_obs.copy()
+        self.buffer_actions: List[Any] = [None] * n_envs
+        # (obs, buffer_action, new_obs, reward, done, info) per finished step, oldest first.
+        self.queues: List[Deque[Tuple[Any, ...]]] = [deque() for _ in range(n_envs)]
+
+
+class AsyncRolloutMixin:
+    """Off-policy rollout collection on an ``AsyncSharedMemoryVecEnv``.
+
+    Actions are computed for whichever workers are ready and their results are consumed as they
+    arrive, so slow steps and resets of one env no longer stall the others. Finished steps wait in
+    a per-worker queue and are written to the replay buffer one full row (one step of every env)
+    at a time, which keeps the per-env episode layout that ``ReplayBuffer`` and
+    ``HerReplayBuffer`` rely on. ``max_lag`` bounds how many steps a fast worker may run ahead of
+    the slowest one.
+
+    On any other vec env the stock synchronous ``collect_rollouts`` is used.
+    """
+
+    def __init__(self, *args, max_lag: int = DEFAULT_MAX_LAG, **kwargs):
+        if max_lag < 1:
+            raise ValueError(f"max_lag must be at least 1, got {max_lag}")
+        self.max_lag = max_lag
+        self._async_state: Optional[_AsyncRolloutState] = None
+        super().__init__(*args, **kwargs)
+
+    def _excluded_save_params(self) -> List[str]:
+        return [*super()._excluded_save_params(), "_async_state"]
+
+    def _dispatch_actions(self, env: VecEnv, state: _AsyncRolloutState, learning_starts: int,
+                          action_noise: Optional[ActionNoise]) -> None:
+        idle = [i for i in range(env.num_envs) if i not in env.pending and len(state.queues[i]) < self.max_lag]
+        if not idle:
+            return
+        # _sample_action reads the observations from _last_obs.
+        self._last_obs = _take(state.obs, idle)
+        actions, buffer_actions = self._sample_action(learning_starts, action_noise, len(idle))
+        for k, i in enumerate(idle):
+            state.buffer_actions[i] = buffer_actions[k]
+        env.send(actions, idle)
+
+    def collect_rollouts(
+        self,
+        env: VecEnv,
+        callback: BaseCallback,
+        train_freq: TrainFreq,
+        replay_buffer: ReplayBuffer,
+        action_noise: Optional[ActionNoise] = None,
+        learning_starts: int = 0,
+        log_interval: Optional[int] = None,
+    ) -> RolloutReturn:
+        if not isinstance(env.unwrapped, AsyncSharedMemoryVecEnv):
+            return super().collect_rollouts(env, callback, train_freq, replay_buffer, action_noise, learning_starts, log_interval)
+        if action_noise is not None or self.use_sde:
+            raise ValueError("Async stepping does not support action noise or gSDE (both are sized for the full env batch)")
+
+        self.policy.set_training_mode(False)
+        # A reset (e.g. at the start of learn()) drops every in-flight step.
+        if self._async_state is None or self._async_state.reset_count != env.reset_count:
+            self._async_state = _AsyncRolloutState(self._last_obs, env.num_envs, env.reset_count)
+        state = self._async_state
+
+        num_collected_steps, num_collected_episodes = 0, 0
+        callback.on_rollout_start()
+        continue_training = True
+        while should_collect_more_steps(train_freq, num_collected_steps, num_collected_episodes):
+            self._dispatch_actions(env, state, learning_starts, action_noise)
+
+            indices, new_obs, rewards, dones, infos = env.poll()
+            for k, i in enumerate(indices):
+                row_obs = _row(state.obs, i)
+                row_new_obs = _row(new_obs, k)
+                state.queues[i].append((row_obs, state.buffer_actions[i], row_new_obs, rewards[k], dones[k], infos[k]))
+                if isinstance(state.obs, dict):
+                    for key in state.obs:
+                        state.obs[key][i] = row_new_obs[key]
+                else:
+                    state.obs[i] = row_new_obs
+
+            while all(state.queues) and should_collect_more_steps(train_freq, num_collected_steps, num_collected_episodes):
+                rows = [queue.popleft() for queue in state.queues]
+                obs, buffer_actions, new_obs, rewards, dones, infos = (list(column) for column in zip(*rows))
+                self._last_obs = _stack(obs)
+                new_obs, buffer_actions = _stack(new_obs), np.stack(buffer_actions)
+                rewards, dones = np.array(rewards), np.array(dones)
+
+                self.num_timesteps += env.num_envs
+                num_collected_steps += 1
+
+                callback.update_locals(locals())
+                if not callback.on_step():
+                    return RolloutReturn(num_collected_steps * env.num_envs, num_collected_episodes, continue_training=False)
+
+                self._update_info_buffer(infos, dones)
+                self._store_transition(replay_buffer, buffer_actions, new_obs, rewards, dones, infos)
+                self._update_current_progress_remaining(self.num_timesteps, self._total_timesteps)
+                self._on_step()
+
+                for done in dones:
+                    if done:
+                        num_collected_episodes += 1
+                        self._episode_num += 1
+                        if log_interval is not None and self._episode_num % log_interval == 0:
+                            self.dump_logs()
+
+        self.logger.record("time/worker_idle_share", env.worker_idle_share())
+        callback.on_rollout_end()
+        return RolloutReturn(num_collected_steps * env.num_envs, num_collected_episodes, continue_training)
+
+
+class AsyncDQN(AsyncRolloutMixin, DQN):
+    pass
+
+
+class AsyncSAC(AsyncRolloutMixin, SAC):
+    pass
+
+
+ASYNC_ALGORITHMS: Dict[str, type] = {"DQN": AsyncDQN, "SAC": AsyncSAC}
@@ -1,15 +1,26 @@
 import os
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, Optional, Callable, Tuple
 from stable_baselines3 import DQN, PPO, SAC
 from stable_baselines3.common.base_class import BaseAlgorithm
-from stable_baselines3.common.callbacks import CheckpointCallback, CallbackList
-from stable_baselines3.common.env_util import make_vec_env
-from stable_baselines3.common.vec_env import SubprocVecEnv
-from stable_baselines3 import HerReplayBuffer 
+from stable_baselines3.common.callbacks import CallbackList
 
 import gymnasium as gym
-from src.wrappers.highway_wrapper import HighwayConfigWrapper
-from src.utils.callbacks import SaveHalfwayCallback
+from src.agents.async_off_policy import ASYNC_ALGORITHMS, DEFAULT_MAX_LAG
+from src.utils.async_vec_env import AsyncSharedMemoryVecEnv
+from src.utils.callbacks import BackgroundCheckpointCallback, ParallelEvalCallback, PhaseTimingCallback, SaveHalfwayCallback
+from src.utils.checkpointing import Checkpointer, CheckpointWriter, read_resume_manifest, restore_replay_buffer
+from src.utils.file_handler import model_dir
+from src.utils.replay_buffers import resolve_replay_buffer_class
+from src.utils.vec_env_factory import DEFAULT_VEC_ENV, VecEnvSettings, build_vec_env, resolve_vec_env_settings
+
+ALGORITHMS = {"DQN": DQN, "PPO": PPO, "SAC": SAC}
+
+DEFAULT_EVAL_ENVS = 4
+# Eval envs get their own seeds, away from the training envs' seed + rank.
+DEFAULT_EVAL_SEED = 1_000_000
+
+# Loaded policies keyed by (absolute path, mtime): re-loading an unchanged checkpoint is free.
+_MODEL_CACHE: Dict[Tuple[str, float], BaseAlgorithm] = {}
 
 def linear_schedule(initial_value: float) -> Callable[[float], float]:
    
@@ -19,24 +30,50 @@ def linear_schedule(initial_value: float) -> Callable[[float], float]:
     return func
 
 class SB3AgentManager:
-    def __init__(self, config: Dict[str, Any], env: Optional[gym.Env] = None, mode: str = 'train'):
+    def __init__(self, config: Dict[str, Any], env: Optional[gym.Env] = None, mode: str = 'train', resume: bool = False):
         self.config = config
         self.agent_params = config['agent_params']
         self.env_name = config['env_id']
+        self.model_dir = model_dir(config)
+        self.checkpoint_dir = os.path.join(self.model_dir, "checkpoints/")
+        # Checkpoints are snapshotted on the training thread and written by this one.
+        self.writer: Optional[CheckpointWriter] = CheckpointWriter() if mode == 'train' else None
         
         if mode == 'train':
-            print(f"🚀 Initializing TRUE Multiprocessing (4 CPUs) for {self.env_name}...")
-            self.env = make_vec_env(
-                env_id=self.env_name,
-                n_envs=8,
-                wrapper_class=HighwayConfigWrapper,
-                wrapper_kwargs={"config_params": config['env_params']},
-                vec_env_cls=SubprocVecEnv
-            )
+            settings = resolve_vec_env_settings(config)
+            print(f"🚀 Initializing {settings.n_envs} x {settings.backend} envs ({os.cpu_count()} CPUs) for {self.env_name}...")
+            self.env = build_vec_env(config, settings, seed=self.agent_params.get('seed'))
         else:
             self.env = env
 
-        self.model = self._create_model()
+        # Outside training a checkpoint is always loaded, so a fresh network would be thrown away.
+        self.model: Optional[BaseAlgorithm] = None
+        if mode == 'train':
+            self.model = self._resume_model() if resume else self._create_model()
+
+    def _algorithms(self, algo_name: str) -> Dict[str, type]:
+        if isinstance(self.env, AsyncSharedMemoryVecEnv):
+            if algo_name in ASYNC_ALGORITHMS:
+                print(f"⚡ Async stepping enabled (max lag {self.agent_params.get('async_max_lag', DEFAULT_MAX_LAG)} steps)")
+                return ASYNC_ALGORITHMS
+            print(f"   {algo_name} is on-policy, stepping the async env synchronously.")
+        return ALGORITHMS
+
+    def _resume_model(self) -> BaseAlgorithm:
+        manifest = read_resume_manifest(self.checkpoint_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"Nothing to resume: {self.checkpoint_dir} has no resume.json")
+
+        algo_name = self.agent_params['algorithm'].upper()
+        model_path = os.path.join(self.checkpoint_dir, manifest['model'])
+        model = self._algorithms(algo_name)[algo_name].load(model_path, env=self.env)
+        restore_replay_buffer(model, self.checkpoint_dir, manifest)
+        # The envs restart from scratch, so learn() has to reset them instead of reusing the saved observation.
+        model._last_obs = None
+        buffer = getattr(model, 'replay_buffer', None)
+        buffer_info = f", {buffer.size() * buffer.n_envs} transitions" if manifest.get('replay_buffer') else ""
+        print(f"♻️ Resuming from {model_path} at {model.num_timesteps} timesteps{buffer_info}")
+        return model
 
     def _create_model(self) -> BaseAlgorithm:
         algo_name = self.agent_params['algorithm'].upper()
@@ -45,69 +82,130 @@ class SB3AgentManager:
         if 'learning_rate' in model_kwargs and isinstance(model_kwargs['learning_rate'], (float, int)):
             model_kwargs['learning_rate'] = linear_schedule(model_kwargs['learning_rate'])
 
-        tb_log = os.path.join(self.agent_params.get('tensorboard_log', "logs/"), self.env_name)
+        tb_log = os.path.join(self.agent_params.get('output_dir', "."), self.agent_params.get('tensorboard_log', "logs/"), self.env_name)
+        if self.agent_params.get('seed') is not None:
+            model_kwargs['seed'] = self.agent_params['seed']
+
+        algorithms = self._algorithms(algo_name)
+        if algorithms is ASYNC_ALGORITHMS:
+            model_kwargs['max_lag'] = self.agent_params.get('async_max_lag', DEFAULT_MAX_LAG)
+
+        if isinstance(model_kwargs.get("replay_buffer_class"), str):
+            model_kwargs["replay_buffer_class"] = resolve_replay_buffer_class(model_kwargs["replay_buffer_class"], self.env.observation_space)
         
         if algo_name == "SAC":
             # SAC her zaman MultiInputPolicy kullanmalı (Goal için)
             policy_type = "MultiInputPolicy"
             
-            if model_kwargs.get("replay_buffer_class") == "HerReplayBuffer":
-                model_kwargs["replay_buffer_class"] = HerReplayBuffer
-            
-            return SAC(policy_type, self.env, tensorboard_log=tb_log, **model_kwargs)
+            return algorithms["SAC"](policy_type, self.env, tensorboard_log=tb_log, **model_kwargs)
 
         elif algo_name == "DQN":
-            return DQN("MlpPolicy", self.env, tensorboard_log=tb_log, device='auto', **model_kwargs)
+            return algorithms["DQN"]("MlpPolicy", self.env, tensorboard_log=tb_log, device='auto', **model_kwargs)
         elif algo_name == "PPO":
             # Roundabout ve Highway için MlpPolicy devam
             return PPO("MlpPolicy", self.env, tensorboard_log=tb_log, device='auto', **model_kwargs)
         else:
             raise ValueError(f"Algorithm {algo_name} not supported yet.")
 
+    def _eval_callback(self, evaluation: Dict[str, Any]) -> ParallelEvalCallback:
+        settings = VecEnvSettings(
+            n_envs=evaluation.get('n_envs', DEFAULT_EVAL_ENVS),
+            backend=evaluation.get('vec_env', DEFAULT_VEC_ENV),
+            start_method=self.agent_params.get('start_method'),
+            worker_threads=self.agent_params.get('worker_threads'),
+        )
+        eval_freq = evaluation.get('eval_freq', 20000)
+        print(f"📏 Evaluating every {eval_freq} timesteps on {settings.n_envs} x {settings.backend} envs alongside training")
+        return ParallelEvalCallback(
+            build_vec_env(self.config, settings),
+            eval_freq=eval_freq,
+            n_episodes=evaluation.get('n_episodes', 20),
+            best_model_path=os.path.join(self.model_dir, f"best_{self.env_name}_model"),
+            writer=self.writer,
+            metric=evaluation.get('metric', 'mean_return'),
+            reward_threshold=evaluation.get('reward_threshold'),
+            success_threshold=evaluation.get('success_threshold'),
+            threshold_evals=evaluation.get('threshold_evals', 1),
+            patience=evaluation.get('patience'),
+            min_delta=evaluation.get('min_delta', 0.0),
+            seed=evaluation.get('seed', DEFAULT_EVAL_SEED),
+            history_path=os.path.join(self.model_dir, "evaluations.json"),
+        )
+
     def train(self):
         timesteps = self.agent_params['total_timesteps']
+        resumed = self.model.num_timesteps > 0
         
-        untrained_path = f"./models/{self.env_name}/untrained_{self.env_name}_model"
-        print(f"Saving untrained model to {untrained_path}...")
-        os.makedirs(os.path.dirname(untrained_path), exist_ok=True)
-        self.model.save(untrained_path)
+        if not resumed:
+            untrained_path = os.path.join(self.model_dir, f"untrained_{self.env_name}_model")
+            print(f"Saving untrained model to {untrained_path}...")
+            os.makedirs(os.path.dirname(untrained_path), exist_ok=True)
+            self.writer.save_model(self.model, untrained_path)
         
         callbacks = []
 
-        half_path = f"./models/{self.env_name}/half_trained_{self.env_name}_model"
-        half_callback = SaveHalfwayCallback(save_path=half_path, total_timesteps=timesteps)
+        half_path = os.path.join(self.model_dir, f"half_trained_{self.env_name}_model")
+        half_callback = SaveHalfwayCallback(save_path=half_path, total_timesteps=timesteps, writer=self.writer)
+        half_callback.has_saved = self.model.num_timesteps >= half_callback.halfway_point and os.path.exists(half_path + ".zip")
         callbacks.append(half_callback)
 
         freq = self.agent_params.get('checkpoint_freq', 0)
         if freq > 0:
             save_freq = max(freq // 4, 1)
-            checkpoint_path = f"./models/{self.env_name}/checkpoints/"
-            ckpt_callback = CheckpointCallback(
-                save_freq=save_freq,
-                save_path=checkpoint_path,
-                name_prefix='checkpoint'
+            checkpointer = Checkpointer(
+                self.checkpoint_dir,
+                self.writer,
+                name_prefix='checkpoint',
+                save_replay_buffer=self.agent_params.get('save_replay_buffer', True),
+                resume=resumed,
+            )
+            callbacks.append(BackgroundCheckpointCallback(checkpointer, save_freq=save_freq))
+
+        evaluation = self.agent_params.get('evaluation') or {}
+        if evaluation.get('enabled', False):
+            callbacks.append(self._eval_callback(evaluation))
+
+        callback = CallbackList(callbacks)
+        profiling = self.agent_params.get('profiling') or {}
+        if profiling.get('enabled', False):
+            callback = PhaseTimingCallback(
+                callbacks,
+                profile_window=profiling.get('profile_window'),
+                sample_interval_ms=profiling.get('sample_interval_ms', 5.0),
+                profile_dir=profiling.get('profile_dir', "logs/profiles"),
+                run_name=self.env_name,
             )
-            callbacks.append(ckpt_callback)
 
-        print(f"Starting training for {timesteps} timesteps on {self.env_name}...")
-        self.model.learn(total_timesteps=timesteps, callback=CallbackList(callbacks))
+        remaining = timesteps - self.model.num_timesteps
+        print(f"Starting training for {remaining} timesteps on {self.env_name}...")
+        # With reset_num_timesteps=False, SB3 counts total_timesteps on top of the restored counter.
+        self.model.learn(total_timesteps=remaining, callback=callback, reset_num_timesteps=not resumed)
+        self.writer.flush()
         print("Training finished.")
 
     def save_fully_trained(self):
-        final_path = f"./models/{self.env_name}/fully_trained_{self.env_name}_model"
+        final_path = os.path.join(self.model_dir, f"fully_trained_{self.env_name}_model")
         os.makedirs(os.path.dirname(final_path), exist_ok=True)
-        self.model.save(final_path)
-        print(f"Fully trained model saved at: {final_path}.zip")
+        self.writer.save_model(self.model, final_path, message="Fully trained model saved at:")
+        self.writer.close()
 
     def load(self, path: str):
         if path.endswith(".zip"):
             path = path[:-4]
-        
+
         algo_name = self.agent_params['algorithm'].upper()
-        if algo_name == "DQN":
-            self.model = DQN.load(path, env=self.env)
-        elif algo_name == "PPO":
-            self.model = PPO.load(path, env=self.env)
-        elif algo_name == "SAC":
-            self.model = SAC.load(path, env=self.env)
-        print(f"Model loaded from: {path}")
\ No newline at end of file
+        if algo_name not in ALGORITHMS:
+            raise ValueError(f"Algorithm {algo_name} not supported yet.")
+
+        zip_path = os.path.abspath(path + ".zip")
+        key = (zip_path, os.path.getmtime(zip_path))
+        model = _MODEL_CACHE.get(key)
+        if model is None:
+            model = ALGORITHMS[algo_name].load(path, env=self.env)
+            _MODEL_CACHE[key] = model
+            print(f"Model loaded from: {path}")
+        else:
+            if self.env is not None:
+                model.set_env(self.env)
+            print(f"Model loaded from cache: {path}")
+        self.model = model
@@ -0,0 +1,84 @@
+from multiprocessing.connection import wait
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from src.utils.shared_memory_vec_env import _FLAT_KEY, SharedMemoryVecEnv
+
+
+class AsyncSharedMemoryVecEnv(SharedMemoryVecEnv):
+    """Shared-memory vec env that can also be stepped one worker at a time.
+
+    ``send`` hands actions to a subset of workers and ``poll`` returns whichever of the busy
+    workers have finished, so the learner never waits for the slowest env (including its
+    auto-reset). The regular ``step``/``reset`` API still works synchronously, which keeps the
+    class usable by on-policy algorithms and evaluation code.
+
+    Commands that need a reply (``env_method``, ``get_attr``, ...) first collect the pending
+    step result of the targeted workers and hand it out on the next ``poll``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending: Set[int] = set()
+        self._stash: Dict[int, Tuple[Dict[str, Any], Dict[str, Any], float]] = {}
+        self.reset_count = 0
+
+    def send(self, actions: Sequence[Any], indices: Sequence[int]) -> None:
+        for action, i in zip(actions, indices):
+            if i in self.pending:
+                raise RuntimeError(f"Env {i} is still stepping")
+            self.remotes[i].send(("step", action))
+            self.pending.add(i)
+
+    def poll(self, timeout: Optional[float] = None) -> Tuple[List[int], Any, np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+        """Waits for at least one pending worker and returns (indices, obs, rewards, dones, infos) of the ready ones."""
+        ready = [i for i in self.pending if i in self._stash]
+        if not ready:
+            connections = {self.remotes[i]: i for i in self.pending}
+            ready = [connections[conn] for conn in wait(list(connections), timeout)]
+        indices = sorted(ready)
+
+        infos = []
+        for i in indices:
+            info, self.reset_infos[i], busy = self._stash.pop(i) if i in self._stash else self.remotes[i].recv()
+            self.busy_time[i] += busy
+            self.pending.discard(i)
+            infos.append(info)
+
+        # Each worker only writes its own row and waits for a new action, so these rows are stable.
+        dones = self._buffers["dones"][_FLAT_KEY][indices].copy()
+        for k in np.flatnonzero(dones):
+            infos[k]["terminal_observation"] = self._read_obs("terminal_obs", indices[k])
+        return indices, self._read_obs("obs", indices), self._buffers["rewards"][_FLAT_KEY][indices].copy(), dones, infos
+
+    def _collect_pending(self, indices: Sequence[int]) -> None:
+        for i in indices:
+            if i in self.pending and i not in self._stash:
+                self._stash[i] = self.remotes[i].recv()
+
+    def _drain(self) -> None:
+        self._collect_pending(list(self.pending))
+        self.pending.clear()
+        self._stash.clear()
+
+    def _get_target_remotes(self, indices) -> List[Any]:
+        indices = self._get_indices(indices)
+        self._collect_pending(indices)
+        return [self.remotes[i] for i in indices]
+
+    def step_async(self, actions: np.ndarray) -> None:
+        if self.pending:
+            raise RuntimeError("step() cannot be mixed with pending send() calls; poll() them first")
+        super().step_async(actions)
+
+    def reset(self):
+        # In-flight transitions belong to episodes that are about to be discarded anyway.
+        self._drain()
+        self.reset_count += 1
+        return super().reset()
+
+    def close(self) -> None:
+        if not self.closed:
+            self._drain()
+        super().close()
@@ -1,11 +1,22 @@
+import copy
+import json
 import os
-from stable_baselines3.common.callbacks import BaseCallback
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+from stable_baselines3.common.callbacks import BaseCallback, CheckpointCallback
+from stable_baselines3.common.vec_env import VecEnv
+
+from src.utils.checkpointing import Checkpointer, CheckpointWriter, ModelSnapshot, snapshot_model, write_model_snapshot
+from src.utils.evaluation import evaluate_policy_batched
+from src.utils.profiling import StackSampler, TimedVecEnv
 
 class SaveHalfwayCallback(BaseCallback):
    
-    def __init__(self, save_path: str, total_timesteps: int, verbose: int = 0):
+    def __init__(self, save_path: str, total_timesteps: int, writer: Optional[CheckpointWriter] = None, verbose: int = 0):
         super().__init__(verbose)
         self.save_path = save_path
+        self.writer = writer
         self.halfway_point = total_timesteps // 2
         self.has_saved = False
 
@@ -17,7 +28,299 @@ class SaveHalfwayCallback(BaseCallback):
             
             os.makedirs(os.path.dirname(self.save_path), exist_ok=True)
             
-            self.model.save(self.save_path)
+            if self.writer is not None:
+                self.writer.save_model(self.model, self.save_path)
+            else:
+                self.model.save(self.save_path)
             self.has_saved = True
             
-        return True
\ No newline at end of file
+        return True
+
+
+class BackgroundCheckpointCallback(BaseCallback):
+    """Like ``CheckpointCallback``, but only snapshots on the training thread; writing happens in the background."""
+
+    def __init__(self, checkpointer: Checkpointer, save_freq: int, verbose: int = 0):
+        super().__init__(verbose)
+        self.checkpointer = checkpointer
+        self.save_freq = save_freq
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.save_freq == 0:
+            self.checkpointer.save(self.model)
+        return True
+
+    def _on_training_end(self) -> None:
+        self.checkpointer.writer.flush()
+
+
+class ParallelEvalCallback(BaseCallback):
+    """Evaluates a copy of the policy on its own vec env on a background thread while training continues.
+
+    Every ``eval_freq`` timesteps (once the previous evaluation is done) the policy is copied and
+    ``n_episodes`` are run with ``evaluate_policy_batched``; the eval env is re-seeded with ``seed``
+    each time, so successive evaluations start from the same scenes. A model snapshot taken with
+    the copy is written to ``best_model_path`` whenever ``metric`` improves. Training stops once
+    the reward/success thresholds hold for ``threshold_evals`` evaluations in a row, or after
+    ``patience`` evaluations without an improvement of more than ``min_delta``.
+    """
+
+    METRICS = ("mean_return", "success_rate")
+
+    def __init__(self, eval_env: VecEnv, eval_freq: int, n_episodes: int, best_model_path: str,
+                 writer: Optional[CheckpointWriter] = None, metric: str = "mean_return",
+                 reward_threshold: Optional[float] = None, success_threshold: Optional[float] = None,
+                 threshold_evals: int = 1, patience: Optional[int] = None, min_delta: float = 0.0,
+                 seed: Optional[int] = None, history_path: Optional[str] = None, verbose: int = 0):
+        super().__init__(verbose)
+        if metric not in self.METRICS:
+            raise ValueError(f"Unknown evaluation metric '{metric}'. Choose from: {self.METRICS}")
+        self.eval_env = eval_env
+        self.eval_freq = eval_freq
+        self.n_episodes = n_episodes
+        self.best_model_path = best_model_path
+        self.writer = writer
+        self.metric = metric
+        self.reward_threshold = reward_threshold
+        self.success_threshold = success_threshold
+        self.threshold_evals = threshold_evals
+        self.patience = patience
+        self.min_delta = min_delta
+        self.seed = seed
+        self.history_path = history_path
+
+        self.best_score = -float("inf")
+        self.history: List[Dict[str, Any]] = []
+        self._next_eval = eval_freq
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="parallel-eval")
+        self._pending: Optional[Future] = None
+        self._pending_snapshot: Optional[ModelSnapshot] = None
+        self._threshold_streak = 0
+        self._stale_evals = 0
+        self._stop_reason: Optional[str] = None
+
+    def _init_callback(self) -> None:
+        # A resumed run keeps its best score, so a worse first evaluation does not replace the best model.
+        self._next_eval = self.model.num_timesteps + self.eval_freq
+        if self.model.num_timesteps > 0 and self.history_path is not None and os.path.exists(self.history_path):
+            with open(self.history_path, 'r') as f:
+                previous = json.load(f)
+            if previous.get("metric") == self.metric:
+                self.history = [e for e in previous["evaluations"] if e["timesteps"] <= self.model.num_timesteps]
+                # Replaying the kept evaluations restores the patience and threshold counters as of the checkpoint.
+                for report in self.history:
+                    self._track_progress(report)
+                self.best_score = previous["best_score"]
+                self._check_stop()
+
+    def _evaluate(self, policy: Any, timesteps: int) -> Dict[str, Any]:
+        if self.seed is not None:
+            self.eval_env.seed(self.seed)
+        report = evaluate_policy_batched(policy, self.eval_env, n_episodes=self.n_episodes)
+        report["timesteps"] = timesteps
+        return report
+
+    def _start_evaluation(self) -> None:
+        policy = copy.deepcopy(self.model.policy)
+        policy.set_training_mode(False)
+        self._pending_snapshot = snapshot_model(self.model)
+        self._pending = self._executor.submit(self._evaluate, policy, self.num_timesteps)
+
+    def _on_step(self) -> bool:
+        if self._pending is not None and self._pending.done():
+            self._finish_evaluation()
+        if self._pending is None and self.num_timesteps >= self._next_eval:
+            self._start_evaluation()
+            self._next_eval = self.num_timesteps + self.eval_freq
+        return self._stop_reason is None
+
+    def _finish_evaluation(self) -> None:
+        report = self._pending.result()
+        snapshot = self._pending_snapshot
+        self._pending = None
+        self._pending_snapshot = None
+        self.history.append(report)
+
+        for key in ("mean_return", "mean_length", "success_rate", "collision_rate"):
+            self.logger.record(f"eval/{key}", report[key])
+        print(f"\n📏 Eval at {report['timesteps']} timesteps: return {report['mean_return']:.2f} ± {report['std_return']:.2f}, "
+              f"success {report['success_rate']:.2f}, collisions {report['collision_rate']:.2f}")
+
+        if self._track_progress(report):
+            self._save_best(snapshot, report)
+
+        self._check_stop()
+
+        if self.history_path is not None:
+            os.makedirs(os.path.dirname(self.history_path) or ".", exist_ok=True)
+            with open(self.history_path, 'w') as f:
+                json.dump({"best_score": self.best_score, "metric": self.metric, "stop_reason": self._stop_reason,
+                           "evaluations": self.history}, f, indent=2)
+
+    def _check_stop(self) -> None:
+        thresholds_active = self.reward_threshold is not None or self.success_threshold is not None
+        if thresholds_active and self._threshold_streak >= self.threshold_evals:
+            self._stop_reason = f"threshold held for {self._threshold_streak} evaluation(s)"
+        elif self.patience is not None and self._stale_evals >= self.patience:
+            self._stop_reason = f"no improvement in {self._stale_evals} evaluations"
+        if self._stop_reason is not None:
+            print(f"🛑 Stopping early at {self.model.num_timesteps} timesteps: {self._stop_reason}")
+
+    def _track_progress(self, report: Dict[str, Any]) -> bool:
+        """Updates the best score and the stop counters with one evaluation; True if it is a new best."""
+        score = report[self.metric]
+        if score > self.best_score + self.min_delta:
+            self._stale_evals = 0
+        else:
+            self._stale_evals += 1
+
+        thresholds = [(self.reward_threshold, report["mean_return"]), (self.success_threshold, report["success_rate"])]
+        active = [(threshold, value) for threshold, value in thresholds if threshold is not None]
+        if active and all(value >= threshold for threshold, value in active):
+            self._threshold_streak += 1
+        else:
+            self._threshold_streak = 0
+
+        if score > self.best_score:
+            self.best_score = score
+            return True
+        return False
+
+    def _save_best(self, snapshot: ModelSnapshot, report: Dict[str, Any]) -> None:
+        message = f"🏆 New best {self.metric} {report[self.metric]:.3f} at {report['timesteps']} timesteps, saved to"
+
+        def job() -> None:
+            print(message, write_model_snapshot(snapshot, self.best_model_path))
+        if self.writer is None:
+            job()
+        else:
+            self.writer.submit(job)
+
+    def _on_training_end(self) -> None:
+        # The last evaluation can still produce the best model.
+        if self._pending is not None:
+            self._finish_evaluation()
+        self._executor.shutdown()
+        self.eval_env.close()
+
+
+# Callbacks whose time is booked as checkpoint I/O by PhaseTimingCallback.
+CHECKPOINT_CALLBACKS = (SaveHalfwayCallback, CheckpointCallback, BackgroundCheckpointCallback)
+
+
+class PhaseTimingCallback(BaseCallback):
+    """Splits training wall time into env stepping, policy inference, gradient updates,
+    checkpoint I/O and callback overhead, and logs it under ``time/`` next to ``time/fps``.
+
+    Takes over dispatching to the other training callbacks so each one can be timed; the
+    checkpointing ones count as checkpoint I/O. With ``profile_window`` set to ``(start, end)``
+    timesteps, a sampling profiler runs over that window and writes a folded-stack file to
+    ``profile_dir``.
+    """
+
+    PHASES = ("env", "inference", "train", "checkpoint", "callbacks")
+
+    def __init__(self, callbacks: List[BaseCallback], profile_window: Optional[Sequence[int]] = None,
+                 sample_interval_ms: float = 5.0, profile_dir: str = "logs/profiles", run_name: str = "training",
+                 verbose: int = 0):
+        super().__init__(verbose)
+        self.callbacks = callbacks
+        self.run_name = run_name
+        self.profile_window = tuple(profile_window) if profile_window else None
+        self.profile_dir = profile_dir
+        self.sampler = StackSampler(interval=sample_interval_ms / 1000.0)
+        self.totals = {phase: 0.0 for phase in self.PHASES}
+        self._profiled = False
+
+    def _init_callback(self) -> None:
+        for callback in self.callbacks:
+            callback.init_callback(self.model)
+
+    def update_child_locals(self, locals_: Dict[str, Any]) -> None:
+        for callback in self.callbacks:
+            callback.update_locals(locals_)
+
+    def _dispatch(self, method: str, *args) -> bool:
+        continue_training = True
+        for callback in self.callbacks:
+            start = time.perf_counter()
+            result = getattr(callback, method)(*args)
+            phase = "checkpoint" if isinstance(callback, CHECKPOINT_CALLBACKS) else "callbacks"
+            self.totals[phase] += time.perf_counter() - start
+            if result is False:
+                continue_training = False
+        return continue_training
+
+    def _on_training_start(self) -> None:
+        self._original_env = self.model.env
+        self.timed_env = TimedVecEnv(self.model.env)
+        self.model.env = self.timed_env
+
+        self._training_start = time.perf_counter()
+        self._last_rollout_end: Optional[float] = None
+        self._dispatch("on_training_start", self.locals, self.globals)
+
+    def _on_rollout_start(self) -> None:
+        now = time.perf_counter()
+        if self._last_rollout_end is not None:
+            self.totals["train"] += now - self._last_rollout_end
+        self._rollout_start = now
+        self._rollout_totals = dict(self.totals, env=self.timed_env.total_time)
+        self._dispatch("on_rollout_start")
+
+    def _on_step(self) -> bool:
+        self._update_profiler()
+        return self._dispatch("on_step")
+
+    def _on_rollout_end(self) -> None:
+        self._dispatch("on_rollout_end")
+        now = time.perf_counter()
+        env_time = self.timed_env.total_time - self._rollout_totals["env"]
+        overhead = sum(self.totals[p] - self._rollout_totals[p] for p in ("checkpoint", "callbacks"))
+        self.totals["env"] += env_time
+        self.totals["inference"] += max(now - self._rollout_start - env_time - overhead, 0.0)
+        self._last_rollout_end = now
+        self._record()
+
+    def _on_training_end(self) -> None:
+        if self._last_rollout_end is not None:
+            self.totals["train"] += time.perf_counter() - self._last_rollout_end
+            self._last_rollout_end = None
+        self._dispatch("on_training_end")
+        self._stop_profiler()
+        self._record()
+        self.model.env = self._original_env
+
+        wall = max(time.perf_counter() - self._training_start, 1e-9)
+        print("\n⏱️ Training time by phase:")
+        for phase in self.PHASES:
+            print(f"   {phase:<11} {self.totals[phase]:9.1f}s  ({100 * self.totals[phase] / wall:5.1f}%)")
+
+    def _record(self) -> None:
+        wall = max(time.perf_counter() - self._training_start, 1e-9)
+        for phase in self.PHASES:
+            self.logger.record(f"time/{phase}_s", self.totals[phase])
+            self.logger.record(f"time/{phase}_share", self.totals[phase] / wall)
+        self.logger.record("time/env_ipc_wait_s", self.timed_env.wait_time)
+
+    def _update_profiler(self) -> None:
+        if self.profile_window is None or self._profiled:
+            return
+        start, end = self.profile_window
+        if not self.sampler.running and start <= self.num_timesteps < end:
+            print(f"\n🔬 Sampling profiler started at {self.num_timesteps} timesteps")
+            self.sampler.start()
+        elif self.sampler.running and self.num_timesteps >= end:
+            self._stop_profiler()
+
+    def _stop_profiler(self) -> None:
+        if not self.sampler.running:
+            return
+        self.sampler.stop()
+        self._profiled = True
+        start, end = self.profile_window
+        path = os.path.join(self.profile_dir, f"{self.run_name}_{start}_{end}.folded")
+        self.sampler.dump(path)
+        print(f"🔬 Profile for timesteps [{start}, {end}) saved to {path}. Hottest functions:")
+        for function, count in self.sampler.top_functions():
+            print(f"   {count:6d}  {function}")
@@ -0,0 +1,336 @@
+import copy
+import glob
+import json
+import os
+import pickle
+import queue
+import threading
+import zipfile
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import stable_baselines3 as sb3
+import torch as th
+from stable_baselines3.common.base_class import BaseAlgorithm
+from stable_baselines3.common.buffers import ReplayBuffer
+from stable_baselines3.common.save_util import data_to_json
+from stable_baselines3.common.utils import get_system_info
+
+RESUME_FILE = "resume.json"
+BUFFER_DIR = "replay_buffer"
+
+# Per-row fields a buffer rewrites after the row was added: HerReplayBuffer stores the episode
+# length in every row of an episode once it ends.
+REWRITTEN_FIELDS = ("ep_length",)
+
+
+def _clone_tensors(obj: Any) -> Any:
+    if isinstance(obj, th.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: _clone_tensors(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_clone_tensors(value) for value in obj)
+    return copy.deepcopy(obj)
+
+
+@dataclass
+class ModelSnapshot:
+    """Everything ``BaseAlgorithm.save`` writes, captured so it can be written from another thread."""
+    data_json: str
+    params: Dict[str, Any]
+    pytorch_variables: Dict[str, Any]
+
+
+def snapshot_model(model: BaseAlgorithm) -> ModelSnapshot:
+    """Same selection as ``BaseAlgorithm.save``, but tensors are cloned and the rest is serialized now,
+    so training can keep mutating the model while the snapshot is written."""
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for torch_var in state_dicts_names + torch_variable_names:
+        exclude.add(torch_var.split(".")[0])
+    for param_name in exclude:
+        data.pop(param_name, None)
+
+    pytorch_variables = {}
+    for name in torch_variable_names:
+        obj = model
+        for attr in name.split("."):
+            obj = getattr(obj, attr)
+        pytorch_variables[name] = _clone_tensors(obj)
+
+    return ModelSnapshot(
+        data_json=data_to_json(data),
+        params=_clone_tensors(model.get_parameters()),
+        pytorch_variables=pytorch_variables,
+    )
+
+
+def write_model_snapshot(snapshot: ModelSnapshot, path: str) -> str:
+    """Writes a zip that ``Algorithm.load`` reads like one from ``model.save``; atomic via rename."""
+    if not path.endswith(".zip"):
+        path += ".zip"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with zipfile.ZipFile(tmp_path, mode="w") as archive:
+        archive.writestr("data", snapshot.data_json)
+        with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as f:
+            th.save(snapshot.pytorch_variables, f)
+        for file_name, state_dict in snapshot.params.items():
+            with archive.open(file_name + ".pth", mode="w", force_zip64=True) as f:
+                th.save(state_dict, f)
+        archive.writestr("_stable_baselines3_version", sb3.__version__)
+        archive.writestr("system_info.txt", get_system_info(print_info=False)[1])
+    os.replace(tmp_path, path)
+    return path
+
+
+class CheckpointWriter:
+    """Single background thread that writes submitted jobs in order.
+
+    At most ``max_pending`` snapshots wait in memory; ``submit`` blocks beyond that, so a slow disk
+    slows training down instead of exhausting RAM. Errors from the thread are re-raised by the
+    next ``submit``/``flush``.
+    """
+
+    def __init__(self, max_pending: int = 2):
+        self._queue: "queue.Queue[Optional[Callable[[], None]]]" = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                job()
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"Background checkpoint write failed: {error}") from error
+
+    def submit(self, job: Callable[[], None]) -> None:
+        self._raise_error()
+        self._queue.put(job)
+
+    def save_model(self, model: BaseAlgorithm, path: str, message: Optional[str] = None) -> None:
+        snapshot = snapshot_model(model)
+
+        def job() -> None:
+            written = write_model_snapshot(snapshot, path)
+            if message:
+                print(f"{message} {written}")
+        self.submit(job)
+
+    def flush(self) -> None:
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+
+
+def _row_arrays(buffer: ReplayBuffer) -> Dict[str, np.ndarray]:
+    """Every per-transition array of the buffer (first axis == buffer_size), dict spaces flattened to ``name.key``."""
+    arrays = {}
+    derived = getattr(buffer, "_derived_attributes", ())
+    for name, value in vars(buffer).items():
+        if name in derived:
+            continue
+        if isinstance(value, np.ndarray) and value.ndim >= 1 and value.shape[0] == buffer.buffer_size:
+            arrays[name] = value
+        elif isinstance(value, dict) and value and all(isinstance(v, np.ndarray) and v.shape[:1] == (buffer.buffer_size,) for v in value.values()):
+            arrays.update({f"{name}.{key}": v for key, v in value.items()})
+    return arrays
+
+
+def _set_rows(buffer: ReplayBuffer, name: str, rows: np.ndarray, indices: np.ndarray) -> None:
+    attr, _, key = name.partition(".")
+    target = getattr(buffer, attr)
+    (target[key] if key else target)[indices] = rows
+
+
+def _buffer_state(buffer: ReplayBuffer) -> Dict[str, Any]:
+    # HerReplayBuffer keeps a reference to the (unpicklable) vec env; derived attributes are rebuilt on restore.
+    skip = {name.partition(".")[0] for name in _row_arrays(buffer)} | {"env", *getattr(buffer, "_derived_attributes", ())}
+    return {name: value for name, value in vars(buffer).items() if name not in skip}
+
+
+def _oldest_open_row(buffer: ReplayBuffer) -> int:
+    """First row whose ``REWRITTEN_FIELDS`` may still change (start of the oldest unfinished episode)."""
+    ep_start = getattr(buffer, "_current_ep_start", None)
+    if ep_start is None:
+        return buffer.pos
+    lag = int(((buffer.pos - np.asarray(ep_start)) % buffer.buffer_size).max())
+    return (buffer.pos - lag) % buffer.buffer_size
+
+
+@dataclass
+class _BufferCursor:
+    # Oldest row that may still be rewritten, and the buffer position/timesteps at the last checkpoint.
+    start: int = 0
+    pos: int = 0
+    num_timesteps: int = 0
+    segments: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class _BufferJob:
+    rows: Dict[str, np.ndarray]
+    segment: Dict[str, Any]
+    segments: List[Dict[str, Any]]
+    state: bytes
+    cursor: _BufferCursor
+
+
+class Checkpointer:
+    """Periodic resumable checkpoints: model zip plus an incrementally persisted replay buffer.
+
+    Each ``save`` snapshots the model and only the replay buffer rows written since the previous
+    checkpoint, plus the ``REWRITTEN_FIELDS`` of episodes that were still open at the previous one,
+    then hands compression and disk writes to the ``CheckpointWriter`` thread. ``resume.json`` is
+    rewritten last and is the commit point: it always names a complete model and buffer.
+    """
+
+    def __init__(self, checkpoint_dir: str, writer: CheckpointWriter, name_prefix: str = "checkpoint",
+                 save_replay_buffer: bool = True, resume: bool = False):
+        self.checkpoint_dir = checkpoint_dir
+        self.buffer_dir = os.path.join(checkpoint_dir, BUFFER_DIR)
+        self.writer = writer
+        self.name_prefix = name_prefix
+        self.save_replay_buffer = save_replay_buffer
+        self._cursor = _BufferCursor()
+        # A resumed run keeps appending to the segments of the checkpoint it started from.
+        manifest = read_resume_manifest(checkpoint_dir) if resume else None
+        if manifest is not None and manifest.get("replay_buffer"):
+            rb = manifest["replay_buffer"]
+            self._cursor = _BufferCursor(rb["next_start"], rb["pos"], manifest["num_timesteps"], rb["segments"])
+
+    def save(self, model: BaseAlgorithm) -> None:
+        num_timesteps = model.num_timesteps
+        model_path = os.path.join(self.checkpoint_dir, f"{self.name_prefix}_{num_timesteps}_steps.zip")
+        snapshot = snapshot_model(model)
+
+        buffer = getattr(model, "replay_buffer", None)
+        buffer_job = None
+        if self.save_replay_buffer and isinstance(buffer, ReplayBuffer):
+            buffer_job = self._snapshot_buffer(buffer, num_timesteps)
+
+        def job() -> None:
+            write_model_snapshot(snapshot, model_path)
+            manifest: Dict[str, Any] = {"num_timesteps": num_timesteps, "model": os.path.basename(model_path), "replay_buffer": None}
+            stale: List[str] = []
+            if buffer_job is not None:
+                manifest["replay_buffer"], stale = self._write_buffer(buffer_job, num_timesteps)
+            _write_json_atomic(os.path.join(self.checkpoint_dir, RESUME_FILE), manifest)
+            for path in stale:
+                os.remove(path)
+            print(f"💾 Checkpoint saved at {num_timesteps} timesteps: {model_path}")
+        self.writer.submit(job)
+
+    def _snapshot_buffer(self, buffer: ReplayBuffer, num_timesteps: int) -> _BufferJob:
+        size, cursor = buffer.buffer_size, self._cursor
+        arrays = _row_arrays(buffer)
+        rows: Dict[str, np.ndarray] = {}
+        new_rows = max(num_timesteps - cursor.num_timesteps, 0) // buffer.n_envs
+        covered = sum(segment["rows"] for segment in cursor.segments)
+        if not cursor.segments or new_rows >= size or covered + new_rows >= 2 * size:
+            # First checkpoint, every row was overwritten since the last one, or the segments already
+            # hold twice the buffer: start over from a full base segment.
+            segments: List[Dict[str, Any]] = []
+            segment = {"start": 0, "rows": size if buffer.full else buffer.pos, "patch_start": 0, "patch_rows": 0}
+        else:
+            segments = list(cursor.segments)
+            segment = {"start": cursor.pos, "rows": (buffer.pos - cursor.pos) % size,
+                       "patch_start": cursor.start, "patch_rows": (cursor.pos - cursor.start) % size}
+            patch = (segment["patch_start"] + np.arange(segment["patch_rows"])) % size
+            rows.update({f"patch/{name}": arrays[name][patch] for name in REWRITTEN_FIELDS if name in arrays})
+        indices = (segment["start"] + np.arange(segment["rows"])) % size
+        rows.update({name: array[indices] for name, array in arrays.items()})
+
+        segment["file"] = f"segment_{num_timesteps}.npz"
+        segments.append(segment)
+        self._cursor = _BufferCursor(_oldest_open_row(buffer), buffer.pos, num_timesteps, segments)
+        return _BufferJob(
+            rows=rows,
+            segment=segment,
+            segments=segments,
+            state=pickle.dumps(_buffer_state(buffer)),
+            cursor=self._cursor,
+        )
+
+    def _write_buffer(self, job: _BufferJob, num_timesteps: int) -> Tuple[Dict[str, Any], List[str]]:
+        os.makedirs(self.buffer_dir, exist_ok=True)
+        segment_path = os.path.join(self.buffer_dir, job.segment["file"])
+        with open(segment_path + ".tmp", "wb") as f:
+            np.savez_compressed(f, **job.rows)
+        os.replace(segment_path + ".tmp", segment_path)
+
+        state_file = f"state_{num_timesteps}.pkl"
+        with open(os.path.join(self.buffer_dir, state_file), "wb") as f:
+            f.write(job.state)
+
+        # Files no longer referenced (older states, segments replaced by a base) go once resume.json moved on.
+        keep = {s["file"] for s in job.segments} | {state_file}
+        stale = [p for p in glob.glob(os.path.join(self.buffer_dir, "*")) if os.path.basename(p) not in keep]
+        manifest = {"state": state_file, "segments": job.segments, "next_start": job.cursor.start, "pos": job.cursor.pos}
+        return manifest, stale
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]) -> None:
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def read_resume_manifest(checkpoint_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(checkpoint_dir, RESUME_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def restore_replay_buffer(model: BaseAlgorithm, checkpoint_dir: str, manifest: Dict[str, Any]) -> None:
+    """Rebuilds ``model.replay_buffer`` in place from the state file and segments named by ``manifest``."""
+    rb_manifest = manifest.get("replay_buffer")
+    buffer = getattr(model, "replay_buffer", None)
+    if not rb_manifest or buffer is None:
+        return
+    buffer_dir = os.path.join(checkpoint_dir, BUFFER_DIR)
+    with open(os.path.join(buffer_dir, rb_manifest["state"]), "rb") as f:
+        state = pickle.load(f)
+    state.pop("device", None)
+    if (state["buffer_size"], state["n_envs"]) != (buffer.buffer_size, buffer.n_envs):
+        raise ValueError(f"Checkpointed replay buffer has {state['buffer_size']} rows x {state['n_envs']} envs, "
+                         f"the new one {buffer.buffer_size} x {buffer.n_envs}; resume with the same n_envs and buffer_size.")
+    vars(buffer).update(state)
+
+    size = buffer.buffer_size
+    for segment in rb_manifest["segments"]:
+        indices = (segment["start"] + np.arange(segment["rows"])) % size
+        patch = (segment["patch_start"] + np.arange(segment["patch_rows"])) % size
+        with np.load(os.path.join(buffer_dir, segment["file"]), allow_pickle=True) as rows:
+            for name in rows.files:
+                if name.startswith("patch/"):
+                    _set_rows(buffer, name[len("patch/"):], rows[name], patch)
+            for name in rows.files:
+                if not name.startswith("patch/"):
+                    _set_rows(buffer, name, rows[name], indices)
+    if hasattr(buffer, "rebuild_derived"):
+        buffer.rebuild_derived()
+
+    if hasattr(buffer, "truncate_last_trajectory"):
+        # The envs restart from fresh episodes, so HER must close the ones that were open.
+        buffer.truncate_last_trajectory()
@@ -0,0 +1,78 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+
+def episode_success(info: Dict[str, Any]) -> Optional[bool]:
+    """Goal reached flag for the envs that define one (parking, intersection), else None."""
+    if "is_success" in info:
+        return bool(info["is_success"])
+    rewards = info.get("rewards")
+    if isinstance(rewards, dict) and "arrived_reward" in rewards:
+        return bool(rewards["arrived_reward"])
+    return None
+
+
+def episode_outcome(info: Dict[str, Any]) -> Tuple[bool, bool]:
+    """(crashed, success) of a finished episode."""
+    crashed = bool(info.get("crashed", False))
+    success = episode_success(info)
+    if success is None:
+        # No explicit goal in this env (merge, racetrack): a collision-free episode counts as success.
+        success = not crashed
+    return crashed, success
+
+
+def evaluate_policy_batched(model: Any, vec_env: VecEnv, n_episodes: int, deterministic: bool = True) -> Dict[str, Any]:
+    """Runs ``n_episodes`` headless episodes spread over every env of ``vec_env``.
+
+    ``model`` only needs a ``predict(obs, deterministic)`` method; it is called once per step
+    on the whole observation batch. Episodes are split evenly across envs up front so short
+    episodes do not bias the statistics.
+    """
+    if n_episodes < 1:
+        raise ValueError(f"n_episodes must be at least 1, got {n_episodes}")
+    n_envs = vec_env.num_envs
+    targets = np.array([(n_episodes + i) // n_envs for i in range(n_envs)], dtype=int)
+    counts = np.zeros(n_envs, dtype=int)
+    current_returns = np.zeros(n_envs)
+    current_lengths = np.zeros(n_envs, dtype=int)
+
+    returns, lengths, collisions, successes = [], [], [], []
+    total_steps = 0
+
+    start = time.perf_counter()
+    obs = vec_env.reset()
+    while (counts < targets).any():
+        actions, _ = model.predict(obs, deterministic=deterministic)
+        obs, rewards, dones, infos = vec_env.step(actions)
+        total_steps += int((counts < targets).sum())
+        current_returns += rewards
+        current_lengths += 1
+
+        for i in np.flatnonzero(dones):
+            if counts[i] < targets[i]:
+                returns.append(float(current_returns[i]))
+                lengths.append(int(current_lengths[i]))
+                crashed, success = episode_outcome(infos[i])
+                collisions.append(crashed)
+                successes.append(success)
+                counts[i] += 1
+            current_returns[i] = 0.0
+            current_lengths[i] = 0
+    elapsed = time.perf_counter() - start
+
+    return {
+        "episodes": len(returns),
+        "n_envs": n_envs,
+        "mean_return": float(np.mean(returns)),
+        "std_return": float(np.std(returns)),
+        "mean_length": float(np.mean(lengths)),
+        "std_length": float(np.std(lengths)),
+        "collision_rate": float(np.mean(collisions)),
+        "success_rate": float(np.mean(successes)),
+        "steps_per_sec": total_steps / max(elapsed, 1e-9),
+        "wall_time_sec": elapsed,
+    }
@@ -11,4 +11,8 @@ def load_config(config_path: str) -> Dict[str, Any]:
             config = yaml.safe_load(file)
             return config
         except yaml.YAMLError as exc:
-            raise ValueError(f"Error parsing YAML file: {exc}")
\ No newline at end of file
+            raise ValueError(f"Error parsing YAML file: {exc}")
+
+def model_dir(config: Dict[str, Any]) -> str:
+    """models/{env_id}, below ``agent_params.output_dir`` when a run has its own output directory."""
+    return os.path.join(config['agent_params'].get('output_dir', "."), "models", config['env_id'])
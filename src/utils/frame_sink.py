@@ -0,0 +1,108 @@
+import shutil
+import subprocess
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+def ffmpeg_executable() -> str:
+    path = shutil.which("ffmpeg")
+    if path is not None:
+        return path
+    try:
+        # moviepy ships a static ffmpeg build through imageio-ffmpeg.
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except ImportError:
+        raise RuntimeError("ffmpeg not found. Please install ffmpeg (e.g. via Homebrew: brew install ffmpeg).")
+
+
+class FFmpegFrameSink:
+    """Pipes raw RGB frames into one long-running ffmpeg/x264 process.
+
+    Frames are encoded as they arrive, so nothing is buffered in Python and no intermediate
+    video is written. ``output_size`` letterboxes the stream to a fixed resolution.
+    """
+
+    def __init__(self, path: str, frame_size: Tuple[int, int], fps: float, crf: int = 23,
+                 preset: str = "veryfast", output_size: Optional[Tuple[int, int]] = None):
+        self.path = path
+        self.frame_size = frame_size
+        width, height = frame_size
+
+        cmd = [
+            ffmpeg_executable(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}", "-r", f"{fps:g}",
+            "-i", "-",
+        ]
+        if output_size is not None:
+            w, h = output_size
+            cmd += ["-vf", f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1"]
+        else:
+            # x264 with yuv420p needs even dimensions.
+            cmd += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        cmd += [
+            "-an", "-c:v", "libx264", "-pix_fmt", "yuv420p",
+            "-crf", str(crf), "-preset", preset,
+            path,
+        ]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        self.frames_written = 0
+
+    def write(self, frame: np.ndarray) -> None:
+        height, width = frame.shape[:2]
+        if (width, height) != self.frame_size:
+            raise ValueError(f"Frame size {width}x{height} does not match sink size {self.frame_size[0]}x{self.frame_size[1]}")
+        self.process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+        self.frames_written += 1
+
+    def close(self) -> None:
+        if self.process.stdin and not self.process.stdin.closed:
+            self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed while writing {self.path} (exit code {self.process.returncode})")
+
+    def __enter__(self) -> "FFmpegFrameSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class LabelOverlay:
+    """White text on a translucent black box in the top-left corner, like ffmpeg's drawtext box."""
+
+    _cache: Dict[Tuple[str, int], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __init__(self, text: str, font_size: int = 28, margin: int = 10, box_alpha: float = 0.6):
+        self.margin = margin
+        self.box_alpha = box_alpha
+        key = (text, font_size)
+        if key not in self._cache:
+            self._cache[key] = self._render_text(text, font_size)
+        self.text_alpha, self.text_rgb = self._cache[key]
+
+    @staticmethod
+    def _render_text(text: str, font_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        import pygame
+
+        pygame.font.init()
+        surface = pygame.font.Font(None, font_size).render(text, True, (255, 255, 255))
+        alpha = pygame.surfarray.array_alpha(surface).T.astype(np.float32)[..., None] / 255.0
+        rgb = pygame.surfarray.array3d(surface).transpose(1, 0, 2).astype(np.float32)
+        return alpha, rgb
+
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        frame = frame.copy()
+        h, w = self.text_alpha.shape[:2]
+        y0 = x0 = self.margin
+        y1, x1 = min(y0 + h, frame.shape[0]), min(x0 + w, frame.shape[1])
+        if y1 <= y0 or x1 <= x0:
+            return frame
+
+        region = frame[y0:y1, x0:x1].astype(np.float32) * (1.0 - self.box_alpha)
+        alpha = self.text_alpha[:y1 - y0, :x1 - x0]
+        region = region * (1.0 - alpha) + self.text_rgb[:y1 - y0, :x1 - x0] * alpha
+        frame[y0:y1, x0:x1] = region.astype(np.uint8)
+        return frame
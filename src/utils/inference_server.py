@@ -0,0 +1,323 @@
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Every message is a 4-byte big-endian length followed by that many bytes of UTF-8 JSON.
+_HEADER = struct.Struct(">I")
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+DEFAULT_ADDRESS = "tcp:127.0.0.1:8765"
+DEFAULT_BATCH_WINDOW_MS = 2.0
+DEFAULT_MAX_BATCH_SIZE = 64
+
+Address = Union[str, Tuple[str, int]]
+
+
+def parse_address(address: str) -> Tuple[int, Address]:
+    """``unix:/path/to.sock`` or ``tcp:host:port`` (``host:port`` also works) -> (socket family, address)."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address[len("tcp:"):].rpartition(":") if address.startswith("tcp:") else address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _recv_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    chunks, remaining = [], n
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+    payload = json.dumps(message).encode()
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """The next message, or None once the peer closed the connection."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {length} bytes exceeds the {MAX_MESSAGE_BYTES} byte limit")
+    payload = _recv_exact(sock, length)
+    return None if payload is None else json.loads(payload)
+
+
+class LatencyStats:
+    """Thread-safe request latency percentiles, batch sizes and throughput since the last reset."""
+
+    def __init__(self, window: int = 100_000):
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latencies.clear()
+            self.requests = 0
+            self.batches = 0
+            self.inference_time = 0.0
+            self.started = time.perf_counter()
+
+    def record(self, latencies: List[float], inference_time: float) -> None:
+        with self._lock:
+            self._latencies.extend(latencies)
+            self.requests += len(latencies)
+            self.batches += 1
+            self.inference_time += inference_time
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            elapsed = time.perf_counter() - self.started
+            p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (0.0, 0.0)
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": self.requests / max(self.batches, 1),
+                "p50_ms": float(p50),
+                "p99_ms": float(p99),
+                "throughput_rps": self.requests / max(elapsed, 1e-9),
+                "mean_forward_ms": 1000.0 * self.inference_time / max(self.batches, 1),
+                "uptime_sec": elapsed,
+            }
+
+
+class _Request:
+    __slots__ = ("obs", "deterministic", "enqueued", "done", "action", "error", "batch_size", "latency")
+
+    def __init__(self, obs: Any, deterministic: bool):
+        self.obs = obs
+        self.deterministic = deterministic
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.action: Any = None
+        self.error: Optional[str] = None
+        self.batch_size = 0
+        self.latency = 0.0
+
+
+class MicroBatcher:
+    """Collects concurrent ``predict`` calls into batches and runs one forward pass per batch.
+
+    A batch is closed ``batch_window_s`` after its first request arrived, or earlier once it holds
+    ``max_batch_size`` requests, so the window bounds the latency added by batching.
+    """
+
+    def __init__(self, model: Any, batch_window_s: float = DEFAULT_BATCH_WINDOW_MS / 1000.0,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        self.model = model
+        self.batch_window_s = batch_window_s
+        self.max_batch_size = max_batch_size
+        self.stats = LatencyStats()
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def predict(self, obs: Any, deterministic: bool = True) -> _Request:
+        request = _Request(obs, deterministic)
+        self._queue.put(request)
+        request.done.wait()
+        return request
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch = [first]
+        deadline = first.enqueued + self.batch_window_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _forward(self, requests: List[_Request]) -> None:
+        if isinstance(requests[0].obs, dict):
+            obs = {key: np.stack([r.obs[key] for r in requests]) for key in requests[0].obs}
+        else:
+            obs = np.stack([r.obs for r in requests])
+        start = time.perf_counter()
+        actions, _ = self.model.predict(obs, deterministic=requests[0].deterministic)
+        now = time.perf_counter()
+        for request, action in zip(requests, actions):
+            request.action, request.batch_size, request.latency = action, len(requests), now - request.enqueued
+            request.done.set()
+        self.stats.record([r.latency for r in requests], now - start)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            for deterministic in (True, False):
+                group = [r for r in batch if r.deterministic is deterministic]
+                if not group:
+                    continue
+                try:
+                    self._forward(group)
+                except Exception as e:
+                    # Fail this group only; the batcher keeps serving later requests.
+                    for request in group:
+                        request.error = f"{type(e).__name__}: {e}"
+                        request.done.set()
+
+
+def _space_info(space: Any) -> Dict[str, Any]:
+    from gymnasium import spaces
+
+    if isinstance(space, spaces.Dict):
+        return {"type": "Dict", "spaces": {key: _space_info(sub) for key, sub in space.spaces.items()}}
+    if isinstance(space, spaces.Discrete):
+        return {"type": "Discrete", "n": int(space.n)}
+    return {"type": type(space).__name__, "shape": list(space.shape), "dtype": str(space.dtype),
+            "low": np.asarray(space.low).min().item(), "high": np.asarray(space.high).max().item()}
+
+
+def _to_obs(space: Any, raw: Any) -> Any:
+    from gymnasium import spaces
+
+    if isinstance(space, spaces.Dict):
+        return {key: _to_obs(sub, raw[key]) for key, sub in space.spaces.items()}
+    return np.asarray(raw, dtype=space.dtype).reshape(space.shape)
+
+
+class _PolicyHandler(socketserver.BaseRequestHandler):
+    server: "_ThreadingServer"
+
+    def handle(self) -> None:
+        batcher, space = self.server.batcher, self.server.batcher.model.observation_space
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (ConnectionError, ValueError):
+                return
+            if message is None:
+                return
+            reply: Dict[str, Any] = {"id": message.get("id")}
+            try:
+                cmd = message.get("cmd", "predict")
+                if cmd == "predict":
+                    request = batcher.predict(_to_obs(space, message["obs"]), bool(message.get("deterministic", True)))
+                    if request.error is not None:
+                        raise RuntimeError(request.error)
+                    reply.update(action=np.asarray(request.action).tolist(), batch_size=request.batch_size,
+                                 latency_ms=1000.0 * request.latency)
+                elif cmd == "stats":
+                    reply.update(batcher.stats.snapshot())
+                elif cmd == "reset_stats":
+                    batcher.stats.reset()
+                elif cmd == "info":
+                    reply.update(observation_space=_space_info(space), action_space=_space_info(batcher.model.action_space),
+                                 batch_window_ms=1000.0 * batcher.batch_window_s, max_batch_size=batcher.max_batch_size)
+                else:
+                    raise ValueError(f"Unknown command {cmd!r}")
+            except (KeyError, ValueError, TypeError, RuntimeError) as e:
+                reply = {"id": message.get("id"), "error": f"{type(e).__name__}: {e}"}
+            try:
+                send_message(self.request, reply)
+            except ConnectionError:
+                return
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, socketserver.BaseServer):
+    daemon_threads = True
+    batcher: MicroBatcher
+
+
+class _TCPServer(_ThreadingServer, socketserver.TCPServer):
+    allow_reuse_address = True
+
+    def server_bind(self) -> None:
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().server_bind()
+
+
+class _UnixServer(_ThreadingServer, socketserver.UnixStreamServer):
+    pass
+
+
+def serve_policy(model: Any, address: str = DEFAULT_ADDRESS, batch_window_ms: float = DEFAULT_BATCH_WINDOW_MS,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE) -> None:
+    """Serves ``model.predict`` on ``address`` until interrupted (one thread per client connection)."""
+    family, bind_address = parse_address(address)
+    if family == socket.AF_UNIX and os.path.exists(bind_address):
+        os.remove(bind_address)
+    server_cls = _UnixServer if family == socket.AF_UNIX else _TCPServer
+    batcher = MicroBatcher(model, batch_window_ms / 1000.0, max_batch_size)
+    with server_cls(bind_address, _PolicyHandler) as server:
+        server.batcher = batcher
+        print(f"🛰️ Serving policy on {address} (batch window {batch_window_ms} ms, max batch {max_batch_size})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(f"Stopping server: {json.dumps(batcher.stats.snapshot())}")
+        finally:
+            batcher.close()
+            if family == socket.AF_UNIX and os.path.exists(bind_address):
+                os.remove(bind_address)
+
+
+class PolicyClient:
+    """Blocking client for ``serve_policy``; needs neither SB3 nor torch."""
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, timeout: Optional[float] = None):
+        family, connect_address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.sock.connect(connect_address)
+        self._next_id = 0
+
+    def call(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        self._next_id += 1
+        send_message(self.sock, {"id": self._next_id, **message})
+        reply = recv_message(self.sock)
+        if reply is None:
+            raise ConnectionError("Server closed the connection")
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def predict(self, obs: Any, deterministic: bool = True) -> Any:
+        if isinstance(obs, dict):
+            obs = {key: np.asarray(value).tolist() for key, value in obs.items()}
+        else:
+            obs = np.asarray(obs).tolist()
+        return np.asarray(self.call({"cmd": "predict", "obs": obs, "deterministic": deterministic})["action"])
+
+    def stats(self) -> Dict[str, Any]:
+        return self.call({"cmd": "stats"})
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> "PolicyClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,80 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Bumped whenever the npz layout written by policy_export changes.
+FORMAT_VERSION = 1
+
+_ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0.0),
+    "tanh": np.tanh,
+}
+
+
+class NumpyPolicy:
+    """Deterministic MLP policy exported by ``policy_export``, evaluated with NumPy only.
+
+    Observation preprocessing (float cast, flattening, concatenating Dict keys in the order the
+    policy was trained with) and the action head (argmax, tanh rescaling or clipping to the action
+    bounds) are part of the artifact, so ``predict`` takes raw env observations. Int8 weights are
+    dequantized once on load.
+    """
+
+    def __init__(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported policy format {meta.get('format_version')}, expected {FORMAT_VERSION}")
+        self.meta = meta
+        self.obs_keys: Optional[List[str]] = meta["obs_keys"]
+        self.obs_shapes: Dict[str, List[int]] = meta["obs_shapes"]
+        self.layers = []
+        for layer in meta["layers"]:
+            if layer["type"] == "linear":
+                weight = arrays[f"{layer['name']}.weight"].astype(np.float32)
+                if layer.get("quantized"):
+                    weight *= arrays[f"{layer['name']}.scale"][:, None]
+                # Stored as (out, in) like torch; x @ W.T is done once here.
+                self.layers.append(("linear", np.ascontiguousarray(weight.T), arrays[f"{layer['name']}.bias"].astype(np.float32)))
+            elif layer["type"] in _ACTIVATIONS:
+                self.layers.append((layer["type"], None, None))
+            else:
+                raise ValueError(f"Unknown layer type {layer['type']!r}")
+        self.head = meta["head"]
+        self.low = np.asarray(self.head.get("low", 0.0), dtype=np.float32)
+        self.high = np.asarray(self.head.get("high", 0.0), dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyPolicy":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            arrays = {name: data[name] for name in data.files if name != "meta"}
+        return cls(meta, arrays)
+
+    def _features(self, obs: Any) -> Tuple[np.ndarray, bool]:
+        keys = self.obs_keys or [""]
+        parts = _by_key(obs, self.obs_keys)
+        first = np.asarray(parts[keys[0]])
+        batched = first.ndim > len(self.obs_shapes[keys[0]])
+        features = []
+        for key in keys:
+            value = np.asarray(parts[key], dtype=np.float32)
+            features.append(value.reshape(value.shape[0] if batched else 1, -1))
+        return np.concatenate(features, axis=1), batched
+
+    def predict(self, obs: Any) -> np.ndarray:
+        """Actions for one observation or a batch (leading batch axis), like ``model.predict(obs, deterministic=True)[0]``."""
+        x, batched = self._features(obs)
+        for kind, weight, bias in self.layers:
+            x = x @ weight + bias if kind == "linear" else _ACTIVATIONS[kind](x)
+
+        if self.head["type"] == "argmax":
+            actions = x.argmax(axis=1)
+        elif self.head["type"] == "tanh_scale":
+            actions = self.low + 0.5 * (np.tanh(x) + 1.0) * (self.high - self.low)
+        else:
+            actions = np.clip(x, self.low, self.high)
+        return actions if batched else actions[0]
+
+
+def _by_key(obs: Any, keys: Optional[List[str]]) -> Dict[str, Any]:
+    return obs if keys else {"": obs}
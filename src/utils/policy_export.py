@@ -0,0 +1,291 @@
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from gymnasium import spaces
+from stable_baselines3 import DQN, PPO, SAC
+from stable_baselines3.common.base_class import BaseAlgorithm
+from stable_baselines3.common.torch_layers import CombinedExtractor, FlattenExtractor
+from torch import nn
+
+from src.utils.numpy_policy import FORMAT_VERSION, NumpyPolicy
+
+EXPORT_FORMATS = ("torchscript", "numpy", "onnx")
+
+_ACTIVATIONS = {nn.ReLU: "relu", nn.Tanh: "tanh"}
+_TORCH_ACTIVATIONS = {"relu": nn.ReLU, "tanh": nn.Tanh}
+
+# (type, weight, bias) for linear layers, (type, None, None) for activations.
+Layer = Tuple[str, Optional[np.ndarray], Optional[np.ndarray]]
+
+
+def _obs_layout(model: BaseAlgorithm, extractor: nn.Module) -> Tuple[Optional[List[str]], Dict[str, List[int]]]:
+    space = model.observation_space
+    if isinstance(extractor, CombinedExtractor):
+        if not all(isinstance(sub, nn.Flatten) for sub in extractor.extractors.values()):
+            raise ValueError("Only Dict observations with flattened (non-image) keys can be exported")
+        keys = list(extractor.extractors.keys())
+        return keys, {key: list(space[key].shape) for key in keys}
+    if isinstance(extractor, FlattenExtractor) and isinstance(space, spaces.Box):
+        return None, {"": list(space.shape)}
+    raise ValueError(f"Only MLP policies on Box or Dict-of-Box observations can be exported, got {type(extractor).__name__}")
+
+
+def _layers(*modules: nn.Module) -> List[Layer]:
+    layers: List[Layer] = []
+    for module in modules:
+        for layer in (module if isinstance(module, nn.Sequential) else [module]):
+            if isinstance(layer, nn.Linear):
+                layers.append(("linear", layer.weight.detach().cpu().numpy().copy(), layer.bias.detach().cpu().numpy().copy()))
+            elif type(layer) in _ACTIVATIONS:
+                layers.append((_ACTIVATIONS[type(layer)], None, None))
+            else:
+                raise ValueError(f"Cannot export layer {layer}")
+    return layers
+
+
+def extract_policy(model: BaseAlgorithm) -> Tuple[Dict[str, Any], List[Layer]]:
+    """The deterministic action path of a DQN/PPO/SAC MLP policy as plain arrays plus a description."""
+    action_space = model.action_space
+    if isinstance(model, DQN):
+        extractor, layers = model.q_net.features_extractor, _layers(model.q_net.q_net)
+        head: Dict[str, Any] = {"type": "argmax"}
+    elif isinstance(model, SAC):
+        actor = model.actor
+        extractor, layers = actor.features_extractor, _layers(actor.latent_pi, actor.mu)
+        head = {"type": "tanh_scale", "low": action_space.low.tolist(), "high": action_space.high.tolist()}
+    elif isinstance(model, PPO):
+        policy = model.policy
+        extractor, layers = policy.pi_features_extractor, _layers(policy.mlp_extractor.policy_net, policy.action_net)
+        if isinstance(action_space, spaces.Discrete):
+            head = {"type": "argmax"}
+        elif isinstance(action_space, spaces.Box) and not policy.squash_output:
+            head = {"type": "clip", "low": action_space.low.tolist(), "high": action_space.high.tolist()}
+        else:
+            raise ValueError(f"Cannot export PPO with action space {action_space}")
+    else:
+        raise ValueError(f"Cannot export {type(model).__name__}")
+
+    obs_keys, obs_shapes = _obs_layout(model, extractor)
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "algorithm": type(model).__name__,
+        "obs_keys": obs_keys,
+        "obs_shapes": obs_shapes,
+        "action_shape": list(action_space.shape),
+        "head": head,
+    }
+    return meta, layers
+
+
+def _quantize_rows(weight: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Symmetric per-output-channel int8, the same scheme torch's dynamic quantization uses for weights.
+    scale = np.abs(weight).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    return np.round(weight / scale[:, None]).astype(np.int8), scale.astype(np.float32)
+
+
+def save_numpy_policy(meta: Dict[str, Any], layers: List[Layer], path: str, quantize: bool = False) -> None:
+    arrays: Dict[str, np.ndarray] = {}
+    described = []
+    for i, (kind, weight, bias) in enumerate(layers):
+        if kind != "linear":
+            described.append({"type": kind})
+            continue
+        name = f"l{i}"
+        if quantize:
+            arrays[f"{name}.weight"], arrays[f"{name}.scale"] = _quantize_rows(weight)
+        else:
+            arrays[f"{name}.weight"] = weight.astype(np.float32)
+        arrays[f"{name}.bias"] = bias.astype(np.float32)
+        described.append({"type": "linear", "name": name, "quantized": quantize})
+    meta = {**meta, "layers": described}
+    with open(path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+class _FlatPolicy(nn.Module):
+    def __init__(self, net: nn.Module, head: Dict[str, Any]):
+        super().__init__()
+        self.net = net
+        self.head = head["type"]
+        self.register_buffer("low", torch.as_tensor(head.get("low", 0.0), dtype=torch.float32))
+        self.register_buffer("high", torch.as_tensor(head.get("high", 0.0), dtype=torch.float32))
+
+    def forward(self, obs: torch.Tensor) -> torch.Tensor:
+        out = self.net(obs.float().reshape(obs.shape[0], -1))
+        if self.head == "argmax":
+            return out.argmax(dim=1)
+        if self.head == "tanh_scale":
+            return self.low + 0.5 * (torch.tanh(out) + 1.0) * (self.high - self.low)
+        return torch.max(torch.min(out, self.high), self.low)
+
+
+class _DictPolicy(nn.Module):
+    def __init__(self, keys: List[str], core: _FlatPolicy):
+        super().__init__()
+        self.keys = keys
+        self.core = core
+
+    def forward(self, obs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        parts = [obs[key].float().reshape(obs[key].shape[0], -1) for key in self.keys]
+        return self.core(torch.cat(parts, dim=1))
+
+
+def build_torch_policy(meta: Dict[str, Any], layers: List[Layer], quantize: bool = False) -> nn.Module:
+    modules: List[nn.Module] = []
+    for kind, weight, bias in layers:
+        if kind == "linear":
+            linear = nn.Linear(weight.shape[1], weight.shape[0])
+            linear.weight.data.copy_(torch.from_numpy(weight))
+            linear.bias.data.copy_(torch.from_numpy(bias))
+            modules.append(linear)
+        else:
+            modules.append(_TORCH_ACTIVATIONS[kind]())
+    net: nn.Module = nn.Sequential(*modules)
+    if quantize:
+        net = torch.ao.quantization.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+    core = _FlatPolicy(net, meta["head"])
+    policy = _DictPolicy(meta["obs_keys"], core) if meta["obs_keys"] else core
+    return policy.eval()
+
+
+def _flat_input_size(meta: Dict[str, Any]) -> int:
+    return sum(int(np.prod(shape)) for shape in meta["obs_shapes"].values())
+
+
+def export_policy(model: BaseAlgorithm, export_dir: str, formats: Sequence[str] = EXPORT_FORMATS,
+                  quantize: bool = False) -> Dict[str, str]:
+    """Writes the requested artifacts (fp32, plus int8 variants with ``quantize``); returns name -> path."""
+    unknown = set(formats) - set(EXPORT_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown export format(s) {sorted(unknown)}, choose from {EXPORT_FORMATS}")
+    os.makedirs(export_dir, exist_ok=True)
+    meta, layers = extract_policy(model)
+    variants = [False, True] if quantize else [False]
+    paths: Dict[str, str] = {}
+
+    for q in variants:
+        suffix = "_int8" if q else ""
+        if "numpy" in formats:
+            path = os.path.join(export_dir, f"policy{suffix}.npz")
+            save_numpy_policy(meta, layers, path, quantize=q)
+            paths[f"numpy{suffix}"] = path
+        if "torchscript" in formats:
+            path = os.path.join(export_dir, f"policy{suffix}.pt")
+            torch.jit.save(torch.jit.script(build_torch_policy(meta, layers, quantize=q)), path)
+            paths[f"torchscript{suffix}"] = path
+
+    if "onnx" in formats:
+        # Optional: needs the onnx exporter dependencies. Dict observations become one input, the
+        # keys concatenated in meta["obs_keys"] order (written next to it as policy.json).
+        path = os.path.join(export_dir, "policy.onnx")
+        core = build_torch_policy({**meta, "obs_keys": None}, layers)
+        try:
+            torch.onnx.export(core, (torch.zeros(1, _flat_input_size(meta)),), path, input_names=["obs"],
+                              output_names=["action"], dynamic_axes={"obs": {0: "batch"}, "action": {0: "batch"}})
+            paths["onnx"] = path
+        except (ImportError, ModuleNotFoundError, RuntimeError) as e:
+            print(f"⚠️ Skipping ONNX export: {e}")
+
+    with open(os.path.join(export_dir, "policy.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return paths
+
+
+def collect_observations(model: BaseAlgorithm, env: Any, n_samples: int, seed: int = 0) -> List[Any]:
+    """Observations visited by the (stochastic) policy, as a realistic input set for accuracy checks."""
+    observations = []
+    obs, _ = env.reset(seed=seed)
+    while len(observations) < n_samples:
+        observations.append(obs)
+        action, _ = model.predict(obs, deterministic=False)
+        obs, _, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
+            obs, _ = env.reset()
+    return observations
+
+
+def _stack(observations: List[Any]) -> Any:
+    if isinstance(observations[0], dict):
+        return {key: np.stack([obs[key] for obs in observations]) for key in observations[0]}
+    return np.stack(observations)
+
+
+def _median_ms(fn: Callable[[], Any], repeats: int) -> float:
+    fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000.0 * float(np.median(times))
+
+
+def _torch_runner(path: str) -> Callable[[Any], np.ndarray]:
+    policy = torch.jit.load(path)
+
+    def run(obs: Any) -> np.ndarray:
+        with torch.no_grad():
+            if isinstance(obs, dict):
+                return policy({key: torch.as_tensor(value) for key, value in obs.items()}).numpy()
+            return policy(torch.as_tensor(obs)).numpy()
+    return run
+
+
+def _onnx_runner(path: str, meta: Dict[str, Any]) -> Optional[Callable[[Any], np.ndarray]]:
+    try:
+        import onnxruntime
+    except ImportError:
+        return None
+    session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def run(obs: Any) -> np.ndarray:
+        if isinstance(obs, dict):
+            flat = np.concatenate([np.asarray(obs[key], dtype=np.float32).reshape(len(obs[key]), -1) for key in meta["obs_keys"]], axis=1)
+        else:
+            flat = np.asarray(obs, dtype=np.float32).reshape(len(obs), -1)
+        return session.run(None, {"obs": flat})[0]
+    return run
+
+
+def verify_export(model: BaseAlgorithm, paths: Dict[str, str], observations: List[Any], batch_size: int = 64,
+                  repeats: int = 200) -> Dict[str, Any]:
+    """Compares every artifact with ``model.predict(deterministic=True)`` and times batch-1 / batch-N inference."""
+    meta, _ = extract_policy(model)
+    batch = _stack(observations)
+    single = _stack(observations[:1])
+    small = _stack(observations[:batch_size])
+    reference, _ = model.predict(batch, deterministic=True)
+    discrete = meta["head"]["type"] == "argmax"
+
+    runners: Dict[str, Callable[[Any], np.ndarray]] = {"sb3": lambda obs: model.predict(obs, deterministic=True)[0]}
+    for name, path in paths.items():
+        if name.startswith("numpy"):
+            runners[name] = NumpyPolicy.load(path).predict
+        elif name.startswith("torchscript"):
+            runners[name] = _torch_runner(path)
+        elif name == "onnx":
+            runner = _onnx_runner(path, meta)
+            if runner is not None:
+                runners[name] = runner
+
+    report: Dict[str, Any] = {"samples": len(observations), "batch_size": batch_size, "artifacts": {}}
+    for name, run in runners.items():
+        actions = np.asarray(run(batch)).reshape(np.shape(reference))
+        entry: Dict[str, Any] = {
+            "latency_batch1_ms": _median_ms(lambda: run(single), repeats),
+            f"latency_batch{batch_size}_ms": _median_ms(lambda: run(small), repeats),
+        }
+        if name in paths:
+            entry["size_kb"] = os.path.getsize(paths[name]) / 1024.0
+        if discrete:
+            entry["action_agreement"] = float(np.mean(actions == reference))
+        else:
+            error = np.abs(actions.astype(np.float64) - reference)
+            entry.update(max_abs_error=float(error.max()), mean_abs_error=float(error.mean()))
+        report["artifacts"][name] = entry
+    return report
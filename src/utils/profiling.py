@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from stable_baselines3.common.vec_env import VecEnv, VecEnvWrapper
+
+
+class TimedVecEnv(VecEnvWrapper):
+    """Accumulates wall time spent sending actions and waiting for results (IPC included for SubprocVecEnv)."""
+
+    def __init__(self, venv: VecEnv):
+        super().__init__(venv)
+        self.send_time = 0.0
+        self.wait_time = 0.0
+
+    @property
+    def total_time(self) -> float:
+        return self.send_time + self.wait_time
+
+    def reset(self):
+        return self.venv.reset()
+
+    def step_async(self, actions) -> None:
+        start = time.perf_counter()
+        self.venv.step_async(actions)
+        self.send_time += time.perf_counter() - start
+
+    def step_wait(self):
+        start = time.perf_counter()
+        result = self.venv.step_wait()
+        self.wait_time += time.perf_counter() - start
+        return result
+
+    # Partial stepping of AsyncSharedMemoryVecEnv.
+    def send(self, actions, indices) -> None:
+        start = time.perf_counter()
+        self.venv.send(actions, indices)
+        self.send_time += time.perf_counter() - start
+
+    def poll(self, timeout: Optional[float] = None):
+        start = time.perf_counter()
+        result = self.venv.poll(timeout)
+        self.wait_time += time.perf_counter() - start
+        return result
+
+
+class StackSampler:
+    """Low-overhead sampling profiler for one thread.
+
+    A daemon thread snapshots the target thread's Python stack every ``interval`` seconds and
+    counts collapsed stacks, which ``dump`` writes in the folded format read by flamegraph.pl
+    and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def dump(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, n: int = 10):
+        leaves: Counter = Counter()
+        for stack, count in self.counts.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
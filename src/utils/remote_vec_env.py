@@ -0,0 +1,271 @@
+import atexit
+import multiprocessing as mp
+import os
+import secrets
+import socket
+import time
+from collections import defaultdict
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices
+
+from src.utils.inference_server import parse_address
+
+AUTHKEY_ENV_VAR = "ROLLOUT_AUTHKEY"
+DEFAULT_REMOTE_ADDRESS = "tcp:0.0.0.0:9100"
+DEFAULT_WORKER_VEC_ENV = "dummy"
+CONNECT_TIMEOUT = 60.0
+
+
+def _no_delay(conn: Connection) -> None:
+    # Messages above 16 KiB are sent as header + payload; without TCP_NODELAY, Nagle's algorithm
+    # holds the payload back until the header is acknowledged.
+    sock = socket.socket(fileno=os.dup(conn.fileno()))
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    finally:
+        sock.close()
+
+
+def _concat_obs(parts: List[Any]) -> Any:
+    if isinstance(parts[0], dict):
+        return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    return np.concatenate(parts)
+
+
+def run_rollout_worker(address: str, authkey: bytes, n_envs: int, backend: str = DEFAULT_WORKER_VEC_ENV,
+                       connect_timeout: float = CONNECT_TIMEOUT) -> None:
+    """Connects to a ``RemoteVecEnv`` learner and serves up to ``n_envs`` of its envs until it closes.
+
+    The learner sends the config; the envs are built locally with ``build_vec_env`` and any
+    local backend, so one round trip per step covers every env of the node.
+    """
+    from src.utils.vec_env_factory import VecEnvSettings, build_vec_env
+
+    _, target = parse_address(address)
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            conn = Client(target, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+    _no_delay(conn)
+
+    conn.send(("hello", {"n_envs": n_envs, "host": socket.gethostname(), "pid": os.getpid()}))
+    cmd, data = conn.recv()
+    if cmd == "close":
+        conn.close()
+        return
+    config, settings = data["config"], data["settings"]
+    venv = build_vec_env(config, VecEnvSettings(**dict(settings, backend=backend)), record_dir=data["record_dir"])
+    conn.send((venv.observation_space, venv.action_space))
+
+    try:
+        while True:
+            try:
+                cmd, data = conn.recv()
+            except (EOFError, ConnectionResetError):
+                break
+            if cmd == "step":
+                venv.step_async(data)
+                conn.send(venv.step_wait())
+            elif cmd == "reset":
+                first_seed, options = data
+                # The learner's seeds are seed + global index; seed() continues them for the local envs.
+                if first_seed is not None:
+                    venv.seed(first_seed)
+                venv.set_options(options)
+                obs = venv.reset()
+                conn.send((obs, venv.reset_infos))
+            elif cmd == "get_attr":
+                conn.send(venv.get_attr(data[0], data[1]))
+            elif cmd == "set_attr":
+                conn.send(venv.set_attr(data[0], data[1], data[2]))
+            elif cmd == "env_method":
+                conn.send(venv.env_method(data[0], *data[1], indices=data[3], **data[2]))
+            elif cmd == "is_wrapped":
+                conn.send(venv.env_is_wrapped(data[0], data[1]))
+            elif cmd == "get_images":
+                conn.send(venv.get_images())
+            elif cmd == "close":
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the rollout worker")
+    finally:
+        venv.close()
+        conn.close()
+
+
+def spawn_local_workers(address: str, authkey: bytes, envs_per_worker: Sequence[int],
+                        backend: str = DEFAULT_WORKER_VEC_ENV, start_method: Optional[str] = None) -> List[mp.Process]:
+    """Rollout worker processes on this machine, standing in for remote nodes."""
+    if start_method is None:
+        start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    ctx = mp.get_context(start_method)
+    processes = []
+    for n_envs in envs_per_worker:
+        # Not a daemon: workers with a subproc backend start processes of their own. They exit when the learner goes away.
+        process = ctx.Process(target=run_rollout_worker, args=(address, authkey, n_envs, backend), daemon=False)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+class RemoteVecEnv(VecEnv):
+    """Vec env whose envs live in rollout worker processes that connect over TCP.
+
+    The learner listens on ``address``; every worker that connects announces how many envs it
+    can host and gets a share of the ``n_envs`` until all are placed. ``step_async`` sends each
+    worker the actions for its envs at once, so the workers (and the local vec envs inside them)
+    step in parallel; observations, rewards, dones and infos come back as one batch per worker.
+    Connections are authenticated with ``authkey`` (HMAC), since messages are pickles.
+    """
+
+    def __init__(self, config: Dict[str, Any], n_envs: int, address: str = DEFAULT_REMOTE_ADDRESS,
+                 authkey: Optional[bytes] = None, local_workers: Sequence[int] = (),
+                 worker_vec_env: str = DEFAULT_WORKER_VEC_ENV, worker_threads: Optional[int] = None,
+                 start_method: Optional[str] = None, record_dir: Optional[str] = None):
+        if sum(local_workers) > n_envs:
+            raise ValueError(f"Local workers host {sum(local_workers)} envs, but only {n_envs} are needed")
+        if authkey is None:
+            if sum(local_workers) < n_envs:
+                raise ValueError(f"Remote rollout workers need a shared key: set {AUTHKEY_ENV_VAR} on the learner and every worker")
+            authkey = secrets.token_bytes(32)
+
+        family, target = parse_address(address)
+        if family != socket.AF_INET:
+            raise ValueError(f"RemoteVecEnv needs a tcp address, got {address}")
+        self.listener = Listener(target, family="AF_INET", authkey=authkey)
+        host, port = self.listener.address
+        connect_host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+        self.processes = spawn_local_workers(f"tcp:{connect_host}:{port}", authkey, local_workers,
+                                             backend=worker_vec_env, start_method=start_method)
+
+        settings = {"n_envs": 0, "worker_threads": worker_threads, "start_method": start_method}
+        self.conns: List[Connection] = []
+        self.offsets: List[int] = []
+        self.n_local_envs: List[int] = []
+        self.worker_of_env: List[int] = []
+        spaces: Optional[Tuple[gym.Space, gym.Space]] = None
+        placed = 0
+        try:
+            while placed < n_envs:
+                print(f"   Waiting for rollout workers on {host}:{port} ({n_envs - placed} of {n_envs} envs unplaced)...")
+                try:
+                    conn = self.listener.accept()
+                except mp.AuthenticationError:
+                    print("   ⚠️ Rejected a rollout worker with the wrong key")
+                    continue
+                _no_delay(conn)
+                _, hello = conn.recv()
+                share = min(hello["n_envs"], n_envs - placed)
+                if share <= 0:
+                    conn.send(("close", None))
+                    conn.close()
+                    continue
+                conn.send(("init", {"config": config, "settings": dict(settings, n_envs=share), "record_dir": record_dir}))
+                worker_spaces = conn.recv()
+                spaces = spaces or worker_spaces
+                print(f"   🔌 {hello['host']} (pid {hello['pid']}) hosts envs {placed}-{placed + share - 1}")
+                self.worker_of_env += [len(self.conns)] * share
+                self.conns.append(conn)
+                self.offsets.append(placed)
+                self.n_local_envs.append(share)
+                placed += share
+        except BaseException:
+            self._shutdown()
+            raise
+        # Later connections (e.g. a worker restarted on a node) are not served.
+        self.listener.close()
+
+        self.waiting = False
+        self.closed = False
+        # Local workers are not daemons, so interpreter exit would wait for them forever if the env is never closed.
+        atexit.register(self.close)
+        super().__init__(n_envs, *spaces)
+
+    def _recv(self, conn: Connection) -> Any:
+        try:
+            return conn.recv()
+        except EOFError:
+            raise RuntimeError(f"Rollout worker {self.conns.index(conn)} disconnected")
+
+    def _local_indices(self, indices: VecEnvIndices) -> Dict[int, List[int]]:
+        per_worker: Dict[int, List[int]] = defaultdict(list)
+        for i in self._get_indices(indices):
+            worker = self.worker_of_env[i]
+            per_worker[worker].append(i - self.offsets[worker])
+        return per_worker
+
+    def _call(self, cmd: str, indices: VecEnvIndices, make_data) -> List[Any]:
+        """Sends ``cmd`` to every worker hosting one of ``indices``; results in the order of ``indices``."""
+        per_worker = self._local_indices(indices)
+        for worker, local in per_worker.items():
+            self.conns[worker].send((cmd, make_data(local)))
+        results = {worker: iter(self._recv(self.conns[worker])) for worker in per_worker}
+        return [next(results[self.worker_of_env[i]]) for i in self._get_indices(indices)]
+
+    def step_async(self, actions: np.ndarray) -> None:
+        for conn, offset, n in zip(self.conns, self.offsets, self.n_local_envs):
+            conn.send(("step", actions[offset:offset + n]))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [self._recv(conn) for conn in self.conns]
+        self.waiting = False
+        obs, rewards, dones, infos = zip(*results)
+        return _concat_obs(list(obs)), np.concatenate(rewards), np.concatenate(dones), [info for part in infos for info in part]
+
+    def reset(self):
+        for conn, offset, n in zip(self.conns, self.offsets, self.n_local_envs):
+            conn.send(("reset", (self._seeds[offset], self._options[offset:offset + n])))
+        results = [self._recv(conn) for conn in self.conns]
+        self.reset_infos = [info for _, infos in results for info in infos]
+        self._reset_seeds()
+        self._reset_options()
+        return _concat_obs([obs for obs, _ in results])
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return self._call("get_attr", indices, lambda local: (attr_name, local))
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        for worker, local in self._local_indices(indices).items():
+            self.conns[worker].send(("set_attr", (attr_name, value, local)))
+            self._recv(self.conns[worker])
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return self._call("env_method", indices, lambda local: (method_name, method_args, method_kwargs, local))
+
+    def env_is_wrapped(self, wrapper_class: Type[gym.Wrapper], indices: VecEnvIndices = None) -> List[bool]:
+        return self._call("is_wrapped", indices, lambda local: (wrapper_class, local))
+
+    def get_images(self) -> Sequence[Optional[np.ndarray]]:
+        for conn in self.conns:
+            conn.send(("get_images", None))
+        return [image for conn in self.conns for image in self._recv(conn)]
+
+    def _shutdown(self) -> None:
+        for conn in self.conns:
+            try:
+                conn.send(("close", None))
+            except OSError:
+                pass
+            conn.close()
+        self.listener.close()
+        for process in self.processes:
+            process.join()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for conn in self.conns:
+                self._recv(conn)
+        self._shutdown()
+        self.closed = True
@@ -0,0 +1,292 @@
+import copy
+import os
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch as th
+from gymnasium import spaces
+from stable_baselines3 import HerReplayBuffer
+from stable_baselines3.common.buffers import DictReplayBuffer, ReplayBuffer
+from stable_baselines3.common.type_aliases import DictReplayBufferSamples
+from stable_baselines3.common.vec_env import VecNormalize
+
+# Key used for the observation array of a non-dict observation space.
+_FLAT_KEY = None
+
+_FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+# Redraws of invalid (row, env) pairs before the remaining ones are drawn from an explicit list of valid pairs.
+_REJECTION_ROUNDS = 4
+
+
+def _box_spaces(space: spaces.Space) -> Dict[Optional[str], spaces.Box]:
+    subspaces = dict(space.spaces) if isinstance(space, spaces.Dict) else {_FLAT_KEY: space}
+    for key, subspace in subspaces.items():
+        if not isinstance(subspace, spaces.Box):
+            raise ValueError(f"Compact replay buffers only support Box and Dict-of-Box observations, got {subspace} for key {key!r}")
+    return subspaces
+
+
+def _by_key(obs: Any) -> Dict[Optional[str], np.ndarray]:
+    return obs if isinstance(obs, dict) else {_FLAT_KEY: obs}
+
+
+class _NextObservationView:
+    """Read-only stand-in for ``next_observations[key]`` that is computed instead of stored.
+
+    Within an env's column the next observation of row ``p`` is the observation of row ``p + 1``.
+    The exceptions are the newest row, whose successor is not written yet, and rows followed by
+    something else (terminal observations before an auto-reset, or a reset between ``learn``
+    calls); the buffer keeps those separately.
+    """
+
+    def __init__(self, buffer: "CompactStorageMixin", key: Optional[str]):
+        self.buffer = buffer
+        self.key = key
+
+    @property
+    def _observations(self) -> np.ndarray:
+        return _by_key(self.buffer.observations)[self.key]
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self._observations.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._observations.dtype
+
+    def __getitem__(self, index):
+        index = index if isinstance(index, tuple) else (index,)
+        buffer = self.buffer
+        rows = np.asarray(index[0])
+        envs = index[1] if len(index) > 1 else slice(None)
+        if isinstance(envs, slice):
+            rows, envs = rows[..., None], np.arange(buffer.n_envs)[envs]
+        rows, envs = np.broadcast_arrays(rows, np.asarray(envs))
+
+        result = self._observations[(rows + 1) % buffer.buffer_size, envs]
+        newest = rows == (buffer.pos - 1) % buffer.buffer_size
+        if newest.any():
+            result[newest] = buffer._pending[self.key][envs[newest]]
+        for i in zip(*np.nonzero(buffer._has_next_override[rows, envs])):
+            result[i] = buffer._next_obs_overrides[(int(rows[i]), int(envs[i]))][self.key]
+        return result[(slice(None),) * rows.ndim + index[2:]]
+
+    def __setitem__(self, index, value) -> None:
+        # SB3 writes next_observations[pos] right after observations[pos]; that is all we accept.
+        if index != self.buffer.pos:
+            raise IndexError("Only the newest row of a compact replay buffer's next_observations can be written")
+        self.buffer._pending[self.key][...] = value
+
+
+class CompactStorageMixin:
+    """Replay buffer storage that keeps one copy of each observation, optionally cast and on disk.
+
+    ``next_observations`` is derived from the following row (see ``_NextObservationView``), which
+    halves observation memory. Floating observations are stored as ``obs_dtype``: float16 halves
+    it again and is safe for normalized or scaled features, and values outside the float16 range
+    raise instead of silently turning into ``inf``. Samples are handed to the networks as float32.
+    With ``storage_dir`` the observation arrays are memory-mapped from an unlinked temporary file
+    there, so their size is bounded by disk instead of RAM.
+    """
+
+    # Recomputed from the other attributes, so checkpoints leave them out.
+    _derived_attributes = ("next_observations", "_has_next_override")
+
+    def __init__(self, *args, obs_dtype: Any = np.float32, storage_dir: Optional[str] = None, **kwargs):
+        self.obs_dtype = np.dtype(obs_dtype)
+        self.storage_dir = storage_dir
+        super().__init__(*args, **kwargs)
+        if self.optimize_memory_usage:
+            raise ValueError("Compact replay buffers already share observations between rows; leave optimize_memory_usage off")
+
+        # Replace the arrays allocated by SB3 (np.zeros, so their pages were never touched).
+        observations: Dict[Optional[str], np.ndarray] = {}
+        self._pending: Dict[Optional[str], np.ndarray] = {}
+        for key, box in _box_spaces(self.observation_space).items():
+            dtype = self.obs_dtype if np.issubdtype(box.dtype, np.floating) else box.dtype
+            observations[key] = self._allocate((self.buffer_size, self.n_envs, *box.shape), dtype)
+            self._pending[key] = np.zeros((self.n_envs, *box.shape), dtype=dtype)
+        self.observations = observations if isinstance(self.observation_space, spaces.Dict) else observations[_FLAT_KEY]
+        # (row, env) -> {key: next observation} for rows not followed by their next observation.
+        self._next_obs_overrides: Dict[Tuple[int, int], Dict[Optional[str], np.ndarray]] = {}
+        self.rebuild_derived()
+
+    def _allocate(self, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        if self.storage_dir is None:
+            return np.zeros(shape, dtype=dtype)
+        os.makedirs(self.storage_dir, exist_ok=True)
+        # The file is unlinked on creation: the mapping keeps it alive and nothing is left behind.
+        with tempfile.TemporaryFile(dir=self.storage_dir) as f:
+            return np.memmap(f, dtype=dtype, mode="w+", shape=shape)
+
+    def rebuild_derived(self) -> None:
+        if isinstance(self.observation_space, spaces.Dict):
+            self.next_observations = {key: _NextObservationView(self, key) for key in self.observation_space.spaces}
+        else:
+            self.next_observations = _NextObservationView(self, _FLAT_KEY)
+        self._has_next_override = np.zeros((self.buffer_size, self.n_envs), dtype=bool)
+        for row, env in self._next_obs_overrides:
+            self._has_next_override[row, env] = True
+
+    def _check_range(self, obs: Any) -> None:
+        if self.obs_dtype != np.float16:
+            return
+        for key, value in _by_key(obs).items():
+            if self._pending[key].dtype == np.float16 and np.abs(value).max(initial=0.0) > _FLOAT16_MAX:
+                raise ValueError(f"Observation {key or ''} exceeds the float16 range; normalize it or use obs_dtype: float32")
+
+    def add(self, obs: Any, next_obs: Any, action: np.ndarray, reward: np.ndarray, done: np.ndarray,
+            infos: List[Dict[str, Any]]) -> None:
+        self._check_range(obs)
+        self._check_range(next_obs)
+        if self.full or self.pos > 0:
+            # The previous row's successor is this observation, unless the env was reset in between.
+            new_obs = _by_key(obs)
+            mismatch = np.zeros(self.n_envs, dtype=bool)
+            for key, pending in self._pending.items():
+                stored = np.asarray(new_obs[key]).astype(pending.dtype).reshape(pending.shape)
+                mismatch |= (stored != pending).reshape(self.n_envs, -1).any(axis=1)
+            prev = (self.pos - 1) % self.buffer_size
+            for env in np.flatnonzero(mismatch):
+                self._next_obs_overrides[(prev, int(env))] = {key: pending[env].copy() for key, pending in self._pending.items()}
+                self._has_next_override[prev, env] = True
+        # This row is about to be overwritten.
+        for env in np.flatnonzero(self._has_next_override[self.pos]):
+            del self._next_obs_overrides[(self.pos, int(env))]
+        self._has_next_override[self.pos] = False
+        super().add(obs, next_obs, action, reward, done, infos)
+
+    def to_torch(self, array: np.ndarray, copy: bool = True) -> th.Tensor:
+        if array.dtype == np.float16:
+            array = array.astype(np.float32)
+        return super().to_torch(array, copy)
+
+    def observation_nbytes(self) -> int:
+        return sum(array.nbytes for array in _by_key(self.observations).values())
+
+
+def goal_distance_reward(achieved_goal: np.ndarray, desired_goal: np.ndarray, reward_weights: np.ndarray,
+                         p: float = 0.5) -> np.ndarray:
+    """Batched ``ParkingEnv.compute_reward``: minus the weighted p-norm of the goal error."""
+    return -np.power(np.dot(np.abs(achieved_goal - desired_goal), reward_weights), p)
+
+
+class VectorizedHerMixin:
+    """HER sampling that never calls back into the envs.
+
+    SB3's ``HerReplayBuffer.sample`` scans the whole ``ep_length`` array for valid transitions,
+    gathers real and virtual transitions separately and computes the relabeled rewards with
+    ``env_method("compute_reward")``, a round trip to a worker process on every gradient step.
+    Here (row, env) pairs are drawn uniformly from the filled rows and the few that fall on
+    unfinished or overwritten episodes are redrawn; future goals come from the per-transition
+    episode ranges (``ep_start``, ``ep_length``) and the rewards from ``goal_distance_reward``
+    with the env's ``reward_weights``, all in one batch. Without ``reward_weights`` (read from the
+    env config when not given) or with ``copy_info_dict``, rewards still go through the env.
+    """
+
+    def __init__(self, *args, reward_weights: Optional[List[float]] = None, reward_p: float = 0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        if reward_weights is None and self.env is not None:
+            reward_weights = self.env.get_attr("config", indices=[0])[0].get("reward_weights")
+        if reward_weights is None:
+            print("⚠️ No reward_weights for the vectorized HER buffer; relabeled rewards go through env.compute_reward")
+        self.reward_weights = None if reward_weights is None else np.asarray(reward_weights, dtype=np.float64)
+        self.reward_p = reward_p
+
+    def _sample_indices(self, batch_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        n_rows = self.buffer_size if self.full else self.pos
+        rows = np.random.randint(0, max(n_rows, 1), size=batch_size)
+        envs = np.random.randint(0, self.n_envs, size=batch_size)
+        for _ in range(_REJECTION_ROUNDS):
+            invalid = np.flatnonzero(self.ep_length[rows, envs] == 0)
+            if invalid.size == 0:
+                return rows, envs
+            rows[invalid] = np.random.randint(0, max(n_rows, 1), size=invalid.size)
+            envs[invalid] = np.random.randint(0, self.n_envs, size=invalid.size)
+        invalid = np.flatnonzero(self.ep_length[rows, envs] == 0)
+        if invalid.size > 0:
+            # Mostly unfinished episodes (e.g. right after learning_starts): draw the rest exactly.
+            valid = np.flatnonzero(self.ep_length[:max(n_rows, 1)] > 0)
+            if valid.size == 0:
+                raise RuntimeError(
+                    "Unable to sample before the end of the first episode. We recommend choosing a value "
+                    "for learning_starts that is greater than the maximum number of timesteps in the environment."
+                )
+            rows[invalid], envs[invalid] = np.divmod(np.random.choice(valid, size=invalid.size), self.n_envs)
+        return rows, envs
+
+    def _relabeled_rewards(self, achieved_goal: np.ndarray, desired_goal: np.ndarray, rows: np.ndarray,
+                           envs: np.ndarray) -> np.ndarray:
+        if self.reward_weights is not None and not self.copy_info_dict:
+            return goal_distance_reward(achieved_goal, desired_goal, self.reward_weights, self.reward_p).astype(np.float32)
+        infos = copy.deepcopy(self.infos[rows, envs]) if self.copy_info_dict else [{} for _ in range(len(rows))]
+        return self.env.env_method("compute_reward", achieved_goal, desired_goal, infos, indices=[0])[0].astype(np.float32)
+
+    def sample(self, batch_size: int, env: Optional[VecNormalize] = None) -> DictReplayBufferSamples:
+        rows, envs = self._sample_indices(batch_size)
+        # The first her_ratio of the batch is relabeled, as in SB3.
+        n_virtual = int(self.her_ratio * batch_size)
+        virtual_rows, virtual_envs = rows[:n_virtual], envs[:n_virtual]
+
+        obs = {key: np.asarray(obs[rows, envs]) for key, obs in self.observations.items()}
+        next_obs = {key: np.asarray(obs[rows, envs]) for key, obs in self.next_observations.items()}
+        new_goals = self._sample_goals(virtual_rows, virtual_envs)
+        obs["desired_goal"][:n_virtual] = new_goals
+        next_obs["desired_goal"][:n_virtual] = new_goals
+
+        rewards = self.rewards[rows, envs].astype(np.float32)
+        # r_t depends on the goal achieved by a_t, i.e. the next achieved goal.
+        rewards[:n_virtual] = self._relabeled_rewards(next_obs["achieved_goal"][:n_virtual], new_goals, virtual_rows, virtual_envs)
+
+        obs = self._normalize_obs(obs, env)
+        next_obs = self._normalize_obs(next_obs, env)
+        return DictReplayBufferSamples(
+            observations={key: self.to_torch(value) for key, value in obs.items()},
+            actions=self.to_torch(self.actions[rows, envs]),
+            next_observations={key: self.to_torch(value) for key, value in next_obs.items()},
+            # Timeouts are not terminal (all False unless handle_timeout_termination).
+            dones=self.to_torch(self.dones[rows, envs] * (1 - self.timeouts[rows, envs])).reshape(-1, 1),
+            rewards=self.to_torch(self._normalize_reward(rewards.reshape(-1, 1), env)),
+        )
+
+
+class CompactReplayBuffer(CompactStorageMixin, ReplayBuffer):
+    pass
+
+
+class CompactDictReplayBuffer(CompactStorageMixin, DictReplayBuffer):
+    pass
+
+
+class CompactHerReplayBuffer(CompactStorageMixin, HerReplayBuffer):
+    pass
+
+
+class VectorizedHerReplayBuffer(VectorizedHerMixin, HerReplayBuffer):
+    pass
+
+
+class CompactVectorizedHerReplayBuffer(CompactStorageMixin, VectorizedHerMixin, HerReplayBuffer):
+    pass
+
+
+REPLAY_BUFFER_CLASSES = {
+    "HerReplayBuffer": HerReplayBuffer,
+    "CompactReplayBuffer": CompactReplayBuffer,
+    "CompactHerReplayBuffer": CompactHerReplayBuffer,
+    "VectorizedHerReplayBuffer": VectorizedHerReplayBuffer,
+    "CompactVectorizedHerReplayBuffer": CompactVectorizedHerReplayBuffer,
+}
+
+
+def resolve_replay_buffer_class(name: str, observation_space: spaces.Space) -> type:
+    """Maps a ``replay_buffer_class`` config string to the class, picking the Dict variant where needed."""
+    if name not in REPLAY_BUFFER_CLASSES:
+        raise ValueError(f"Unknown replay_buffer_class {name!r}, expected one of {sorted(REPLAY_BUFFER_CLASSES)}")
+    buffer_class = REPLAY_BUFFER_CLASSES[name]
+    if buffer_class is CompactReplayBuffer and isinstance(observation_space, spaces.Dict):
+        return CompactDictReplayBuffer
+    return buffer_class
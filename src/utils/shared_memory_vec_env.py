@@ -0,0 +1,242 @@
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
+from stable_baselines3.common.vec_env.patch_gym import _patch_env
+
+# Key used for the single buffer of a non-dict observation space.
+_FLAT_KEY = None
+
+# (shared memory name, shape, dtype) for one buffer.
+BufferSpec = Tuple[str, Tuple[int, ...], str]
+
+
+def _box_spaces(space: spaces.Space) -> Dict[Optional[str], spaces.Box]:
+    if isinstance(space, spaces.Dict):
+        subspaces = dict(space.spaces)
+    else:
+        subspaces = {_FLAT_KEY: space}
+    for key, subspace in subspaces.items():
+        if not isinstance(subspace, spaces.Box):
+            raise ValueError(f"SharedMemoryVecEnv only supports Box and Dict-of-Box observations, got {subspace} for key {key!r}")
+    return subspaces
+
+
+def shared_observation_space(space: spaces.Space, obs_dtype: np.dtype) -> spaces.Space:
+    """The observation space as seen by the learner: every Box cast to ``obs_dtype``."""
+    def cast(box: spaces.Box) -> spaces.Box:
+        return spaces.Box(low=box.low.astype(obs_dtype), high=box.high.astype(obs_dtype), shape=box.shape, dtype=obs_dtype)
+
+    subspaces = _box_spaces(space)
+    if isinstance(space, spaces.Dict):
+        return spaces.Dict({key: cast(box) for key, box in subspaces.items()})
+    return cast(subspaces[_FLAT_KEY])
+
+
+def _attach_all(specs: Dict[str, Dict[Optional[str], BufferSpec]],
+                handles: List[shared_memory.SharedMemory]) -> Dict[str, Dict[Optional[str], np.ndarray]]:
+    views: Dict[str, Dict[Optional[str], np.ndarray]] = {}
+    for group, group_specs in specs.items():
+        views[group] = {}
+        for key, (name, shape, dtype) in group_specs.items():
+            shm = shared_memory.SharedMemory(name=name)
+            handles.append(shm)
+            views[group][key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return views
+
+
+def _worker(remote, parent_remote, env_fn_wrapper: CloudpickleWrapper, index: int) -> None:
+    from stable_baselines3.common.env_util import is_wrapped
+
+    parent_remote.close()
+    env = _patch_env(env_fn_wrapper.var())
+
+    handles: List[shared_memory.SharedMemory] = []
+    views: Dict[str, Dict[Optional[str], np.ndarray]] = {}
+
+    def write_obs(group: str, observation) -> None:
+        if _FLAT_KEY in views[group]:
+            views[group][_FLAT_KEY][index] = observation
+        else:
+            for key, array in views[group].items():
+                array[index] = observation[key]
+
+    try:
+        while True:
+            try:
+                cmd, data = remote.recv()
+            except (EOFError, KeyboardInterrupt):
+                break
+            if cmd == "step":
+                start = time.perf_counter()
+                observation, reward, terminated, truncated, info = env.step(data)
+                done = terminated or truncated
+                info["TimeLimit.truncated"] = truncated and not terminated
+                reset_info: Dict[str, Any] = {}
+                if done:
+                    write_obs("terminal_obs", observation)
+                    observation, reset_info = env.reset()
+                write_obs("obs", observation)
+                views["rewards"][_FLAT_KEY][index] = reward
+                views["dones"][_FLAT_KEY][index] = done
+                # Only the (small) info dicts go through the pipe; the reply doubles as the "written" signal.
+                remote.send((info, reset_info, time.perf_counter() - start))
+            elif cmd == "reset":
+                maybe_options = {"options": data[1]} if data[1] else {}
+                observation, reset_info = env.reset(seed=data[0], **maybe_options)
+                write_obs("obs", observation)
+                remote.send(reset_info)
+            elif cmd == "attach":
+                views.update(_attach_all(data, handles))
+                remote.send(None)
+            elif cmd == "render":
+                remote.send(env.render())
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            elif cmd == "get_spaces":
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == "env_method":
+                method = env.get_wrapper_attr(data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == "has_attr":
+                try:
+                    env.get_wrapper_attr(data)
+                    remote.send(True)
+                except AttributeError:
+                    remote.send(False)
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+    finally:
+        views.clear()
+        for shm in handles:
+            shm.close()
+
+
+class SharedMemoryVecEnv(SubprocVecEnv):
+    """Subprocess vec env whose workers write observations, rewards and dones into shared memory.
+
+    Every worker owns one row of preallocated NumPy buffers (one per key for Dict observation
+    spaces), so observations are never pickled; the pipe only carries actions, info dicts and
+    control commands. Observations are cast to ``obs_dtype`` and the reported observation space
+    is cast accordingly. Terminal observations live in a second set of buffers and are copied
+    into ``info["terminal_observation"]`` as SB3 expects.
+
+    Workers also report how long each step (plus auto-reset) took, which ``worker_idle_share``
+    turns into the fraction of worker time spent waiting for the learner or for other workers.
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], start_method: Optional[str] = None,
+                 obs_dtype: Any = np.float32):
+        self.waiting = False
+        self.closed = False
+        self.obs_dtype = np.dtype(obs_dtype)
+        n_envs = len(env_fns)
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn), index)
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(("get_spaces", None))
+        env_observation_space, action_space = self.remotes[0].recv()
+        observation_space = shared_observation_space(env_observation_space, self.obs_dtype)
+
+        self._shm: List[shared_memory.SharedMemory] = []
+        self._buffers: Dict[str, Dict[Optional[str], np.ndarray]] = {}
+        specs: Dict[str, Dict[Optional[str], BufferSpec]] = {}
+        obs_layout = {key: (box.shape, self.obs_dtype) for key, box in _box_spaces(observation_space).items()}
+        layouts = {
+            "obs": obs_layout,
+            "terminal_obs": obs_layout,
+            "rewards": {_FLAT_KEY: ((), np.dtype(np.float32))},
+            "dones": {_FLAT_KEY: ((), np.dtype(bool))},
+        }
+        for group, layout in layouts.items():
+            self._buffers[group], specs[group] = {}, {}
+            for key, (shape, dtype) in layout.items():
+                full_shape = (n_envs, *shape)
+                shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(full_shape)) * dtype.itemsize, 1))
+                self._shm.append(shm)
+                self._buffers[group][key] = np.ndarray(full_shape, dtype=dtype, buffer=shm.buf)
+                specs[group][key] = (shm.name, full_shape, dtype.str)
+
+        for remote in self.remotes:
+            remote.send(("attach", specs))
+        for remote in self.remotes:
+            remote.recv()
+
+        self.busy_time = np.zeros(n_envs)
+        self._stats_start = time.perf_counter()
+
+        VecEnv.__init__(self, n_envs, observation_space, action_space)
+
+    def _read_obs(self, group: str, indices=slice(None)):
+        # Copy out of shared memory: SB3 keeps the previous observation around while the
+        # workers already write the next one into the same rows.
+        buffers = self._buffers[group]
+        if _FLAT_KEY in buffers:
+            return buffers[_FLAT_KEY][indices].copy()
+        return {key: array[indices].copy() for key, array in buffers.items()}
+
+    def reset_worker_stats(self) -> None:
+        self.busy_time[:] = 0.0
+        self._stats_start = time.perf_counter()
+
+    def worker_idle_share(self) -> float:
+        """Share of worker wall time since the last ``reset_worker_stats`` not spent stepping."""
+        elapsed = time.perf_counter() - self._stats_start
+        if elapsed <= 0:
+            return 0.0
+        return float(1.0 - self.busy_time.sum() / (self.num_envs * elapsed))
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        infos, self.reset_infos, busy = (list(r) for r in zip(*results))
+        self.busy_time += busy
+        dones = self._buffers["dones"][_FLAT_KEY].copy()
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = self._read_obs("terminal_obs", i)
+        return self._read_obs("obs"), self._buffers["rewards"][_FLAT_KEY].copy(), dones, infos
+
+    def reset(self):
+        for env_idx, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[env_idx], self._options[env_idx])))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        self._reset_seeds()
+        self._reset_options()
+        return self._read_obs("obs")
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        super().close()
+        # The NumPy views must go before the segments can be closed.
+        self._buffers = {}
+        for shm in self._shm:
+            shm.close()
+            shm.unlink()
+        self._shm = []
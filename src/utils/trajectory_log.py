@@ -0,0 +1,145 @@
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.wrappers.trajectory_recorder import KINEMATICS, RECORDING_VERSION
+
+META_FILE = "meta.json"
+SELECTIONS = ("all", "collision", "failure")
+
+# Replayed ego positions further apart than this (meters) mean the episode did not re-simulate exactly.
+REPLAY_TOLERANCE = 1e-3
+
+
+@dataclass(frozen=True)
+class EpisodeRecord:
+    stream: str
+    index: int
+    seed: int
+    length: int
+    episode_return: float
+    crashed: bool
+    success: bool
+    chunk_path: str
+    start: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.stream}-{self.index:05d}"
+
+
+@dataclass(frozen=True)
+class ReplayJob:
+    config: Dict[str, Any]
+    episode: EpisodeRecord
+    out_path: str
+    frame_skip: int = 1
+    video_size: Optional[Tuple[int, int]] = None
+
+    def __post_init__(self):
+        if self.frame_skip < 1:
+            raise ValueError(f"frame_skip must be at least 1, got {self.frame_skip}")
+
+
+def write_recording_meta(directory: str, config: Dict[str, Any], model_path: Optional[str] = None) -> None:
+    os.makedirs(directory, exist_ok=True)
+    meta = {
+        "version": RECORDING_VERSION,
+        "env_id": config['env_id'],
+        "env_params": config['env_params'],
+        "model": model_path,
+        "kinematics": list(KINEMATICS),
+    }
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_recording_meta(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, META_FILE), 'r') as f:
+        meta = json.load(f)
+    if meta.get("version") != RECORDING_VERSION:
+        raise ValueError(f"Unsupported recording version {meta.get('version')}, expected {RECORDING_VERSION}")
+    return meta
+
+
+def list_episodes(directory: str) -> List[EpisodeRecord]:
+    """Episode table of every chunk in ``directory``; only the small per-episode columns are read."""
+    episodes = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.npz"))):
+        stream = os.path.basename(path).split("-")[0]
+        with np.load(path) as chunk:
+            columns = [chunk[f"episode_{name}"] for name in ("index", "seed", "length", "return", "crashed", "success", "start")]
+        for index, seed, length, episode_return, crashed, success, start in zip(*columns):
+            episodes.append(EpisodeRecord(stream, int(index), int(seed), int(length), float(episode_return),
+                                          bool(crashed), bool(success), path, int(start)))
+    return episodes
+
+
+def select_episodes(episodes: List[EpisodeRecord], selection: str = "failure") -> List[EpisodeRecord]:
+    if selection == "collision":
+        return [e for e in episodes if e.crashed]
+    if selection == "failure":
+        return [e for e in episodes if not e.success]
+    if selection == "all":
+        return list(episodes)
+    raise ValueError(f"Unknown selection '{selection}'. Choose from: {SELECTIONS}")
+
+
+def load_episode_steps(episode: EpisodeRecord) -> Dict[str, Any]:
+    """Step columns of one episode; ``others`` is a list with one (n_vehicles, 4) array per step."""
+    stop = episode.start + episode.length
+    with np.load(episode.chunk_path) as chunk:
+        steps = {name: chunk[name][episode.start:stop] for name in ("action", "reward", "terminated", "truncated", "crashed", "ego")}
+        offsets = chunk["others_offset"][episode.start:stop + 1]
+        others = chunk["others"][offsets[0]:offsets[-1]]
+    steps["others"] = np.split(others, offsets[1:-1] - offsets[0])
+    return steps
+
+
+def replay_episode(job: ReplayJob) -> Dict[str, Any]:
+    """Re-simulates a recorded episode from its seed and actions and renders it into ``job.out_path``."""
+    from src.utils.frame_sink import FFmpegFrameSink
+    from src.utils.video_utils import make_recording_env, recording_fps, render_frame
+
+    steps = load_episode_steps(job.episode)
+    env, _ = make_recording_env(job.config, None, job.video_size)
+    os.makedirs(os.path.dirname(job.out_path) or ".", exist_ok=True)
+    max_deviation = 0.0
+    try:
+        env.reset(seed=job.episode.seed)
+        frame = render_frame(env)
+        with FFmpegFrameSink(job.out_path, (frame.shape[1], frame.shape[0]), recording_fps(env, job.frame_skip)) as sink:
+            sink.write(frame)
+            for t, action in enumerate(steps["action"], start=1):
+                env.step(action)
+                vehicle = env.unwrapped.vehicle
+                deviation = np.abs(vehicle.position - steps["ego"][t - 1, :2]).max()
+                max_deviation = max(max_deviation, float(deviation))
+                if t % job.frame_skip == 0 or t == job.episode.length:
+                    sink.write(render_frame(env))
+    finally:
+        env.close()
+
+    if max_deviation > REPLAY_TOLERANCE:
+        print(f"⚠️ Replay of {job.episode.key} diverged from the recording (ego off by {max_deviation:.3f} m)")
+    print(f"Video saved to {job.out_path}")
+    return {"episode": job.episode.key, "video": job.out_path, "max_ego_deviation": max_deviation}
+
+
+def replay_episodes_parallel(jobs: List[ReplayJob], max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    max_workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(replay_episode, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"   Replay of {job.episode.key} failed: {e}")
+    return results
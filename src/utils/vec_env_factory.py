@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import platform
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+import gymnasium as gym
+import highway_env  # noqa: F401  (registers the highway-env ids, also inside spawned workers)
+from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecEnv
+
+from src.utils.async_vec_env import AsyncSharedMemoryVecEnv
+from src.utils.shared_memory_vec_env import SharedMemoryVecEnv
+from src.wrappers.highway_wrapper import HighwayConfigWrapper
+from src.wrappers.trajectory_recorder import TrajectoryRecorder
+
+VEC_ENV_CLASSES = {
+    "dummy": DummyVecEnv,
+    "subproc": SubprocVecEnv,
+    "shm": SharedMemoryVecEnv,
+    "async": AsyncSharedMemoryVecEnv,
+}
+
+# Backends timed by ``vec_env: auto``. ``async`` changes how off-policy agents collect rollouts, so it is opt-in.
+AUTO_CANDIDATES = ("dummy", "subproc", "shm")
+
+DEFAULT_N_ENVS = 8
+DEFAULT_VEC_ENV = "subproc"
+# Envs hosted by rollout worker processes that connect over TCP (see agent_params.remote).
+REMOTE_VEC_ENV = "remote"
+CALIBRATION_DIR = "logs/calibration"
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+@dataclass(frozen=True)
+class VecEnvSettings:
+    n_envs: int
+    backend: str
+    start_method: Optional[str] = None
+    worker_threads: Optional[int] = None
+    obs_dtype: Optional[str] = None
+
+
+def limit_threads(n_threads: int) -> None:
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n_threads)
+    try:
+        import torch
+        torch.set_num_threads(n_threads)
+    except ImportError:
+        pass
+
+
+def wrap_highway_env(env: gym.Env, config_params: Dict[str, Any], worker_threads: Optional[int] = None,
+                     reset_pool: Optional[Dict[str, Any]] = None, record_dir: Optional[str] = None) -> gym.Env:
+    # Runs inside the worker, so the cap only applies to env processes, never to the learner.
+    if worker_threads:
+        limit_threads(worker_threads)
+    env = HighwayConfigWrapper(env, config_params, reset_pool=reset_pool)
+    if record_dir is not None:
+        env = TrajectoryRecorder(env, record_dir)
+    return env
+
+
+def local_rollout_workers(config: Dict[str, Any], n_envs: int) -> List[int]:
+    """Envs per rollout worker started on this machine for the remote backend."""
+    remote = config['agent_params'].get('remote') or {}
+    n_workers = remote.get('local_workers', 0)
+    if n_workers == 0:
+        return []
+    envs_per_worker = remote.get('envs_per_worker', -(-n_envs // n_workers))
+    shares = []
+    for _ in range(n_workers):
+        shares.append(min(envs_per_worker, n_envs - sum(shares)))
+    return [share for share in shares if share > 0]
+
+
+def build_remote_vec_env(config: Dict[str, Any], settings: VecEnvSettings, seed: Optional[int] = None,
+                         record_dir: Optional[str] = None) -> VecEnv:
+    from src.utils.remote_vec_env import AUTHKEY_ENV_VAR, DEFAULT_REMOTE_ADDRESS, DEFAULT_WORKER_VEC_ENV, RemoteVecEnv
+
+    remote = config['agent_params'].get('remote') or {}
+    authkey = os.environ.get(AUTHKEY_ENV_VAR)
+    vec_env = RemoteVecEnv(
+        config,
+        settings.n_envs,
+        address=remote.get('address', DEFAULT_REMOTE_ADDRESS),
+        authkey=authkey.encode() if authkey else None,
+        local_workers=local_rollout_workers(config, settings.n_envs),
+        worker_vec_env=remote.get('worker_vec_env', DEFAULT_WORKER_VEC_ENV),
+        worker_threads=settings.worker_threads,
+        start_method=settings.start_method,
+        record_dir=record_dir,
+    )
+    if seed is not None:
+        vec_env.seed(seed)
+    return vec_env
+
+
+def build_vec_env(config: Dict[str, Any], settings: VecEnvSettings, seed: Optional[int] = None,
+                  record_dir: Optional[str] = None) -> VecEnv:
+    if settings.backend == REMOTE_VEC_ENV:
+        return build_remote_vec_env(config, settings, seed, record_dir)
+    if settings.backend not in VEC_ENV_CLASSES:
+        raise ValueError(f"Unknown vec_env backend '{settings.backend}'. Choose from: {sorted(VEC_ENV_CLASSES) + [REMOTE_VEC_ENV]}")
+
+    is_subproc = issubclass(VEC_ENV_CLASSES[settings.backend], SubprocVecEnv)
+    vec_env_kwargs = {}
+    if is_subproc and settings.start_method:
+        vec_env_kwargs["start_method"] = settings.start_method
+    if issubclass(VEC_ENV_CLASSES[settings.backend], SharedMemoryVecEnv) and settings.obs_dtype:
+        vec_env_kwargs["obs_dtype"] = settings.obs_dtype
+
+    # Workers started with spawn/forkserver read the thread caps from the inherited environment.
+    saved_env = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    if is_subproc and settings.worker_threads:
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(settings.worker_threads)
+    try:
+        return make_vec_env(
+            env_id=config['env_id'],
+            n_envs=settings.n_envs,
+            seed=seed,
+            wrapper_class=wrap_highway_env,
+            wrapper_kwargs={
+                "config_params": config['env_params'],
+                "worker_threads": settings.worker_threads if is_subproc else None,
+                "reset_pool": config['agent_params'].get('reset_pool'),
+                "record_dir": record_dir,
+            },
+            vec_env_cls=VEC_ENV_CLASSES[settings.backend],
+            vec_env_kwargs=vec_env_kwargs,
+        )
+    finally:
+        for var, value in saved_env.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def measure_env_throughput(vec_env: VecEnv, n_steps: int, warmup_steps: int = 8) -> float:
+    """Random-action env-steps/sec of an already built vec env."""
+    vec_env.reset()
+    for _ in range(warmup_steps):
+        vec_env.step([vec_env.action_space.sample() for _ in range(vec_env.num_envs)])
+
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        vec_env.step([vec_env.action_space.sample() for _ in range(vec_env.num_envs)])
+    elapsed = time.perf_counter() - start
+    return vec_env.num_envs * n_steps / max(elapsed, 1e-9)
+
+
+def _candidate_n_envs(max_envs: int) -> List[int]:
+    candidates = [1]
+    while candidates[-1] * 2 <= max_envs:
+        candidates.append(candidates[-1] * 2)
+    if candidates[-1] != max_envs:
+        candidates.append(max_envs)
+    return candidates
+
+
+def _calibration_key(config: Dict[str, Any], agent_params: Dict[str, Any]) -> str:
+    payload = json.dumps({
+        "env_id": config['env_id'],
+        "env_params": config['env_params'],
+        "n_envs": agent_params.get('n_envs'),
+        "vec_env": agent_params.get('vec_env'),
+        "candidates": AUTO_CANDIDATES,
+        "start_method": agent_params.get('start_method'),
+        "worker_threads": agent_params.get('worker_threads'),
+        "obs_dtype": agent_params.get('obs_dtype'),
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def calibrate_vec_env(config: Dict[str, Any], n_steps: int = 64, cache_dir: str = CALIBRATION_DIR) -> VecEnvSettings:
+    """Times every candidate (n_envs, backend) pair and returns the fastest one.
+
+    Results are cached per config and machine, so only the first run pays for the calibration.
+    """
+    agent_params = config['agent_params']
+    key = _calibration_key(config, agent_params)
+    cache_path = os.path.join(cache_dir, f"{config['env_id']}.json")
+
+    cache: Dict[str, Any] = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+        if key in cache:
+            print(f"Using cached vec env calibration from {cache_path}")
+            return VecEnvSettings(**cache[key]['best'])
+
+    n_envs = agent_params.get('n_envs', 'auto')
+    if n_envs == 'auto':
+        max_envs = agent_params.get('max_n_envs', min(2 * (os.cpu_count() or 1), 32))
+        n_envs_candidates = _candidate_n_envs(max_envs)
+    else:
+        n_envs_candidates = [int(n_envs)]
+
+    backend = agent_params.get('vec_env', 'auto')
+    backends = list(AUTO_CANDIDATES) if backend == 'auto' else [backend]
+
+    print(f"Calibrating vec env for {config['env_id']} on {os.cpu_count()} CPUs...")
+    results = []
+    for candidate_backend in backends:
+        for candidate_n_envs in n_envs_candidates:
+            settings = VecEnvSettings(
+                n_envs=candidate_n_envs,
+                backend=candidate_backend,
+                start_method=agent_params.get('start_method'),
+                worker_threads=agent_params.get('worker_threads'),
+                obs_dtype=agent_params.get('obs_dtype'),
+            )
+            vec_env = build_vec_env(config, settings)
+            try:
+                steps_per_sec = measure_env_throughput(vec_env, n_steps)
+            finally:
+                vec_env.close()
+            print(f"   {candidate_backend:>8} x {candidate_n_envs:<3} -> {steps_per_sec:9.1f} env-steps/s")
+            results.append({"settings": asdict(settings), "steps_per_sec": steps_per_sec})
+
+    best = max(results, key=lambda r: r['steps_per_sec'])
+    os.makedirs(cache_dir, exist_ok=True)
+    cache[key] = {"best": best['settings'], "results": results}
+    with open(cache_path, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+    settings = VecEnvSettings(**best['settings'])
+    print(f"Selected {settings.backend} x {settings.n_envs} ({best['steps_per_sec']:.1f} env-steps/s)")
+    return settings
+
+
+def resolve_vec_env_settings(config: Dict[str, Any]) -> VecEnvSettings:
+    agent_params = config['agent_params']
+    n_envs = agent_params.get('n_envs', DEFAULT_N_ENVS)
+    backend = agent_params.get('vec_env', DEFAULT_VEC_ENV)
+
+    if n_envs == 'auto' or backend == 'auto':
+        return calibrate_vec_env(config, n_steps=agent_params.get('calibration_steps', 64))
+
+    return VecEnvSettings(
+        n_envs=int(n_envs),
+        backend=backend,
+        start_method=agent_params.get('start_method'),
+        worker_threads=agent_params.get('worker_threads'),
+        obs_dtype=agent_params.get('obs_dtype'),
+    )
@@ -1,20 +1,78 @@
 import gymnasium as gym
+import numpy as np
 from stable_baselines3.common.base_class import BaseAlgorithm
-from gymnasium.wrappers import RecordVideo
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import os
 
-def record_agent_run(env: gym.Env, model: BaseAlgorithm, video_folder: str, name_prefix: str, steps: int = 500):
-    env = RecordVideo(
-        env, 
-        video_folder=video_folder, 
-        name_prefix=name_prefix,
-        episode_trigger=lambda x: True
-    )
+from src.utils.file_handler import model_dir
+from src.utils.frame_sink import FFmpegFrameSink, LabelOverlay
 
+STAGES: List[Tuple[str, str, str]] = [
+    ("1_untrained", "untrained", "UNTRAINED"),
+    ("2_half_trained", "half_trained", "HALF-TRAINED"),
+    ("3_fully_trained", "fully_trained", "FULLY TRAINED"),
+]
+
+
+@dataclass(frozen=True)
+class RecordingJob:
+    config: Dict[str, Any]
+    name_prefix: str
+    video_folder: str
+    model_path: Optional[str] = None
+    frame_skip: int = 1
+    video_size: Optional[Tuple[int, int]] = None
+    steps: int = 500
+
+    def __post_init__(self):
+        if self.frame_skip < 1:
+            raise ValueError(f"frame_skip must be at least 1, got {self.frame_skip}")
+
+
+@dataclass(frozen=True)
+class EvolutionJob:
+    config: Dict[str, Any]
+    out_path: str
+    stages: Tuple[Tuple[str, Optional[str]], ...]
+    layout: str = "sequence"
+    frame_skip: int = 1
+    video_size: Optional[Tuple[int, int]] = None
+    panel_size: Tuple[int, int] = (640, 360)
+    crf: int = 23
+    steps: int = 500
+
+    def __post_init__(self):
+        if self.frame_skip < 1:
+            raise ValueError(f"frame_skip must be at least 1, got {self.frame_skip}")
+
+
+def recording_env_params(env_params: Dict[str, Any], defaults: Dict[str, Any], video_size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    # offscreen_rendering draws on plain pygame surfaces, so pool workers never open a display.
+    params = dict(env_params, offscreen_rendering=True)
+    if video_size is not None:
+        width, height = video_size
+        # Keep the same field of view: pixels-per-meter scales with the output width.
+        ratio = width / params.get('screen_width', defaults['screen_width'])
+        params['scaling'] = params.get('scaling', defaults['scaling']) * ratio
+        params['screen_width'], params['screen_height'] = width, height
+    return params
+
+
+def render_frame(env: gym.Env):
+    frame = env.render()
+    # render() arms highway-env's auto-rendering of every intermediate simulation frame;
+    # those frames are discarded in rgb_array mode, so switch it back off.
+    env.unwrapped.enable_auto_render = False
+    return frame
+
+
+def iter_policy_frames(env: gym.Env, model: Optional[BaseAlgorithm], steps: int = 500, frame_skip: int = 1) -> Iterator[np.ndarray]:
     obs, info = env.reset()
-    done = False
-    
-    for _ in range(steps):
+    yield render_frame(env)
+
+    for step in range(1, steps + 1):
         if model is None:
             action = env.action_space.sample()
         else:
@@ -22,9 +80,158 @@ def record_agent_run(env: gym.Env, model: BaseAlgorithm, video_folder: str, name
 
         obs, reward, terminated, truncated, info = env.step(action)
         done = terminated or truncated
-        
+
+        if step % frame_skip == 0 or done:
+            yield render_frame(env)
+
         if done:
             break
-    
+
+
+def recording_fps(env: gym.Env, frame_skip: int = 1) -> float:
+    return max(env.metadata.get("render_fps", 30) / frame_skip, 1)
+
+
+def record_agent_run(env: gym.Env, model: BaseAlgorithm, video_folder: str, name_prefix: str, steps: int = 500, frame_skip: int = 1):
+    video_path = os.path.join(video_folder, f"{name_prefix}-episode-0.mp4")
+    os.makedirs(video_folder, exist_ok=True)
+
+    frames = iter_policy_frames(env, model, steps, frame_skip)
+    first = next(frames)
+    with FFmpegFrameSink(video_path, (first.shape[1], first.shape[0]), recording_fps(env, frame_skip)) as sink:
+        sink.write(first)
+        for frame in frames:
+            sink.write(frame)
+
     env.close()
-    print(f"Video saved to {video_folder}/{name_prefix}-episode-0.mp4")
\ No newline at end of file
+    print(f"Video saved to {video_path}")
+    return video_path
+
+
+def make_recording_env(config: Dict[str, Any], model_path: Optional[str], video_size: Optional[Tuple[int, int]] = None) -> Tuple[gym.Env, Optional[BaseAlgorithm]]:
+    import highway_env  # noqa: F401
+    from src.wrappers.highway_wrapper import HighwayConfigWrapper
+    from src.agents.sb3_manager import SB3AgentManager
+
+    base_env = gym.make(config['env_id'], render_mode='rgb_array')
+    env_params = recording_env_params(config['env_params'], base_env.unwrapped.config, video_size)
+    env = HighwayConfigWrapper(base_env, env_params)
+
+    model = None
+    if model_path is not None:
+        agent_manager = SB3AgentManager(config=config, env=env, mode='visualize')
+        agent_manager.load(model_path)
+        model = agent_manager.model
+    return env, model
+
+
+def record_job(job: RecordingJob) -> str:
+    env, model = make_recording_env(job.config, job.model_path, job.video_size)
+    return record_agent_run(env, model=model, video_folder=job.video_folder, name_prefix=job.name_prefix,
+                            steps=job.steps, frame_skip=job.frame_skip)
+
+
+def _labelled_frames(env: gym.Env, model: Optional[BaseAlgorithm], label: str, job: EvolutionJob) -> Iterator[np.ndarray]:
+    frames = iter_policy_frames(env, model, job.steps, job.frame_skip)
+    first = next(frames)
+    scale = min(job.panel_size[0] / first.shape[1], job.panel_size[1] / first.shape[0])
+    # Sized in source pixels so the label ends up ~28px tall after ffmpeg scales the panel.
+    overlay = LabelOverlay(label, font_size=round(28 / scale), margin=round(10 / scale))
+    yield overlay.apply(first)
+    for frame in frames:
+        yield overlay.apply(frame)
+
+
+def record_evolution(job: EvolutionJob) -> str:
+    """Streams every stage of one env straight into a single labelled evolution video."""
+    os.makedirs(os.path.dirname(job.out_path) or ".", exist_ok=True)
+    envs = [(label, *make_recording_env(job.config, model_path, job.video_size)) for label, model_path in job.stages]
+    sink = None
+    try:
+        if job.layout == "sequence":
+            for label, env, model in envs:
+                for frame in _labelled_frames(env, model, label, job):
+                    if sink is None:
+                        sink = FFmpegFrameSink(job.out_path, (frame.shape[1], frame.shape[0]), recording_fps(env, job.frame_skip),
+                                               crf=job.crf, output_size=job.panel_size)
+                    sink.write(frame)
+        else:
+            # Side-by-side: step every stage in lockstep; finished stages hold their last frame.
+            n_panels = len(envs)
+            output_size = (job.panel_size[0] * n_panels, job.panel_size[1])
+            streams = [_labelled_frames(env, model, label, job) for label, env, model in envs]
+            current: List[Optional[np.ndarray]] = [None] * n_panels
+            active = [True] * n_panels
+            while any(active):
+                for i, stream in enumerate(streams):
+                    if active[i]:
+                        try:
+                            current[i] = next(stream)
+                        except StopIteration:
+                            active[i] = False
+                if not any(active):
+                    break
+                frame = np.hstack(current)
+                if sink is None:
+                    sink = FFmpegFrameSink(job.out_path, (frame.shape[1], frame.shape[0]), recording_fps(envs[0][1], job.frame_skip),
+                                           crf=job.crf, output_size=output_size)
+                sink.write(frame)
+    finally:
+        if sink is not None:
+            sink.close()
+        for _, env, _ in envs:
+            env.close()
+
+    print(f"Evolution video saved to {job.out_path}")
+    return job.out_path
+
+
+def build_stage_jobs(config: Dict[str, Any], frame_skip: int = 1, video_size: Optional[Tuple[int, int]] = None) -> List[RecordingJob]:
+    env_name = config['env_id']
+    video_folder = f"logs/videos/{env_name}"
+    jobs = []
+    for prefix, stage, _ in STAGES:
+        model_path = os.path.join(model_dir(config), f"{stage}_{env_name}_model.zip")
+        if os.path.exists(model_path):
+            jobs.append(RecordingJob(config, prefix, video_folder, model_path, frame_skip, video_size))
+        elif stage == "untrained":
+            print(f"   {model_path} not found! Using random.")
+            jobs.append(RecordingJob(config, f"{prefix}_random", video_folder, None, frame_skip, video_size))
+        else:
+            print(f"   {model_path} not found, skipping {stage}.")
+    return jobs
+
+
+def build_evolution_job(config: Dict[str, Any], layout: str = "sequence", outdir: str = "assets/videos",
+                        frame_skip: int = 1, video_size: Optional[Tuple[int, int]] = None) -> EvolutionJob:
+    env_name = config['env_id']
+    stages = []
+    for _, stage, label in STAGES:
+        model_path = os.path.join(model_dir(config), f"{stage}_{env_name}_model.zip")
+        if os.path.exists(model_path):
+            stages.append((label, model_path))
+        elif stage == "untrained":
+            print(f"   {model_path} not found! Using random.")
+            stages.append((label, None))
+        else:
+            print(f"   {model_path} not found, skipping {stage}.")
+    out_path = os.path.join(outdir, f"{env_name}_evolution.mp4")
+    return EvolutionJob(config, out_path, tuple(stages), layout, frame_skip, video_size)
+
+
+def _run_job(job) -> str:
+    return record_evolution(job) if isinstance(job, EvolutionJob) else record_job(job)
+
+
+def record_jobs_parallel(jobs: List[Any], max_workers: Optional[int] = None) -> List[str]:
+    max_workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    paths = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                paths.append(future.result())
+            except Exception as e:
+                print(f"   Recording {job.config['env_id']} failed: {e}")
+    return paths
@@ -1,21 +1,43 @@
 import gymnasium as gym
-from typing import Dict, Any
+from gymnasium import spaces
+from typing import Dict, Any, Optional
+
+from src.wrappers.reset_pool import DEFAULT_POOL_SIZE, ResetPool, random_seed, seed_after
 
 class HighwayConfigWrapper(gym.Wrapper):
-   
 
-    def __init__(self, env: gym.Env, config_params: Dict[str, Any]):
+
+    def __init__(self, env: gym.Env, config_params: Dict[str, Any], reset_pool: Optional[Dict[str, Any]] = None):
         super().__init__(env)
         self.config_params = config_params
         self._apply_config()
+        self.reset_pool: Optional[ResetPool] = None
+        if reset_pool and reset_pool.get('enabled', False):
+            self.reset_pool = ResetPool(env, size=reset_pool.get('size', DEFAULT_POOL_SIZE))
 
     def _apply_config(self):
-        
+
         self.env.unwrapped.configure(self.config_params)
-        self.env.reset()
+        # The spaces only depend on the config, so the scene is not built here; goal observations
+        # (parking) need a scene to know their shape and still get a full reset.
+        self.env.unwrapped.define_spaces()
+        if type(self.env.unwrapped.observation_space) is spaces.Space:
+            self.env.reset()
         self.observation_space = self.env.observation_space
         self.action_space = self.env.action_space
 
     def reset(self, **kwargs):
-        
-        return self.env.reset(**kwargs)
\ No newline at end of file
+        if self.reset_pool is None or kwargs.get('options'):
+            return self.env.reset(**kwargs)
+        seed = kwargs.get('seed')
+        if self.reset_pool.started and (seed is None or seed == self.reset_pool.peek_seed()):
+            return self.reset_pool.restore(self.env)
+        # Other seeded (and first) resets go through every wrapper as usual; the pool continues the seed sequence.
+        seed = random_seed() if seed is None else seed
+        self.reset_pool.start(seed_after(seed))
+        return self.env.reset(seed=seed)
+
+    def close(self):
+        if self.reset_pool is not None:
+            self.reset_pool.close()
+        super().close()
@@ -0,0 +1,133 @@
+import copy
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import gymnasium as gym
+import numpy as np
+
+# AbstractEnv.__deepcopy__ leaves these out; the live env keeps its own.
+_UNCOPIED = ("viewer", "_record_video_wrapper")
+
+DEFAULT_POOL_SIZE = 32
+
+
+class ResetPool:
+    """Freshly reset highway-env scenes, built ahead of time on a background thread.
+
+    Scene ``k`` comes from resetting a private copy of the env with the ``k``-th ``seed_after`` of
+    the base seed (scenes whose ego vehicle already crashed are skipped), so the sequence of initial states only depends on
+    the base seed and never on thread timing. ``restore`` moves the next scene into the live env
+    and the builder refills the pool while the env is stepped. In a vec env worker the builder
+    mostly runs while the worker waits for the learner.
+    """
+
+    def __init__(self, env: gym.Env, size: int = DEFAULT_POOL_SIZE):
+        self.size = size
+        self._builder = copy.deepcopy(env.unwrapped)
+        self._scenes: Deque[Tuple[int, Any, Any, Dict[str, Any]]] = deque()
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._next_seed: Optional[int] = None
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self.restores = 0
+        self.skipped = 0
+        self.wait_time = 0.0
+
+    def start(self, seed: int) -> None:
+        """(Re)starts the scene sequence at ``seed``; queued scenes of an older sequence are dropped."""
+        with self._cond:
+            self._generation += 1
+            self._scenes.clear()
+            self._next_seed = seed
+            self._cond.notify_all()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._fill, name="reset-pool", daemon=True)
+            self._thread.start()
+
+    @property
+    def started(self) -> bool:
+        return self._next_seed is not None
+
+    def peek_seed(self) -> int:
+        """Seed of the scene the next ``restore`` returns (waits for one to be built)."""
+        with self._cond:
+            while not self._scenes:
+                self._cond.wait()
+            return self._scenes[0][0]
+
+    def _build(self, seed: int) -> Optional[Tuple[int, Any, Any, Dict[str, Any]]]:
+        # The first observation is part of the scene: for occupancy grids it costs as much as the reset.
+        obs, info = self._builder.reset(seed=seed)
+        vehicle = self._builder.vehicle
+        if vehicle is not None and vehicle.crashed:
+            return None
+        return (seed, *copy.deepcopy((self._builder, obs, info)))
+
+    def _fill(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and len(self._scenes) >= self.size:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                generation, seed = self._generation, self._next_seed
+                self._next_seed = seed_after(seed)
+            scene = self._build(seed)
+            with self._cond:
+                if generation != self._generation:
+                    continue
+                if scene is None:
+                    self.skipped += 1
+                    continue
+                self._scenes.append(scene)
+                self._cond.notify_all()
+
+    def restore(self, env: gym.Env) -> Tuple[Any, Dict[str, Any]]:
+        """``env.reset()`` with the next pooled scene moved into the env instead of building one."""
+        start = time.perf_counter()
+        with self._cond:
+            while not self._scenes:
+                self._cond.wait()
+            _, scene, obs, info = self._scenes.popleft()
+            self._cond.notify_all()
+        self.wait_time += time.perf_counter() - start
+        self.restores += 1
+
+        unwrapped = env.unwrapped
+
+        def restore_scene(**kwargs) -> Tuple[Any, Dict[str, Any]]:
+            unwrapped.__dict__.update({k: v for k, v in vars(scene).items() if k not in _UNCOPIED})
+            # Observation and action types hold a reference to their env: rebind them to the live one.
+            unwrapped.define_spaces()
+            return obs, info
+
+        # Shadow the env's reset for this one call, so wrappers in between (Monitor, OrderEnforcing)
+        # still see a regular reset.
+        unwrapped.reset = restore_scene
+        try:
+            return env.reset()
+        finally:
+            del unwrapped.reset
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def random_seed() -> int:
+    return int(np.random.SeedSequence().entropy % (2 ** 31))
+
+
+def seed_after(seed: int) -> int:
+    """Deterministic successor of a reset seed.
+
+    Not ``seed + 1``: vec env workers are seeded with ``seed + rank``, so consecutive sequences
+    would replay each other's episodes one reset apart.
+    """
+    return int(np.random.SeedSequence(seed).generate_state(1)[0] >> 1)
@@ -0,0 +1,137 @@
+import os
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import gymnasium as gym
+import numpy as np
+
+from src.utils.evaluation import episode_outcome
+from src.wrappers.reset_pool import random_seed, seed_after
+
+# Bumped whenever the chunk layout changes.
+RECORDING_VERSION = 1
+DEFAULT_CHUNK_STEPS = 20_000
+
+# Per-vehicle kinematics columns of the ``ego`` and ``others`` arrays.
+KINEMATICS = ("x", "y", "speed", "heading")
+
+
+def _kinematics(vehicle: Any) -> List[float]:
+    return [vehicle.position[0], vehicle.position[1], vehicle.speed, vehicle.heading]
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    """Streams every finished episode into chunked, columnar ``.npz`` files.
+
+    Per step: action, reward, terminated/truncated, ego crash flag, ego kinematics and the
+    kinematics of every other vehicle (ragged, indexed by ``others_offset``). Per episode: seed,
+    length, return, crash and success. Unseeded resets draw the next seed of the recorder's own
+    ``seed_after`` sequence (the one the reset pool follows, so pooled scenes are still used), and
+    any episode can be re-simulated exactly from its seed and actions (see
+    ``src.utils.trajectory_log``). Only finished episodes are written; a chunk is closed at the
+    first episode end after ``chunk_steps`` steps and on ``close``.
+    """
+
+    def __init__(self, env: gym.Env, directory: str, chunk_steps: int = DEFAULT_CHUNK_STEPS, seed: Optional[int] = None):
+        super().__init__(env)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_steps = chunk_steps
+        # Several recorders write into one directory (one per vec env worker).
+        self.stream = uuid.uuid4().hex[:8]
+        self._next_seed = random_seed() if seed is None else seed
+        self._seed: Optional[int] = None
+        self._chunk_index = 0
+        self._episode_index = 0
+        self._current: Dict[str, List[Any]] = defaultdict(list)
+        self._steps: Dict[str, List[Any]] = defaultdict(list)
+        self._episodes: Dict[str, List[Any]] = defaultdict(list)
+        self._buffered_steps = 0
+
+    def reset(self, *, seed: Optional[int] = None, options: Optional[Dict[str, Any]] = None):
+        if seed is None:
+            seed = self._next_seed
+        self._next_seed = seed_after(seed)
+        self._seed = seed
+        # An episode cut short by an early reset is dropped.
+        self._current.clear()
+        return self.env.reset(seed=seed, options=options)
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        unwrapped = self.env.unwrapped
+        ego = unwrapped.vehicle
+        others = [_kinematics(v) for v in unwrapped.road.vehicles if v is not ego]
+
+        current = self._current
+        current["action"].append(np.asarray(action))
+        current["reward"].append(reward)
+        current["terminated"].append(terminated)
+        current["truncated"].append(truncated)
+        current["crashed"].append(ego.crashed)
+        current["ego"].append(_kinematics(ego))
+        current["others"].append(np.asarray(others, dtype=np.float32).reshape(-1, len(KINEMATICS)))
+
+        if terminated or truncated:
+            self._finish_episode(info)
+        return obs, reward, terminated, truncated, info
+
+    def _finish_episode(self, info: Dict[str, Any]) -> None:
+        current = self._current
+        crashed, success = episode_outcome(info)
+        episodes = self._episodes
+        episodes["index"].append(self._episode_index)
+        episodes["seed"].append(self._seed)
+        episodes["start"].append(self._buffered_steps)
+        episodes["length"].append(len(current["reward"]))
+        episodes["return"].append(float(np.sum(current["reward"])))
+        episodes["crashed"].append(crashed)
+        episodes["success"].append(success)
+        self._episode_index += 1
+
+        for key, values in current.items():
+            self._steps[key].extend(values)
+        self._buffered_steps += len(current["reward"])
+        current.clear()
+        if self._buffered_steps >= self.chunk_steps:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._episodes:
+            return
+        steps, episodes = self._steps, self._episodes
+        others_counts = [len(o) for o in steps["others"]]
+        arrays = {
+            "version": np.array(RECORDING_VERSION),
+            "action": np.stack(steps["action"]),
+            "reward": np.asarray(steps["reward"], dtype=np.float32),
+            "terminated": np.asarray(steps["terminated"], dtype=bool),
+            "truncated": np.asarray(steps["truncated"], dtype=bool),
+            "crashed": np.asarray(steps["crashed"], dtype=bool),
+            "ego": np.asarray(steps["ego"], dtype=np.float32),
+            "others": np.concatenate(steps["others"]),
+            "others_offset": np.concatenate([[0], np.cumsum(others_counts)]).astype(np.int64),
+            "episode_index": np.asarray(episodes["index"], dtype=np.int64),
+            "episode_seed": np.asarray(episodes["seed"], dtype=np.int64),
+            "episode_start": np.asarray(episodes["start"], dtype=np.int64),
+            "episode_length": np.asarray(episodes["length"], dtype=np.int64),
+            "episode_return": np.asarray(episodes["return"], dtype=np.float64),
+            "episode_crashed": np.asarray(episodes["crashed"], dtype=bool),
+            "episode_success": np.asarray(episodes["success"], dtype=bool),
+        }
+        path = os.path.join(self.directory, f"{self.stream}-{self._chunk_index:05d}.npz")
+        # Readers only ever see complete chunks.
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+        self._chunk_index += 1
+        self._steps = defaultdict(list)
+        self._episodes = defaultdict(list)
+        self._buffered_steps = 0
+
+    def close(self):
+        self.flush()
+        super().close()
@@ -0,0 +1,42 @@
+import threading
+
+import numpy as np
+import pytest
+from gymnasium import spaces
+
+from src.utils.inference_server import MicroBatcher, PolicyClient, _PolicyHandler, _TCPServer
+
+
+class _FlakyModel:
+    observation_space = spaces.Box(-1.0, 1.0, shape=(3,), dtype=np.float32)
+    action_space = spaces.Discrete(2)
+
+    def __init__(self):
+        self.fail_next = True
+
+    def predict(self, obs, deterministic=True):
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("boom")
+        return np.zeros(len(obs), dtype=np.int64), None
+
+
+@pytest.fixture
+def client():
+    batcher = MicroBatcher(_FlakyModel(), batch_window_s=0.001)
+    server = _TCPServer(("127.0.0.1", 0), _PolicyHandler)
+    server.batcher = batcher
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    with PolicyClient(f"tcp:{host}:{port}", timeout=5.0) as policy_client:
+        yield policy_client
+    server.shutdown()
+    server.server_close()
+    batcher.close()
+
+
+def test_failed_predict_returns_error_and_server_keeps_serving(client):
+    with pytest.raises(RuntimeError, match="boom"):
+        client.predict(np.zeros(3))
+    assert client.predict(np.zeros(3)).tolist() == 0